@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Customer
+
+User = get_user_model()
+
+
+# -------------------
+# Account state (revocation check)
+# -------------------
+def cache_is_shared():
+    """Whether the default cache is seen by every process (not LocMemCache / DummyCache)."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def user_state_key(user_id):
+    return f'auth_user_state:{user_id}'
+
+
+def get_user_state(user_id):
+    """
+    ``(is_active, role)`` for a user, from the cache or one narrow query.
+    Returns None when the user no longer exists. Without a shared cache a
+    change made through another process would go unseen, so the state is
+    then read from the database on every call.
+    """
+    shared = cache_is_shared()
+    key = user_state_key(user_id)
+    state = cache.get(key) if shared else None
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('is_active', 'role').first()
+        if row is None:
+            return None
+        state = tuple(row)
+        if shared:
+            cache.set(key, state, settings.JWT_USER_STATE_TTL)
+    return state
+
+
+def forget_user_state(user_id):
+    cache.delete(user_state_key(user_id))
+
+
+# -------------------
+# Claims-backed user
+# -------------------
+class ClaimsUser:
+    """
+    Authenticated user built from a verified access token. ``id``, ``role``
+    and ``customer_id`` come from the token and the cached account state;
+    anything else (username, email, ...) loads the full User row on first
+    access, so views that never read it never query it.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, user_id, role, customer_id=None):
+        self.id = self.pk = user_id
+        self.role = role
+        self._customer_id = customer_id
+        self._user = None
+        self._customer = None
+
+    def __str__(self):
+        return str(self.user)
+
+    def __eq__(self, other):
+        if isinstance(other, (ClaimsUser, User)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    @property
+    def user(self):
+        """The full User row, loaded once."""
+        if self._user is None:
+            self._user = User.objects.get(pk=self.id)
+        return self._user
+
+    @property
+    def customer_id(self):
+        if self._customer_id is None and self.role == 'CUSTOMER':
+            self._customer_id = Customer.objects.filter(user_id=self.id).values_list('id', flat=True).first()
+        return self._customer_id
+
+    @property
+    def customer(self):
+        """The Customer row, loaded once."""
+        if self._customer is None:
+            if self._user is not None or self.customer_id is None:
+                self._customer = self.user.customer
+            else:
+                self._customer = Customer.objects.get(pk=self.customer_id)
+        return self._customer
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set above
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User query.
+
+    The token's signature and expiry are verified as usual; the account's
+    current ``is_active`` and ``role`` are then read from the shared cache
+    (dropped by the User signals in core/signals.py on every save), or from
+    the database when the cache is per process, so a suspended account is
+    refused on its next request instead of when its token expires.
+    Tokens issued before the ``role`` claim existed use the regular lookup.
+    """
+
+    def get_user(self, validated_token):
+        if 'role' not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            # simplejwt stores the id as a string
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, role = state
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        return ClaimsUser(user_id, role, validated_token.get('customer_id'))
@@ -0,0 +1,46 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+# -------------------
+# Login backend
+# -------------------
+class LoginBackend(ModelBackend):
+    """
+    ModelBackend for the token login: one query loads the user together with
+    their customer profile (read by MyTokenObtainPairSerializer.get_token),
+    and a suspended account with the right password is returned as is so the
+    caller can report the suspension from the same row. Anything that logs in
+    through this backend must therefore check ``user.is_active`` itself, as
+    the token serializer and Django's AuthenticationForm do.
+
+    ``check_password`` rehashes the password when the configured hasher or
+    its work factor changed (see core/hashers.py).
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        user = (
+            UserModel._default_manager
+            .select_related('customer')
+            .filter(**{UserModel.USERNAME_FIELD: username})
+            .first()
+        )
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        return await sync_to_async(self.authenticate)(request, username, password, **kwargs)
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Service
+
+CATALOG_VERSION_KEY = 'service_catalog_version'
+
+
+# -------------------
+# Versioned service catalog
+# -------------------
+class ServiceCatalog:
+    """
+    Serialized service catalog kept in process memory, tagged with a version
+    stamp that lives in the Django cache.
+
+    The stamp is derived from the table itself (row count and newest
+    updated_at), so every process computes the same value without
+    coordinating. Saving or deleting a Service drops the stamp from the
+    shared cache once the transaction commits (see core/signals.py); the
+    next request recomputes it, sees a new version and rebuilds its local
+    copy. With a per-process cache (no REDIS_URL) other workers pick the
+    change up only when their own stamp is dropped or expires, so
+    multi-process deployments should share the cache.
+
+    The stamp is stored with cache.add() and expires after
+    SERVICE_CATALOG_VERSION_TTL seconds: a request that read the table just
+    before a change can not overwrite the stamp the change produced, and a
+    stale stamp (or a lost invalidation) lasts at most that long.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._entries = {}
+
+    def version(self):
+        """Return ``{'etag', 'last_modified'}`` for the current catalog."""
+        stamp = cache.get(CATALOG_VERSION_KEY)
+        if stamp is None:
+            state = Service.objects.aggregate(count=Count('id'), last=Max('updated_at'))
+            last_modified = int(state['last'].timestamp()) if state['last'] else 0
+            digest = hashlib.sha256(f"{state['count']}:{state['last']}".encode('UTF-8')).hexdigest()
+            stamp = {'etag': f'"{digest[:32]}"', 'last_modified': last_modified}
+            if not cache.add(CATALOG_VERSION_KEY, stamp, settings.SERVICE_CATALOG_VERSION_TTL):
+                # Another request stored a stamp first; serve the shared one
+                stamp = cache.get(CATALOG_VERSION_KEY, stamp)
+        return stamp
+
+    def invalidate(self):
+        cache.delete(CATALOG_VERSION_KEY)
+
+    def get(self, stamp, key, build):
+        """Return the entry ``key`` for this catalog version, building it on a miss."""
+        with self._lock:
+            if self._version != stamp['etag']:
+                self._version = stamp['etag']
+                self._entries = {}
+            entries = self._entries
+        if key not in entries:
+            entries[key] = build()
+        return entries[key]
+
+    def respond(self, request, stamp, build_response):
+        """304 when the client's ETag / Last-Modified still match, else the built response."""
+        response = get_conditional_response(
+            request, etag=stamp['etag'], last_modified=stamp['last_modified'],
+        )
+        if response is None:
+            response = build_response()
+        response['ETag'] = stamp['etag']
+        response['Last-Modified'] = http_date(stamp['last_modified'])
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+service_catalog = ServiceCatalog()
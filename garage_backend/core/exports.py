@@ -0,0 +1,148 @@
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# (column, values() path), in output order
+BOOKING_EXPORT_COLUMNS = (
+    ('booking_id', 'id'),
+    ('booking_date', 'booking_date'),
+    ('status', 'status'),
+    ('preferred_date', 'preferred_date'),
+    ('scheduled_date', 'scheduled_date'),
+    ('customer_id', 'customer_id'),
+    ('customer_username', 'customer__user__username'),
+    ('customer_first_name', 'customer__user__first_name'),
+    ('customer_last_name', 'customer__user__last_name'),
+    ('customer_email', 'customer__user__email'),
+    ('customer_phone', 'customer__phone'),
+    ('vehicle_id', 'vehicle_id'),
+    ('vehicle_number', 'vehicle__vehicle_number'),
+    ('vehicle_type', 'vehicle__vehicle_type'),
+    ('service_id', 'service_id'),
+    ('service_name', 'service__service_name'),
+    ('service_price', 'service__price'),
+    ('invoice_id', 'invoice__id'),
+    ('invoice_total_amount', 'invoice__total_amount'),
+    ('invoice_payment_status', 'invoice__payment_status'),
+)
+
+INVOICE_EXPORT_COLUMNS = (
+    ('invoice_id', 'id'),
+    ('invoice_date', 'invoice_date'),
+    ('payment_status', 'payment_status'),
+    ('service_price', 'booking__service__price'),
+    ('additional_charges', 'additional_charges'),
+    ('additional_charges_description', 'additional_charges_description'),
+    ('total_amount', 'total_amount'),
+    ('booking_id', 'booking_id'),
+    ('booking_status', 'booking__status'),
+    ('scheduled_date', 'booking__scheduled_date'),
+    ('customer_id', 'booking__customer_id'),
+    ('customer_username', 'booking__customer__user__username'),
+    ('customer_first_name', 'booking__customer__user__first_name'),
+    ('customer_last_name', 'booking__customer__user__last_name'),
+    ('customer_email', 'booking__customer__user__email'),
+    ('customer_phone', 'booking__customer__phone'),
+    ('vehicle_number', 'booking__vehicle__vehicle_number'),
+    ('vehicle_type', 'booking__vehicle__vehicle_type'),
+    ('service_id', 'booking__service_id'),
+    ('service_name', 'booking__service__service_name'),
+)
+
+
+# -------------------
+# Streaming exports
+# -------------------
+def iter_keyset(queryset, chunk_size=None, pk=attrgetter('pk')):
+    """
+    Yield the rows of ``queryset`` in primary key order, one chunk of
+    ``chunk_size`` rows per query (``pk > last pk ... LIMIT``); ``pk`` reads
+    the primary key from a row. QuerySet.iterator() would send a single
+    query, and the MySQL client library holds its whole result in memory;
+    keyset chunks keep memory at one chunk however long the history is.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(pk__gt=last))[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last = pk(chunk[-1])
+
+
+def iter_export_rows(queryset, columns, chunk_size=None):
+    """Yield the ``columns`` of every row as a tuple, in primary key order (see iter_keyset)."""
+    rows = queryset.values_list('pk', *(path for _, path in columns))
+    for row in iter_keyset(rows, chunk_size, pk=itemgetter(0)):
+        yield row[1:]
+
+
+def _text(value):
+    # Dates as ISO 8601 (datetimes in the local time zone), amounts as exact strings
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, columns, batch_size=None):
+    """CSV text with a header row, yielded ``batch_size`` rows at a time."""
+    batch_size = batch_size or settings.EXPORT_CHUNK_SIZE
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in columns])
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(['' if value is None else _text(value) for value in row]))
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_jsonl(rows, columns, batch_size=None):
+    """One JSON object per line, yielded ``batch_size`` rows at a time."""
+    batch_size = batch_size or settings.EXPORT_CHUNK_SIZE
+    names = [name for name, _ in columns]
+    batch = []
+    for row in rows:
+        record = dict(zip(names, (_text(value) for value in row)))
+        batch.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def export_response(queryset, columns, file_format, name):
+    """Stream ``queryset`` as a ``<name>_<today>.csv`` / ``.jsonl`` attachment."""
+    rows = iter_export_rows(queryset, columns)
+    stream = stream_csv if file_format == 'csv' else stream_jsonl
+    response = StreamingHttpResponse(
+        stream(rows, columns),
+        content_type=f'{EXPORT_FORMATS[file_format]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}_{timezone.localdate():%Y%m%d}.{file_format}"'
+    )
+    return response
@@ -0,0 +1,63 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+#-------------------
+# Query parameter -> ORM lookup filtering
+#-------------------
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Filters the queryset from a ``filter_lookups`` mapping declared on the view,
+    e.g. ``{'status': 'status__in', 'preferred_date_from': 'preferred_date__gte'}``.
+
+    ``__in`` lookups accept comma separated values and ``true``/``false`` are
+    accepted for boolean fields. Bad values are reported as a 400.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = getattr(view, 'filter_lookups', {})
+
+        for param, lookup in lookups.items():
+            value = request.query_params.get(param)
+            if value is None or value == '':
+                continue
+
+            if lookup.endswith('__in'):
+                value = [item.strip() for item in value.split(',') if item.strip()]
+            elif value.lower() in ('true', 'false'):
+                value = value.lower() == 'true'
+
+            try:
+                queryset = queryset.filter(**{lookup: value})
+            except (ValueError, DjangoValidationError):
+                raise serializers.ValidationError({param: f'Invalid value: {request.query_params[param]}'})
+
+        return queryset
+
+
+#-------------------
+# Ordering only when requested
+#-------------------
+class RequestedOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that leaves the queryset untouched unless ``?ordering=`` is
+    sent, so unpaginated lists keep their current order. Without a requested
+    ordering the pagination class key is used, and an ``id`` tie-breaker is
+    appended so the order is stable for cursor pagination.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            pagination_class = getattr(view, 'pagination_class', None)
+            return getattr(pagination_class, 'ordering', None)
+
+        ordering = list(ordering)
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        if self.ordering_param not in request.query_params:
+            return queryset
+        return super().filter_queryset(request, queryset, view)
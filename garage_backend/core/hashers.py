@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+
+
+# -------------------
+# Tunable password hashing
+# -------------------
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with the iteration count taken from
+    PASSWORD_PBKDF2_ITERATIONS (Django's own default when unset).
+
+    It keeps the ``pbkdf2_sha256`` algorithm name, so existing hashes verify
+    unchanged; a hash with a different iteration count is rewritten with the
+    configured one on the user's next successful login.
+    """
+
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', None) or PBKDF2PasswordHasher.iterations
+
+
+def make_passwords(passwords):
+    """make_password() for a batch; run in a process pool by core.imports."""
+    return [make_password(password) for password in passwords]
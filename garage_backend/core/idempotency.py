@@ -0,0 +1,120 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+IN_FLIGHT = 'in_flight'
+
+
+# -------------------
+# Idempotency-Key handling
+# -------------------
+def _store():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def _cache_key(request, key):
+    # Keys are scoped to the user and endpoint, so two clients can not collide
+    scope = f'{request.user.pk}:{request.method}:{request.path}:{key}'
+    return 'idempotency:' + hashlib.sha256(scope.encode('UTF-8')).hexdigest()
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('UTF-8')).hexdigest()
+
+
+def _replay(entry, fingerprint):
+    if entry['fingerprint'] != fingerprint:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if entry['state'] == IN_FLIGHT:
+        return Response(
+            {'error': f'A request with this {IDEMPOTENCY_HEADER} is still being processed'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(entry['data'], status=entry['status_code'], headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(view_method):
+    """
+    Honour an ``Idempotency-Key`` header on a POST view method.
+
+    The first request with a key runs normally and, if it succeeded, its
+    response is kept in the IDEMPOTENCY_CACHE_ALIAS cache for
+    IDEMPOTENCY_KEY_TTL seconds; retries with the same key and body get that
+    response back without running the view again. Failed requests changed
+    nothing, so they release the key and a corrected retry runs for real.
+    Reusing a stored key for a different body is a 422 and a retry that
+    overtakes the original is a 409. Requests without the header, or from
+    anonymous users, are not affected.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        store = _store()
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+
+        # add() is atomic, so only one of several concurrent retries gets to run the view
+        marker = {'fingerprint': fingerprint, 'state': IN_FLIGHT}
+        if not store.add(cache_key, marker, settings.IDEMPOTENCY_IN_FLIGHT_TTL):
+            entry = store.get(cache_key)
+            if entry is not None:
+                return _replay(entry, fingerprint)
+            # Expired between add() and get(); claim it now
+            store.set(cache_key, marker, settings.IDEMPOTENCY_IN_FLIGHT_TTL)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            store.delete(cache_key)
+            raise
+
+        if not status.is_success(response.status_code) or not isinstance(response, Response):
+            store.delete(cache_key)
+            return response
+
+        store.set(
+            cache_key,
+            {
+                'fingerprint': fingerprint,
+                'state': 'done',
+                'status_code': response.status_code,
+                'data': response.data,
+            },
+            settings.IDEMPOTENCY_KEY_TTL,
+        )
+        return response
+
+    return wrapper
+
+
+class IdempotentCreateMixin:
+    """Honours ``Idempotency-Key`` on the create action of a generic view."""
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
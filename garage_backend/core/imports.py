@@ -0,0 +1,322 @@
+import csv
+import json
+import os
+from concurrent import futures
+from contextlib import contextmanager
+from itertools import islice
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .hashers import make_passwords
+from .models import Customer, User, Vehicle, normalize_plate
+from .search import search_index
+from .serializers import CustomerImportRowSerializer, VehicleImportRowSerializer
+
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+# -------------------
+# Reading import files
+# -------------------
+def import_format(filename, requested=None):
+    """'csv' or 'jsonl', from the requested format or the file extension."""
+    if requested:
+        if requested not in IMPORT_FORMATS.values():
+            raise ValueError(f'Unsupported format "{requested}", use csv or jsonl')
+        return requested
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError('Unknown file type, use a .csv or .jsonl file or pass the format')
+    return IMPORT_FORMATS[extension]
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(line, data, error)`` for each record of a CSV (with a header row)
+    or JSON Lines text stream, one record at a time. Empty values are
+    dropped, so they count as missing.
+    """
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                data = {
+                    key.strip(): value.strip()
+                    for key, value in row.items()
+                    if key and isinstance(value, str) and value.strip()
+                }
+                yield reader.line_num, data, None
+        else:
+            for line, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    yield line, None, 'Invalid JSON'
+                    continue
+                if not isinstance(data, dict):
+                    yield line, None, 'Each line must be a JSON object'
+                    continue
+                yield line, {key: value for key, value in data.items() if value not in ('', None)}, None
+    except (UnicodeDecodeError, csv.Error) as e:
+        # The rest of the file can not be read
+        yield None, None, f'Could not read the file: {e}'
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# -------------------
+# Bulk importers
+# -------------------
+class BulkImporter:
+    """
+    Validates and inserts rows chunk by chunk, so memory stays flat however
+    long the file is. Subclasses implement ``import_chunk``; every rejected
+    row is recorded in the report with its line number and errors.
+    """
+
+    def __init__(self, dry_run=False, chunk_size=None):
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.report = {'dry_run': dry_run, 'rows': 0, 'created': 0, 'failed': 0, 'errors': []}
+
+    def fail(self, line, errors):
+        self.report['failed'] += 1
+        self.report['errors'].append({'line': line, 'errors': errors})
+
+    def run(self, rows):
+        for chunk in chunked(rows, self.chunk_size):
+            self.report['rows'] += len(chunk)
+            valid = []
+            for line, data, error in chunk:
+                if error:
+                    self.fail(line, {'non_field_errors': [error]})
+                else:
+                    valid.append((line, data))
+            if valid:
+                self.import_chunk(valid)
+        # Rows fail at different stages of a chunk; report them in file order
+        self.report['errors'].sort(key=lambda error: (error['line'] is None, error['line'] or 0))
+        if self.report['created'] and not self.dry_run:
+            # bulk_create sends no signals: rebuild the quick search index
+            search_index.invalidate()
+        return self.report
+
+    def import_chunk(self, rows):
+        raise NotImplementedError
+
+    def insert_rows(self, rows, objects, insert, conflict):
+        """
+        Run ``insert(rows, objects)`` for the whole chunk in one transaction.
+        If a unique index rejects it (a value taken since the chunk was
+        checked), retry row by row so only the conflicting rows fail, each
+        with the ``conflict`` errors.
+        """
+        try:
+            with transaction.atomic():
+                insert(rows, objects)
+        except IntegrityError:
+            for row, obj in zip(rows, objects):
+                obj.pk = None
+                try:
+                    with transaction.atomic():
+                        insert([row], [obj])
+                except IntegrityError:
+                    self.fail(row[0], conflict)
+
+
+class CustomerImporter(BulkImporter):
+    """
+    Creates a User and a Customer per row, like CustomerRegistrationSerializer,
+    with one duplicate check query per chunk, passwords hashed in a process
+    pool (CUSTOMER_IMPORT_HASH_WORKERS, 0 hashes inline) and bulk inserts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._usernames = set()
+        self._emails = set()
+        self._pool = None
+
+    @contextmanager
+    def _hashing_pool(self):
+        workers = settings.CUSTOMER_IMPORT_HASH_WORKERS
+        if self.dry_run or not workers:
+            yield None
+            return
+        # spawn, as for the PDF pool: forking a process with open DB connections is unsafe
+        with futures.ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            yield pool
+
+    def run(self, rows):
+        with self._hashing_pool() as pool:
+            self._pool = pool
+            try:
+                return super().run(rows)
+            finally:
+                self._pool = None
+
+    def _hash(self, passwords):
+        if self._pool is None:
+            return make_passwords(passwords)
+        workers = settings.CUSTOMER_IMPORT_HASH_WORKERS
+        size = -(-len(passwords) // workers)
+        batches = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        return [encoded for batch in self._pool.map(make_passwords, batches) for encoded in batch]
+
+    def import_chunk(self, rows):
+        accepted = []
+        for line, data in rows:
+            serializer = CustomerImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                self.fail(line, serializer.errors)
+                continue
+            attrs = serializer.validated_data
+            errors = {}
+            if attrs['username'] in self._usernames:
+                errors['username'] = ['Duplicate username in this file.']
+            if attrs['email'] in self._emails:
+                errors['email'] = ['Duplicate email in this file.']
+            self._usernames.add(attrs['username'])
+            self._emails.add(attrs['email'])
+            if errors:
+                self.fail(line, errors)
+            else:
+                accepted.append((line, attrs))
+
+        # One query per column for the whole chunk instead of two exists() per row
+        taken_usernames = set(User.objects.filter(
+            username__in=[attrs['username'] for _, attrs in accepted]
+        ).values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(
+            email__in=[attrs['email'] for _, attrs in accepted]
+        ).values_list('email', flat=True))
+
+        new = []
+        for line, attrs in accepted:
+            errors = {}
+            if attrs['username'] in taken_usernames:
+                errors['username'] = ['A user with this username already exists.']
+            if attrs['email'] in taken_emails:
+                errors['email'] = ['A user with this email already exists.']
+            if errors:
+                self.fail(line, errors)
+            else:
+                new.append((line, attrs))
+
+        if not new:
+            return
+        if self.dry_run:
+            self.report['created'] += len(new)
+            return
+
+        passwords = self._hash([attrs['password'] for _, attrs in new])
+        users = [
+            User(
+                username=attrs['username'],
+                password=encoded,
+                first_name=attrs['first_name'],
+                last_name=attrs['last_name'],
+                email=attrs['email'],
+                role='CUSTOMER',
+            )
+            for (_, attrs), encoded in zip(new, passwords)
+        ]
+        # A username can be taken since the check, or differ only by case
+        # under a case-insensitive collation
+        self.insert_rows(new, users, self._insert, {'username': ['A user with this username already exists.']})
+
+    def _insert(self, rows, users):
+        User.objects.bulk_create(users)
+        # MySQL does not return the new ids from a bulk insert
+        ids = dict(User.objects.filter(
+            username__in=[user.username for user in users]
+        ).values_list('username', 'id'))
+        Customer.objects.bulk_create([
+            Customer(user_id=ids[user.username], phone=attrs.get('phone', ''))
+            for (_, attrs), user in zip(rows, users)
+        ])
+        self.report['created'] += len(users)
+
+
+class VehicleImporter(BulkImporter):
+    """
+    Creates vehicles for existing customers: ``customer_id`` per row, or the
+    ``customer_id`` given for the whole file. Plates are compared normalized
+    (normalize_plate) within the file and against existing vehicles with one
+    query per chunk, then inserted with bulk_create.
+    """
+
+    def __init__(self, *args, customer_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.customer_id = customer_id
+        self._plates = set()
+
+    def import_chunk(self, rows):
+        accepted = []
+        for line, data in rows:
+            serializer = VehicleImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                self.fail(line, serializer.errors)
+                continue
+            attrs = dict(serializer.validated_data)
+            attrs['customer_id'] = attrs.get('customer_id', self.customer_id)
+            plate = normalize_plate(attrs['vehicle_number'])
+            errors = {}
+            if attrs['customer_id'] is None:
+                errors['customer_id'] = ['This field is required.']
+            if plate in self._plates:
+                errors['vehicle_number'] = ['Duplicate vehicle number in this file.']
+            self._plates.add(plate)
+            if errors:
+                self.fail(line, errors)
+            else:
+                accepted.append((line, attrs, plate))
+
+        customers = set(Customer.objects.filter(
+            id__in={attrs['customer_id'] for _, attrs, _ in accepted}
+        ).values_list('id', flat=True))
+        taken = set(Vehicle.objects.filter(
+            plate_normalized__in=[plate for _, _, plate in accepted]
+        ).values_list('plate_normalized', flat=True))
+
+        new = []
+        for line, attrs, plate in accepted:
+            errors = {}
+            if attrs['customer_id'] not in customers:
+                errors['customer_id'] = ['Customer not found.']
+            if plate in taken:
+                errors['vehicle_number'] = ['A vehicle with this number already exists.']
+            if errors:
+                self.fail(line, errors)
+            else:
+                new.append((line, attrs))
+
+        if not new:
+            return
+        if self.dry_run:
+            self.report['created'] += len(new)
+            return
+
+        # bulk_create skips Vehicle.save(), so the normalized plate is set here
+        vehicles = [
+            Vehicle(
+                customer_id=attrs['customer_id'],
+                vehicle_number=attrs['vehicle_number'],
+                plate_normalized=normalize_plate(attrs['vehicle_number']),
+                vehicle_type=attrs['vehicle_type'],
+            )
+            for _, attrs in new
+        ]
+        self.insert_rows(new, vehicles, self._insert, {'vehicle_number': ['A vehicle with this number already exists.']})
+
+    def _insert(self, rows, vehicles):
+        Vehicle.objects.bulk_create(vehicles)
+        self.report['created'] += len(vehicles)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Invoice
+from core.pdf import render_payload, render_pdf
+from core.views import INVOICE_RELATED
+
+ENGINES = ('xhtml2pdf', 'reportlab')
+
+
+class Command(BaseCommand):
+    help = 'Render invoices with both PDF engines in this process and report the time per invoice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20, help='Number of invoices to render (newest first)')
+        parser.add_argument('--repeat', type=int, default=3, help='Renders per invoice and engine')
+        parser.add_argument('--invoice', type=int, action='append', help='Render only these invoice ids')
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.select_related(*INVOICE_RELATED).order_by('-id')
+        if options['invoice']:
+            invoices = invoices.filter(id__in=options['invoice'])
+        invoices = list(invoices[:options['count']])
+        if not invoices:
+            raise CommandError('No invoices to render')
+
+        timings = {engine: 0.0 for engine in ENGINES}
+        for invoice in invoices:
+            for engine in ENGINES:
+                # First call warms imports, fonts and the logo; not timed
+                if render_pdf(engine, render_payload(invoice, engine)) is None:
+                    raise CommandError(f'{engine} failed to render invoice {invoice.id}')
+
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    render_pdf(engine, render_payload(invoice, engine))
+                timings[engine] += time.perf_counter() - started
+
+        renders = len(invoices) * options['repeat']
+        for engine in ENGINES:
+            self.stdout.write(f'{engine:>10}: {timings[engine] / renders * 1000:8.1f} ms per invoice')
+        self.stdout.write(f'   speedup: {timings["xhtml2pdf"] / timings["reportlab"]:8.1f}x')
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Booking, Invoice
+from core.readers import get_reader
+from core.serializers import BookingSerializer, InvoiceSerializer
+from core.views import BOOKING_RELATED, INVOICE_RELATED
+
+LISTS = (
+    ('bookings', Booking, BookingSerializer, BOOKING_RELATED),
+    ('invoices', Invoice, InvoiceSerializer, INVOICE_RELATED),
+)
+
+
+class Command(BaseCommand):
+    help = 'Time the booking and invoice lists rendered by the serializers and by the values() reader'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Rows per list')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+
+        for name, model, serializer_class, related in LISTS:
+            queryset = model.objects.order_by('-created_at', '-id')[:options['limit']]
+            reader = get_reader(serializer_class)
+
+            def with_serializer():
+                rows = queryset.select_related(*related)
+                return renderer.render(serializer_class(rows, many=True).data)
+
+            def with_reader():
+                return renderer.render(reader.build_many(reader.values(queryset)))
+
+            timings = {}
+            for label, build in (('serializer', with_serializer), ('values', with_reader)):
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    build()
+                timings[label] = (time.perf_counter() - started) / options['repeat'] * 1000
+
+            self.stdout.write(
+                f'{name} ({queryset.count()} rows): serializer {timings["serializer"]:.1f} ms, '
+                f'values {timings["values"]:.1f} ms, '
+                f'{timings["serializer"] / timings["values"]:.1f}x'
+            )
+
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import User
+from core.serializers import MyTokenObtainPairSerializer
+
+PREFIX = 'login-benchmark-'
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure token login throughput with the configured password hasher. '
+        'Creates throwaway users and deletes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--logins', type=int, default=100, help='Logins in total')
+        parser.add_argument('--threads', type=int, default=4)
+
+    def handle(self, *args, **options):
+        hasher = get_hasher()
+        work = f', {hasher.iterations} iterations' if hasattr(hasher, 'iterations') else ''
+        self.stdout.write(f'Hasher: {hasher.algorithm}{work}')
+
+        # One hash shared by every user keeps the setup fast
+        encoded = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', password=encoded, role='CUSTOMER')
+            for i in range(options['users'])
+        ])
+        try:
+            self._count_queries()
+            self._measure(options['users'], options['logins'], options['threads'])
+        finally:
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _login(self, username):
+        serializer = MyTokenObtainPairSerializer(data={'username': username, 'password': PASSWORD})
+        return serializer.is_valid()
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._login(f'{PREFIX}0')
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.stdout.write(f'Queries per login: {len(queries.captured_queries)} ({len(selects)} SELECT)')
+
+    def _measure(self, users, logins, threads):
+        per_thread = max(logins // threads, 1)
+        barrier = threading.Barrier(threads + 1)
+        failed = []
+
+        def worker(offset):
+            try:
+                barrier.wait()
+                for i in range(per_thread):
+                    if not self._login(f'{PREFIX}{(offset + i) % users}'):
+                        failed.append(i)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+        for thread in pool:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = per_thread * threads
+        self.stdout.write(
+            f'{total} logins on {threads} threads: {total / elapsed:.1f} logins/s, '
+            f'{elapsed / total * threads * 1000:.1f} ms per login'
+        )
+        if failed:
+            self.stdout.write(self.style.ERROR(f'  {len(failed)} logins failed'))
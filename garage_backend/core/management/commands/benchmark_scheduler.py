@@ -0,0 +1,58 @@
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from core.scheduling import Scheduler
+
+DURATIONS = [30, 60, 60, 90, 120, 180, 240]
+
+
+class Command(BaseCommand):
+    help = (
+        'Schedule synthetic pending bookings with the automatic scheduler and '
+        'report the plan quality and time (no database access)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=10_000)
+        parser.add_argument('--days', type=int, default=60)
+        parser.add_argument('--load', type=float, default=0.95, help='Booked minutes / capacity over the window')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        days = options['days']
+        jobs = [
+            # A few bookings are already overdue (preferred day before the window)
+            (i, rng.randrange(-3, days), rng.choice(DURATIONS))
+            for i in range(options['bookings'])
+        ]
+        # Closed one day a week
+        open_days = [day for day in range(days) if day % 7 != 6]
+        total = sum(minutes for _, _, minutes in jobs)
+        capacity = [0] * days
+        for day in open_days:
+            capacity[day] = int(total / options['load'] / len(open_days))
+
+        scheduler = Scheduler(capacity)
+        for job in jobs:
+            scheduler.add(*job)
+        started = time.perf_counter()
+        result = scheduler.run()
+        elapsed = time.perf_counter() - started
+
+        placed = len(result['assignments'])
+        late = Counter(day - max(preferred, 0) > 0 for key, preferred, _ in jobs
+                       if (day := result['assignments'].get(key)) is not None)
+        self.stdout.write(
+            f'{len(jobs)} bookings over {days} days ({capacity[0]} min/day): '
+            f'{placed} scheduled, {len(result["unscheduled"])} unscheduled, {late[True]} late'
+        )
+        self.stdout.write(
+            f'Squared lateness: greedy {result["greedy_cost"]}, improved {result["cost"]} '
+            f'({1 - result["cost"] / max(result["greedy_cost"], 1):.1%} lower)'
+        )
+        self.stdout.write(f'Planned in {elapsed * 1000:.0f} ms')
+
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import PrefixIndex, _compact, _text
+
+FIRST_NAMES = ['John', 'Mary', 'Ravi', 'Anita', 'Kumar', 'Priya', 'David', 'Sara', 'Arun', 'Nisha']
+LAST_NAMES = ['Perera', 'Silva', 'Fernando', 'Smith', 'Jeyakumar', 'Brown', 'Raj', 'Khan']
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the quick search prefix index from synthetic customers and vehicles, '
+        'check its results against a full scan and time the lookups (no database access)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', type=int, default=100_000, help='Customers; as many vehicles again')
+        parser.add_argument('--queries', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        customers, vehicles = self._rows(rng, options['entities'])
+
+        started = time.perf_counter()
+        index = PrefixIndex.build(customers, vehicles)
+        build = time.perf_counter() - started
+        self.stdout.write(
+            f'Built {len(index)} entities / {len(index.entries)} terms in {build * 1000:.0f} ms'
+        )
+
+        terms = [entry[0] for entry in rng.sample(index.entries, min(options['queries'], len(index.entries)))]
+        queries = [term[:rng.randint(2, min(len(term), 8))] for term in terms if len(term) >= 2]
+
+        mismatched = [query for query in queries[:50] if not self._matches(index, query, options['limit'])]
+        if mismatched:
+            raise CommandError(f'Results differ from a full scan for: {mismatched[:5]}')
+
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, options['limit'])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{len(queries)} prefix queries: median {statistics.median(timings):.3f} ms, '
+            f'p99 {timings[int(len(timings) * 0.99) - 1]:.3f} ms, max {timings[-1]:.3f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS('Index results match a full scan'))
+
+    def _rows(self, rng, count):
+        customers, vehicles = [], []
+        for i in range(1, count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            customers.append({
+                'id': i, 'user_id': i, 'user__username': f'{first.lower()}{i}',
+                'user__first_name': first, 'user__last_name': last,
+                'user__email': f'{first.lower()}.{last.lower()}{i}@example.com',
+                'user__is_active': True, 'phone': f'07{rng.randrange(10 ** 8):08d}',
+            })
+            vehicles.append({
+                'id': i, 'customer_id': i, 'vehicle_type': 'car',
+                'vehicle_number': f'{rng.choice("ABCDEFGHKLMNPW")}{rng.choice("ABCDEFGHKLMNPW")}-{i:05d}',
+            })
+        return customers, vehicles
+
+    def _matches(self, index, query, limit):
+        # Every result must match, and a short result list must be complete
+        prefixes = {prefix for prefix in (_text(query), _compact(query)) if prefix}
+        expected = {
+            key for key, terms in index._terms.items()
+            if any(term.startswith(prefix) for term in terms for prefix in prefixes)
+        }
+        found = {(document['type'], document['id']) for document in index.search(query, limit)}
+        return found <= expected and (len(found) == limit or found == expected)
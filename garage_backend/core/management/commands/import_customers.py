@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import CustomerImporter, import_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Create customers from a CSV (header row) or JSON Lines file with the '
+        'registration fields: username, password, email, first_name, last_name, phone'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'jsonl'])
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            file_format = import_format(options['path'], options['file_format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        importer = CustomerImporter(dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            report = importer.run(read_rows(stream, file_format))
+
+        for error in report['errors']:
+            self.stdout.write(self.style.ERROR(f'line {error["line"]}: {error["errors"]}'))
+        verb = 'Would create' if report['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report["created"]} of {report["rows"]} customers, {report["failed"]} rejected'
+        ))
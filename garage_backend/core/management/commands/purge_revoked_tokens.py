@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.revocation import token_revocations
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked refresh tokens that have expired and rebuild the revocation filters'
+
+    def handle(self, *args, **options):
+        deleted = token_revocations.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired revoked tokens'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DailyOccupancy
+from core.services import CapacityService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-date capacity occupancy table from approved, in progress and completed bookings'
+
+    def handle(self, *args, **options):
+        CapacityService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {DailyOccupancy.objects.count()} occupancy rows'))
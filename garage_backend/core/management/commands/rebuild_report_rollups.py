@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DailyBookingStat, DailyRevenueStat
+from core.services import ReportService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily booking and revenue rollup tables from bookings and invoices'
+
+    def handle(self, *args, **options):
+        ReportService.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {DailyBookingStat.objects.count()} booking rows '
+            f'and {DailyRevenueStat.objects.count()} revenue rows'
+        ))
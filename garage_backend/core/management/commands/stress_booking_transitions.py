@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.models import Booking, CapacityOverride, DailyOccupancy, Service, Vehicle
+from core.services import BookingService, CapacityService, ReportService, TransitionConflict
+
+SCHEDULED_DATE = date(2030, 1, 1)
+
+PHASES = (
+    ('approve', lambda booking: BookingService.approve_booking(booking, SCHEDULED_DATE)),
+    ('start', BookingService.start_service),
+    ('complete', BookingService.complete_service),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Race many threads through the same booking transitions and report the '
+        'outcomes and time per phase. Creates throwaway bookings and deletes '
+        'them afterwards; needs a database with row locking (MySQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        vehicle = Vehicle.objects.select_related('customer').first()
+        service = Service.objects.first()
+        if vehicle is None or service is None:
+            raise CommandError('Needs at least one vehicle and one service')
+
+        bookings = []
+        for _ in range(options['bookings']):
+            booking = Booking.objects.create(customer=vehicle.customer, vehicle=vehicle, service=service)
+            ReportService.booking_created(booking)
+            bookings.append(booking)
+        ids = [booking.id for booking in bookings]
+
+        # Give the day room for every throwaway booking; the previous
+        # override (if any) is put back afterwards
+        previous = CapacityOverride.objects.filter(date=SCHEDULED_DATE).first()
+        booked = DailyOccupancy.objects.filter(date=SCHEDULED_DATE).values_list('booked_minutes', flat=True).first()
+        CapacityOverride.objects.update_or_create(date=SCHEDULED_DATE, defaults={
+            'capacity_minutes': (
+                (booked or 0) + service.duration_minutes * len(ids)
+                + (previous.capacity_minutes if previous else CapacityService.default_capacity(SCHEDULED_DATE))
+            ),
+        })
+
+        try:
+            for name, transition in PHASES:
+                started = time.perf_counter()
+                outcome = self._race(ids, transition, options['threads'])
+                elapsed = time.perf_counter() - started
+                results = Counter(result for _, result in outcome)
+                self.stdout.write(f'{name:>8}: {dict(results)} in {elapsed * 1000:.0f} ms')
+
+            statuses = Counter(Booking.objects.filter(pk__in=ids).values_list('status', flat=True))
+            self.stdout.write(f'Final statuses: {dict(statuses)}')
+        finally:
+            queryset = Booking.objects.filter(pk__in=ids)
+            CapacityService.release_bookings(queryset)
+            ReportService.remove_bookings(queryset)
+            queryset.delete()
+            if previous is None:
+                CapacityOverride.objects.filter(date=SCHEDULED_DATE).delete()
+            else:
+                previous.save()
+
+    def _race(self, ids, transition, threads):
+        # Each thread loads its own copy of every booking, then all fire at once
+        barrier = threading.Barrier(threads)
+        outcome = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                bookings = list(Booking.objects.filter(pk__in=ids))
+                barrier.wait()
+                for booking in bookings:
+                    try:
+                        transition(booking)
+                        result = 'ok'
+                    except TransitionConflict:
+                        result = 'conflict'
+                    except ValueError:
+                        result = 'invalid'
+                    with lock:
+                        outcome.append((booking.id, result))
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return outcome
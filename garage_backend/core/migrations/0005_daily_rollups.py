@@ -0,0 +1,77 @@
+# Generated by Django 6.0 on 2026-10-18 15:45
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    # Same totals as ReportService.rebuild(), from the existing rows
+    Booking = apps.get_model('core', 'Booking')
+    Invoice = apps.get_model('core', 'Invoice')
+    DailyBookingStat = apps.get_model('core', 'DailyBookingStat')
+    DailyRevenueStat = apps.get_model('core', 'DailyRevenueStat')
+
+    booking_rows = (
+        Booking.objects.order_by()
+        .annotate(day=TruncDate('booking_date'))
+        .values('day', 'status')
+        .annotate(n=Count('id'))
+    )
+    DailyBookingStat.objects.bulk_create(
+        DailyBookingStat(date=row['day'], status=row['status'], count=row['n'])
+        for row in booking_rows
+    )
+
+    revenue_rows = (
+        Invoice.objects.order_by()
+        .values('invoice_date', 'payment_status')
+        .annotate(n=Count('id'), amount=Sum('total_amount'))
+    )
+    DailyRevenueStat.objects.bulk_create(
+        DailyRevenueStat(
+            date=row['invoice_date'],
+            payment_status=row['payment_status'],
+            invoice_count=row['n'],
+            total_amount=row['amount'],
+        )
+        for row in revenue_rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('CANCELLED', 'Cancelled'), ('IN_PROGRESS', 'In Progress'), ('COMPLETED', 'Completed')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_booking_stat',
+                'constraints': [models.UniqueConstraint(fields=('date', 'status'), name='daily_booking_stat_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRevenueStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_status', models.CharField(choices=[('PENDING', 'Pending'), ('PAID', 'Paid'), ('FAILED', 'Failed')], max_length=20)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'db_table': 'daily_revenue_stat',
+                'constraints': [models.UniqueConstraint(fields=('date', 'payment_status'), name='daily_revenue_stat_unique')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
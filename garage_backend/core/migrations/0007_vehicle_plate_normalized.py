@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+def normalize_plate(value):
+    # Frozen copy of core.models.normalize_plate as of this migration
+    return ''.join(char for char in (value or '').upper() if char.isalnum())
+
+
+def fill_plate_normalized(apps, schema_editor):
+    # The first vehicle with a plate keeps it; later vehicles sharing it stay NULL
+    Vehicle = apps.get_model('core', 'Vehicle')
+    seen = set()
+    batch = []
+    for vehicle in Vehicle.objects.order_by('id').only('id', 'vehicle_number').iterator(chunk_size=2000):
+        plate = normalize_plate(vehicle.vehicle_number)
+        if not plate or plate in seen:
+            continue
+        seen.add(plate)
+        vehicle.plate_normalized = plate
+        batch.append(vehicle)
+        if len(batch) >= 2000:
+            Vehicle.objects.bulk_update(batch, ['plate_normalized'])
+            batch = []
+    Vehicle.objects.bulk_update(batch, ['plate_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='plate_normalized',
+            field=models.CharField(editable=False, max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_plate_normalized, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+HOLDING_STATUSES = ('APPROVED', 'IN_PROGRESS', 'COMPLETED')
+
+
+def fill_occupancy(apps, schema_editor):
+    # Bookings already holding a day count with the default service duration
+    Booking = apps.get_model('core', 'Booking')
+    DailyOccupancy = apps.get_model('core', 'DailyOccupancy')
+    holding = Booking.objects.filter(status__in=HOLDING_STATUSES, scheduled_date__isnull=False)
+    holding.update(reserved_minutes=60)
+    rows = (
+        holding.order_by()
+        .values('scheduled_date')
+        .annotate(minutes=Sum('reserved_minutes'), n=Count('id'))
+    )
+    DailyOccupancy.objects.bulk_create(
+        DailyOccupancy(date=row['scheduled_date'], booked_minutes=row['minutes'], booking_count=row['n'])
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_vehicle_plate_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapacityOverride',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('capacity_minutes', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'capacity_override',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('booking_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_occupancy',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='reserved_minutes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,11 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 
+
+def normalize_plate(value):
+    """Plate as compared for uniqueness and lookup: "ab-12 34" -> "AB1234"."""
+    return ''.join(char for char in (value or '').upper() if char.isalnum())
+
 #User Model
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -13,6 +18,9 @@ class User(AbstractUser):
 
     class Meta:
         db_table = 'user'
+        indexes = [
+            models.Index(fields=['date_joined', 'id'], name='user_joined_id_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -31,6 +39,9 @@ class Customer(models.Model):
 
     class Meta:
         db_table = 'customer'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='customer_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -43,6 +54,9 @@ class Vehicle(models.Model):
         related_name='vehicles'
     )
     vehicle_number = models.CharField(max_length=50)
+    # normalize_plate(vehicle_number), set on save; NULL only for vehicles that
+    # already shared a plate when the column was added
+    plate_normalized = models.CharField(max_length=50, unique=True, null=True, editable=False)
     vehicle_type = models.CharField(max_length=50)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -50,21 +64,47 @@ class Vehicle(models.Model):
 
     class Meta:
         db_table = 'vehicle'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='vehicle_created_id_idx'),
+            models.Index(fields=['customer', 'vehicle_type'], name='vehicle_customer_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.vehicle_number} ({self.vehicle_type})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_vehicle_number = instance.__dict__.get('vehicle_number')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Only recomputed when the number changes, so a legacy duplicate with a
+        # NULL plate_normalized can still be edited otherwise
+        if self._state.adding or self.vehicle_number != getattr(self, '_loaded_vehicle_number', None):
+            self.plate_normalized = normalize_plate(self.vehicle_number) or None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'vehicle_number' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'plate_normalized'}
+        super().save(*args, **kwargs)
+        self._loaded_vehicle_number = self.vehicle_number
+
 #Service Model
 class Service(models.Model):
     service_name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Workshop time a booking of this service takes out of its day's capacity
+    duration_minutes = models.PositiveIntegerField(default=60)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'service'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='service_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.service_name
@@ -104,12 +144,20 @@ class Booking(models.Model):
         choices=STATUS_CHOICES,
         default='PENDING'
     )
+    # Minutes reserved on scheduled_date when approved (the service duration then)
+    reserved_minutes = models.PositiveIntegerField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'booking'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='booking_created_id_idx'),
+            models.Index(fields=['status', 'scheduled_date'], name='booking_status_sched_idx'),
+            models.Index(fields=['status', 'preferred_date'], name='booking_status_pref_idx'),
+            models.Index(fields=['customer', 'status'], name='booking_customer_status_idx'),
+        ]
 
     def __str__(self):
         return f"Booking #{self.id} - {self.status}"
@@ -150,6 +198,94 @@ class Invoice(models.Model):
 
     class Meta:
         db_table = 'invoice'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='invoice_created_id_idx'),
+            models.Index(fields=['payment_status', 'invoice_date'], name='invoice_payment_date_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice #{self.id}"
+
+#Daily Booking Rollup Model
+class DailyBookingStat(models.Model):
+    """Number of bookings per booking day and current status, kept in step by ReportService."""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'daily_booking_stat'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status'], name='daily_booking_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.count}"
+
+#Daily Revenue Rollup Model
+class DailyRevenueStat(models.Model):
+    """Invoice count and amount per invoice day and payment status, kept in step by ReportService."""
+    date = models.DateField()
+    payment_status = models.CharField(max_length=20, choices=Invoice.PAYMENT_STATUS_CHOICES)
+    invoice_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'daily_revenue_stat'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'payment_status'], name='daily_revenue_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.payment_status}: {self.total_amount}"
+
+#Revoked Refresh Token Model
+class RevokedToken(models.Model):
+    """
+    A refresh token that can no longer be used, kept until it would have expired.
+    A row whose jti is ``user:<id>`` revokes every refresh token issued to that
+    user before ``revoked_at`` (see core/revocation.py).
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='revoked_tokens'
+    )
+    # Indexed for RevocationStore's time window sync
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'revoked_token'
+
+    def __str__(self):
+        return self.jti
+
+#Capacity Override Model
+class CapacityOverride(models.Model):
+    """Workshop capacity for one date instead of WORKSHOP_DAILY_CAPACITY_MINUTES (0 = closed)."""
+    date = models.DateField(unique=True)
+    capacity_minutes = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'capacity_override'
+
+    def __str__(self):
+        return f"{self.date}: {self.capacity_minutes} min"
+
+#Daily Occupancy Model
+class DailyOccupancy(models.Model):
+    """
+    Minutes and bookings reserved per scheduled date by approved, in progress
+    and completed bookings, kept in step by CapacityService.
+    """
+    date = models.DateField(unique=True)
+    booked_minutes = models.IntegerField(default=0)
+    booking_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'daily_occupancy'
+
+    def __str__(self):
+        return f"{self.date}: {self.booked_minutes} min"
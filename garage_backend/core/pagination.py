@@ -0,0 +1,124 @@
+import json
+from functools import reduce
+
+from django.db.models import F, Q
+from rest_framework.pagination import Cursor, CursorPagination
+
+#-------------------
+# Keyset pagination on the indexed (created_at, id) key
+#-------------------
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered newest first on (created_at, id).
+
+    Pagination is opt-in so the existing frontend, which expects a plain list,
+    keeps working: it only applies when the client sends ``cursor`` or
+    ``page_size``. A view can cap the page size with a ``max_page_size``
+    attribute.
+
+    The cursor holds the values of every ordering field, not just the first
+    one as in DRF, and pages continue from it with a row comparison, so rows
+    sharing a timestamp are neither repeated nor skipped when rows are added
+    between two pages. NULLs sort first ascending and last descending on
+    every database.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.max_page_size = getattr(view, 'max_page_size', self.max_page_size)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (False, None) if self.cursor is None else self.cursor[1:]
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if position is not None:
+            queryset = queryset.filter(self._after(json.loads(position), reverse))
+
+        # One extra row tells whether another page follows in query order
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+
+        # Next continues after the last row shown, previous before the first
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.next_position = self.previous_position = position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _fields(self, reverse):
+        # (field, descending) in query order
+        return [(field.lstrip('-'), field.startswith('-') != reverse) for field in self.ordering]
+
+    def _order_by(self, reverse):
+        return [
+            F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True)
+            for name, descending in self._fields(reverse)
+        ]
+
+    def _after(self, values, reverse):
+        # Rows past ``values`` in query order: greater on the first field that
+        # differs, all earlier fields equal
+        after, equal = Q(pk__in=[]), Q()
+        for (name, descending), value in zip(self._fields(reverse), values):
+            if value is None:
+                past = Q(**{f'{name}__isnull': False}) if not descending else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            elif descending:
+                past = Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            else:
+                past = Q(**{f'{name}__gt': value})
+                same = Q(**{name: value})
+            after |= equal & past
+            equal &= same
+        return after
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            get = instance.get
+        else:
+            # Related orderings (user__username) are followed attribute by attribute
+            get = lambda name: reduce(getattr, name.split('__'), instance)  # noqa: E731
+        values = (get(field.lstrip('-')) for field in ordering)
+        return json.dumps([None if value is None else str(value) for value in values])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self._cursor(reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self._cursor(reverse=True, position=self.previous_position))
+
+    def _cursor(self, reverse, position):
+        # Positions are unique (the ordering ends on id), so no offset is needed
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+
+#-------------------
+# Users have no created_at, date_joined plays the same role
+#-------------------
+class DateJoinedCursorPagination(CreatedAtCursorPagination):
+    ordering = ('-date_joined', '-id')
@@ -0,0 +1,504 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import get_context
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils import formats
+from django.utils.cache import get_conditional_response
+
+JOB_CACHE_PREFIX = 'invoice_pdf_job'
+JOB_POLL_INTERVAL = 0.2
+ZIP_COPY_CHUNK = 64 * 1024
+
+
+class RenderQueueFull(Exception):
+    """Raised when the PDF render queue already holds INVOICE_PDF_MAX_PENDING jobs."""
+
+
+# -------------------
+# Rendering steps
+# -------------------
+def render_invoice_html(invoice):
+    # Needs the ORM, so it always runs in the request process
+    booking = invoice.booking
+    context = {
+        'invoice': invoice,
+        'customer': booking.customer,
+        'vehicle': booking.vehicle,
+        'service': booking.service,
+        'booking': booking,
+    }
+    return render_to_string('invoice.html', context)
+
+
+def invoice_render_data(invoice):
+    """
+    Flatten an invoice into the strings invoice.html would print, for the
+    native engine. Values go through the same localize()/str() step as
+    template variables so both engines show identical text.
+    """
+    booking = invoice.booking
+    customer = booking.customer
+    vehicle = booking.vehicle
+    service = booking.service
+
+    def as_text(value):
+        return str(formats.localize(value))
+
+    return {
+        'invoice_id': as_text(invoice.id),
+        'invoice_date': as_text(invoice.invoice_date),
+        'booking_id': as_text(booking.id),
+        'customer_username': as_text(customer.user.username),
+        'customer_phone': as_text(customer.phone),
+        'vehicle_type': as_text(vehicle.vehicle_type),
+        'vehicle_number': as_text(vehicle.vehicle_number),
+        'service_name': as_text(service.service_name),
+        'service_description': as_text(service.description),
+        'service_price': as_text(service.price),
+        'has_additional_charges': invoice.additional_charges > 0,
+        'additional_charges': as_text(invoice.additional_charges),
+        'additional_charges_description': as_text(invoice.additional_charges_description or ''),
+        'total_amount': as_text(invoice.total_amount),
+        'payment_status': as_text(invoice.payment_status),
+    }
+
+
+def render_payload(invoice, engine):
+    # Whatever the chosen engine needs, built in the request process
+    if engine == 'reportlab':
+        return invoice_render_data(invoice)
+    return render_invoice_html(invoice)
+
+
+def html_to_pdf(html):
+    # Runs inside the pool workers: must not touch the ORM or settings
+    from xhtml2pdf import pisa
+
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode('UTF-8')), result)
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def write_atomic(path, content):
+    # Write to a temp file in the same directory and rename, so readers never see a partial PDF
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def render_pdf(engine, payload):
+    # Runs inside the pool workers
+    if engine == 'reportlab':
+        from .pdf_native import render_invoice
+
+        return render_invoice(payload)
+    return html_to_pdf(payload)
+
+
+def render_to_file(engine, payload, path):
+    # Pool entry point: renders and stores the PDF, returns False if rendering failed
+    pdf = render_pdf(engine, payload)
+    if pdf is None:
+        return False
+    write_atomic(path, pdf)
+    return True
+
+
+# -------------------
+# Content-addressed PDF store
+# -------------------
+class PdfStore:
+    """
+    Rendered invoices on local disk, named ``<invoice id>-<digest>.pdf``.
+
+    The digest hashes every invoice, booking, customer, vehicle and service
+    field that feeds invoice.html (plus the template source itself and the
+    render engine), so any change to those rows or a switch of
+    INVOICE_PDF_ENGINE produces a new file name. Older files for the same
+    invoice are pruned when a new one is stored.
+    """
+
+    _template_digest = None
+
+    @property
+    def root(self):
+        return Path(settings.INVOICE_PDF_STORE_DIR)
+
+    @classmethod
+    def template_digest(cls):
+        if cls._template_digest is None:
+            source = get_template('invoice.html').template.source
+            cls._template_digest = hashlib.sha256(source.encode('UTF-8')).hexdigest()
+        return cls._template_digest
+
+    @staticmethod
+    def engine_key():
+        engine = settings.INVOICE_PDF_ENGINE
+        if engine == 'reportlab':
+            from .pdf_native import LAYOUT_VERSION
+
+            return f'{engine}:{LAYOUT_VERSION}'
+        return engine
+
+    def fingerprint(self, invoice):
+        booking = invoice.booking
+        customer = booking.customer
+        vehicle = booking.vehicle
+        service = booking.service
+        fields = [
+            self.engine_key(),
+            self.template_digest(),
+            invoice.id,
+            invoice.invoice_date,
+            invoice.additional_charges,
+            invoice.additional_charges_description,
+            invoice.total_amount,
+            invoice.payment_status,
+            booking.id,
+            customer.user.username,
+            customer.phone,
+            vehicle.vehicle_type,
+            vehicle.vehicle_number,
+            service.service_name,
+            service.description,
+            service.price,
+        ]
+        payload = json.dumps(fields, default=str, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('UTF-8')).hexdigest()
+
+    def path(self, invoice_id, digest):
+        # Shard by invoice id so no single directory grows unbounded
+        return self.root / f'{invoice_id % 256:02x}' / f'{invoice_id}-{digest}.pdf'
+
+    def exists(self, invoice_id, digest):
+        return self.path(invoice_id, digest).exists()
+
+    def prune(self, invoice_id, keep_digest=None):
+        """Remove stored PDFs of an invoice except ``keep_digest``."""
+        directory = self.path(invoice_id, 'x').parent
+        for stale in directory.glob(f'{invoice_id}-*.pdf'):
+            if keep_digest is None or stale.name != f'{invoice_id}-{keep_digest}.pdf':
+                stale.unlink(missing_ok=True)
+
+
+pdf_store = PdfStore()
+
+
+# -------------------
+# Bounded render pool with a job API
+# -------------------
+class PdfRenderPool:
+    """
+    Runs the PDF engine in a bounded process pool so a burst of downloads can not
+    pin every web worker on CPU. Workers write straight into the PdfStore and
+    an invoice whose current fingerprint is already stored is never rendered
+    again.
+
+    Job status lives in the Django cache so any web process sharing the
+    cache (and the store directory) can poll or fetch it. With
+    INVOICE_PDF_WORKERS = 0 everything renders inline in the request, which
+    suits small single-process deployments.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._futures = {}
+
+    @property
+    def workers(self):
+        return settings.INVOICE_PDF_WORKERS
+
+    def _get_executor(self):
+        # Created lazily so each web worker process gets its own pool after forking
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context('spawn'),
+                )
+            return self._executor
+
+    def _job_key(self, job_id):
+        return f'{JOB_CACHE_PREFIX}:{job_id}'
+
+    def _store(self, job, status):
+        job = dict(job, status=status)
+        cache.set(self._job_key(job['job_id']), job, settings.INVOICE_PDF_JOB_TTL)
+        return job
+
+    def submit(self, invoice):
+        """Queue an invoice for rendering unless it is already stored; returns the job dict."""
+        digest = pdf_store.fingerprint(invoice)
+        job = {'job_id': uuid.uuid4().hex, 'invoice_id': invoice.id, 'digest': digest}
+
+        if pdf_store.exists(invoice.id, digest):
+            return self._store(job, 'done')
+
+        engine = settings.INVOICE_PDF_ENGINE
+        payload = render_payload(invoice, engine)
+        path = pdf_store.path(invoice.id, digest)
+
+        if not self.workers:
+            rendered = render_to_file(engine, payload, path)
+            return self._finish(job, rendered)
+
+        with self._lock:
+            if self._pending >= settings.INVOICE_PDF_MAX_PENDING:
+                raise RenderQueueFull('PDF render queue is full')
+            self._pending += 1
+
+        job = self._store(job, 'pending')
+        try:
+            future = self._get_executor().submit(render_to_file, engine, payload, path)
+        except Exception as exc:
+            with self._lock:
+                self._pending -= 1
+                if isinstance(exc, BrokenProcessPool):
+                    # A worker died; start a fresh pool on the next submit
+                    self._executor = None
+            raise
+
+        self._futures[job['job_id']] = future
+        future.add_done_callback(lambda done: self._on_done(job, done))
+        return job
+
+    def _on_done(self, job, future):
+        with self._lock:
+            self._pending -= 1
+        self._futures.pop(job['job_id'], None)
+        self._finish(job, not future.exception() and future.result())
+
+    def _finish(self, job, rendered):
+        if rendered:
+            pdf_store.prune(job['invoice_id'], keep_digest=job['digest'])
+        return self._store(job, 'done' if rendered else 'failed')
+
+    def get(self, job_id):
+        """Return the job dict (status, invoice_id, digest) or None if unknown/expired."""
+        job = cache.get(self._job_key(job_id))
+        if job and job['status'] == 'pending' and pdf_store.exists(job['invoice_id'], job['digest']):
+            # The file is the source of truth; the status update may not have landed yet
+            job = dict(job, status='done')
+        return job
+
+    def wait(self, job_id, timeout):
+        """Block up to ``timeout`` seconds for a job to finish and return it."""
+        deadline = time.monotonic() + timeout
+        future = self._futures.get(job_id)
+        if future is not None:
+            futures.wait([future], timeout=timeout)
+
+        job = self.get(job_id)
+        while job is not None and job['status'] == 'pending' and time.monotonic() < deadline:
+            if future is not None and future.done():
+                # Rendering failed and the done callback has not stored it yet
+                return dict(job, status='failed')
+            time.sleep(JOB_POLL_INTERVAL)
+            job = self.get(job_id)
+        return job
+
+    def render(self, invoice, timeout=None):
+        """Render (or reuse) an invoice through the pool; returns the finished job dict."""
+        if timeout is None:
+            timeout = settings.INVOICE_PDF_WAIT_TIMEOUT
+
+        job = self.submit(invoice)
+        if job['status'] == 'pending':
+            job = self.wait(job['job_id'], timeout)
+        if job is None or job['status'] == 'pending':
+            raise futures.TimeoutError('PDF rendering timed out')
+        return job
+
+
+pdf_render_pool = PdfRenderPool()
+
+
+# -------------------
+# Bulk export as a streamed ZIP
+# -------------------
+def iter_invoice_pdfs(invoices):
+    """
+    Yield ``(invoice, path or None)`` in queryset order while rendering ahead
+    through the worker pool. At most ``2 * INVOICE_PDF_WORKERS`` jobs of the
+    export are in flight, and it backs off when other requests fill the queue.
+    """
+    window = max(settings.INVOICE_PDF_WORKERS * 2, 1)
+    in_flight = deque()
+
+    def finish(invoice, job):
+        if job['status'] == 'pending':
+            job = pdf_render_pool.wait(job['job_id'], settings.INVOICE_PDF_WAIT_TIMEOUT)
+        if job is None or job['status'] != 'done':
+            return invoice, None
+        return invoice, pdf_store.path(invoice.id, job['digest'])
+
+    for invoice in invoices:
+        while True:
+            try:
+                job = pdf_render_pool.submit(invoice)
+                break
+            except RenderQueueFull:
+                if in_flight:
+                    yield finish(*in_flight.popleft())
+                else:
+                    time.sleep(JOB_POLL_INTERVAL)
+
+        in_flight.append((invoice, job))
+        if len(in_flight) >= window:
+            yield finish(*in_flight.popleft())
+
+    while in_flight:
+        yield finish(*in_flight.popleft())
+
+
+class _ZipSink:
+    # Write-only, unseekable file object: zipfile switches to streaming mode
+    # (data descriptors) and we hand out whatever was written so far
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_invoice_zip(invoices):
+    """
+    Generate a ZIP of invoice PDFs chunk by chunk. Memory stays bounded by
+    the render window and ZIP_COPY_CHUNK, never by the archive size.
+    Invoices that fail to render are listed in ``errors.txt``.
+    """
+    sink = _ZipSink()
+    failed = []
+
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for invoice, path in iter_invoice_pdfs(invoices):
+            if path is None or not path.exists():
+                failed.append(invoice.id)
+                continue
+
+            info = zipfile.ZipInfo(
+                f'invoice_{invoice.id}.pdf',
+                date_time=invoice.invoice_date.timetuple()[:6],
+            )
+            # PDFs are already compressed, store them as is
+            info.compress_type = zipfile.ZIP_STORED
+            with archive.open(info, mode='w') as member, open(path, 'rb') as pdf_file:
+                while chunk := pdf_file.read(ZIP_COPY_CHUNK):
+                    member.write(chunk)
+                    yield sink.drain()
+
+        if failed:
+            archive.writestr(
+                'errors.txt',
+                'Invoices that could not be rendered:\n' + '\n'.join(str(invoice_id) for invoice_id in failed) + '\n',
+            )
+
+    yield sink.drain()
+
+
+# -------------------
+# Serving stored PDFs
+# -------------------
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def pdf_file_response(request, path, digest, filename):
+    """
+    Serve a stored PDF with a strong ETag (the content digest).
+
+    If-None-Match gets a 304, a single ``Range: bytes=`` request gets a 206
+    and full downloads go through FileResponse so the WSGI server can use
+    sendfile.
+    """
+    etag = f'"{digest}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    size = path.stat().st_size
+    byte_range = _parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=filename,
+            content_type='application/pdf',
+        )
+    else:
+        start, end = byte_range
+        with open(path, 'rb') as pdf_file:
+            pdf_file.seek(start)
+            content = pdf_file.read(end - start + 1)
+        response = HttpResponse(content, status=206, content_type='application/pdf')
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _parse_range(header, size):
+    # Returns None for no/unsupported Range, False when unsatisfiable, else (start, end)
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
@@ -0,0 +1,330 @@
+"""
+Native invoice renderer.
+
+Draws the fixed invoice.html layout straight onto a ReportLab canvas instead
+of parsing HTML/CSS through xhtml2pdf. Geometry, colours and fonts are
+module-level constants computed once per process; the logo image reader is
+cached across calls. Sections that do not fit above the bottom margin move to
+a new page, and line items split between pages. Runs inside the PDF worker pool, so it must not import
+Django models or read settings: everything it needs comes in the ``data``
+dict built by core.pdf.invoice_render_data().
+"""
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen.canvas import Canvas
+
+# Bump whenever the drawing code changes so stored PDFs are re-rendered
+LAYOUT_VERSION = 2
+
+# -------------------
+# Precompiled layout (points, measured from the top of the page)
+# -------------------
+PAGE_WIDTH, PAGE_HEIGHT = A4
+LEFT = 15 * mm
+RIGHT = PAGE_WIDTH - 15 * mm
+CELL_PADDING = 12
+SECTION_GAP = 10
+
+HEADER_TOP = LEFT
+# The fixed section heights run slightly taller than xhtml2pdf's flow, so
+# breaking at the template's 15 mm margin would spill invoices it fits on one page
+BOTTOM = PAGE_HEIGHT - 10 * mm
+HEADER_HEIGHT = 137
+LOGO_COLUMN = LEFT + 113
+META_COLUMN = LEFT + 313
+
+INFO_HEADER_HEIGHT = 50
+INFO_BODY_HEIGHT = 110
+INFO_SPLIT = (LEFT + RIGHT) / 2
+
+ITEMS_HEADER_HEIGHT = 51
+ITEM_MIN_HEIGHT = 102
+ITEM_LINE_HEIGHT = 12
+AMOUNT_COLUMN = RIGHT - 76
+
+TOTALS_HEIGHT = 43
+STATUS_HEIGHT = 29
+FOOTER_HEIGHT = 32
+
+FONT = 'Courier'
+FONT_BOLD = 'Courier-Bold'
+SIZE_BODY = 9.75
+SIZE_TITLE = 15
+SIZE_SUBTITLE = 9
+SIZE_META = 10.5
+SIZE_LABEL = 9
+SIZE_MUTED = 8.25
+SIZE_TOTAL_LABEL = 10.5
+SIZE_TOTAL_VALUE = 12
+
+BORDER = HexColor('#d1d5db')
+TEXT = HexColor('#111827')
+TITLE = HexColor('#1f2937')
+LABEL = HexColor('#374151')
+MUTED = HexColor('#6b7280')
+PANEL = HexColor('#f9fafb')
+TOTAL = HexColor('#059669')
+BADGE = {
+    'PAID': (HexColor('#047857'), HexColor('#d1fae5')),
+    'PENDING': (HexColor('#b45309'), HexColor('#fef3c7')),
+}
+
+LOGO_PATH = Path(__file__).resolve().parent.parent / 'static' / 'images' / 'logo.png'
+LOGO_SIZE = LOGO_COLUMN - LEFT - 2 * CELL_PADDING
+# Pixels per drawn point; the source logo is far larger than it is printed
+LOGO_RESOLUTION = 2
+LOGO_QUALITY = 90
+_logo = None
+
+
+def _get_logo():
+    # Decoded and downscaled once per worker process, then reused for every
+    # invoice; embedding the full-size logo costs more than the rest of the page
+    global _logo
+    if _logo is None and LOGO_PATH.exists():
+        pixels = round(LOGO_SIZE * LOGO_RESOLUTION)
+        with Image.open(LOGO_PATH) as image:
+            image = image.convert('RGBA')
+            image.thumbnail((pixels, pixels), Image.LANCZOS)
+        # Flatten onto the white page so no soft mask has to be embedded
+        flat = Image.new('RGB', image.size, 'white')
+        flat.paste(image, mask=image.getchannel('A'))
+        # Handed over as JPEG, which ReportLab embeds as is: raw pixels would
+        # be ASCII85 encoded in pure Python on every render (rl_config.useA85
+        # is process-wide, so it is left alone)
+        encoded = BytesIO()
+        flat.save(encoded, 'JPEG', quality=LOGO_QUALITY)
+        _logo = encoded.getvalue()
+    # A fresh reader per render: ReportLab reads the JPEG from its file object
+    return ImageReader(BytesIO(_logo)) if _logo is not None else None
+
+
+# -------------------
+# Drawing helpers
+# -------------------
+def _y(top):
+    return PAGE_HEIGHT - top
+
+
+def _box(canvas, top, height, left=LEFT, right=RIGHT, fill=None):
+    canvas.setStrokeColor(BORDER)
+    canvas.setLineWidth(0.75)
+    if fill is not None:
+        canvas.setFillColor(fill)
+    canvas.rect(left, _y(top + height), right - left, height, stroke=1, fill=fill is not None)
+
+
+def _vline(canvas, x, top, height):
+    canvas.setStrokeColor(BORDER)
+    canvas.line(x, _y(top), x, _y(top + height))
+
+
+def _hline(canvas, top, left=LEFT, right=RIGHT):
+    canvas.setStrokeColor(BORDER)
+    canvas.line(left, _y(top), right, _y(top))
+
+
+def _text(canvas, x, baseline, text, font=FONT, size=SIZE_BODY, color=TEXT, align='left'):
+    canvas.setFont(font, size)
+    canvas.setFillColor(color)
+    if align == 'right':
+        canvas.drawRightString(x, _y(baseline), text)
+    elif align == 'center':
+        canvas.drawCentredString(x, _y(baseline), text)
+    else:
+        canvas.drawString(x, _y(baseline), text)
+
+
+def _wrap(text, font, size, width):
+    return simpleSplit(text, font, size, width) or ['']
+
+
+def _reserve(canvas, top, height):
+    # Start a new page when the next block would cross the bottom margin
+    if top + height <= BOTTOM:
+        return top
+    canvas.showPage()
+    return HEADER_TOP
+
+
+# -------------------
+# Sections
+# -------------------
+def _draw_header(canvas, data):
+    top = HEADER_TOP
+    _box(canvas, top, HEADER_HEIGHT)
+    _vline(canvas, LOGO_COLUMN, top, HEADER_HEIGHT)
+    _vline(canvas, META_COLUMN, top, HEADER_HEIGHT)
+
+    logo = _get_logo()
+    if logo is not None:
+        canvas.drawImage(
+            logo, LEFT + CELL_PADDING, _y(top + (HEADER_HEIGHT + LOGO_SIZE) / 2),
+            width=LOGO_SIZE, height=LOGO_SIZE,
+        )
+
+    title_x = LOGO_COLUMN + 20
+    _text(canvas, title_x, top + 49, 'AlignPro', FONT_BOLD, SIZE_TITLE, TITLE)
+    _text(canvas, title_x, top + 67, 'Automotive', FONT_BOLD, SIZE_TITLE, TITLE)
+    _text(canvas, title_x, top + 103, 'Vehicle Service Invoice', FONT, SIZE_SUBTITLE, MUTED)
+
+    meta_x = RIGHT - CELL_PADDING - 13
+    _text(canvas, meta_x, top + 32, f"Invoice : {data['invoice_id']}", size=SIZE_META, align='right')
+    _text(canvas, meta_x, top + 75, f"Date: {data['invoice_date']}", size=SIZE_META, align='right')
+    _text(canvas, meta_x, top + 118, f"Booking ID: {data['booking_id']}", size=SIZE_META, align='right')
+    return top + HEADER_HEIGHT + SECTION_GAP
+
+
+def _draw_info(canvas, data, top):
+    height = INFO_HEADER_HEIGHT + INFO_BODY_HEIGHT
+    _box(canvas, top, height)
+    _vline(canvas, INFO_SPLIT, top, height)
+    _hline(canvas, top + INFO_HEADER_HEIGHT)
+
+    left_x = LEFT + 2 * CELL_PADDING
+    right_x = INFO_SPLIT + 2 * CELL_PADDING
+    _text(canvas, left_x, top + 30, 'BILL TO', FONT_BOLD, SIZE_LABEL, LABEL)
+    _text(canvas, right_x, top + 30, 'VEHICLE DETAILS', FONT_BOLD, SIZE_LABEL, LABEL)
+
+    body = top + INFO_HEADER_HEIGHT
+    _text(canvas, left_x, body + 30, data['customer_username'])
+    _text(canvas, left_x, body + 80, data['customer_phone'])
+    _text(canvas, right_x, body + 30, data['vehicle_type'])
+    _text(canvas, right_x, body + 80, data['vehicle_number'])
+    return top + height + SECTION_GAP
+
+
+def _item_height(title_lines, note_lines):
+    lines = len(title_lines) + len(note_lines)
+    return max(ITEM_MIN_HEIGHT, 2 * CELL_PADDING + 36 + ITEM_LINE_HEIGHT * lines)
+
+
+def _draw_items_header(canvas, top):
+    _box(canvas, top, ITEMS_HEADER_HEIGHT)
+    _vline(canvas, AMOUNT_COLUMN, top, ITEMS_HEADER_HEIGHT)
+    amount_x = RIGHT - CELL_PADDING
+    _text(canvas, LEFT + CELL_PADDING, top + 29, 'DESCRIPTION', FONT_BOLD, SIZE_LABEL)
+    _text(canvas, amount_x, top + 22, 'AMOUNT', FONT_BOLD, SIZE_LABEL, align='right')
+    _text(canvas, amount_x, top + 36, '(RS.)', FONT_BOLD, SIZE_LABEL, align='right')
+    return top + ITEMS_HEADER_HEIGHT
+
+
+def _draw_item(canvas, top, title_lines, note_lines, amount, title_font):
+    height = _item_height(title_lines, note_lines)
+    _box(canvas, top, height)
+    _vline(canvas, AMOUNT_COLUMN, top, height)
+
+    text_x = LEFT + CELL_PADDING
+    baseline = top + 21
+    for line in title_lines:
+        _text(canvas, text_x, baseline, line, title_font)
+        baseline += ITEM_LINE_HEIGHT
+    baseline = max(baseline + 24, top + 57) if note_lines else baseline
+    for line in note_lines:
+        _text(canvas, text_x, baseline, line, FONT, SIZE_MUTED, MUTED)
+        baseline += ITEM_LINE_HEIGHT
+    if amount:
+        _text(canvas, RIGHT - CELL_PADDING, top + height / 2 + 3, amount, align='right')
+    return top + height
+
+
+def _draw_items(canvas, data, top):
+    text_width = AMOUNT_COLUMN - LEFT - 2 * CELL_PADDING
+    rows = [(
+        _wrap(data['service_name'], FONT_BOLD, SIZE_BODY, text_width),
+        _wrap(data['service_description'], FONT, SIZE_MUTED, text_width),
+        data['service_price'],
+        FONT_BOLD,
+    )]
+    if data['has_additional_charges']:
+        rows.append((
+            ['Additional Charges'],
+            _wrap(data['additional_charges_description'], FONT, SIZE_MUTED, text_width)
+            if data['additional_charges_description'] else [],
+            data['additional_charges'],
+            FONT,
+        ))
+
+    top = _reserve(canvas, top, ITEMS_HEADER_HEIGHT + ITEM_MIN_HEIGHT)
+    top = _draw_items_header(canvas, top)
+    for title_lines, note_lines, amount, title_font in rows:
+        # A row taller than the space left keeps as many note lines as fit and
+        # continues under a repeated header on the next page, without the amount
+        while top + _item_height(title_lines, note_lines) > BOTTOM:
+            room = BOTTOM - top - _item_height(title_lines, [])
+            fitting = int(room // ITEM_LINE_HEIGHT) if room >= 0 else 0
+            if note_lines and fitting:
+                _draw_item(canvas, top, title_lines, note_lines[:fitting], amount, title_font)
+                note_lines, amount = note_lines[fitting:], ''
+            canvas.showPage()
+            top = _draw_items_header(canvas, HEADER_TOP)
+        top = _draw_item(canvas, top, title_lines, note_lines, amount, title_font)
+
+    return top + SECTION_GAP
+
+
+def _draw_totals(canvas, data, top):
+    top = _reserve(canvas, top, TOTALS_HEIGHT)
+    _box(canvas, top, TOTALS_HEIGHT)
+    _vline(canvas, INFO_SPLIT, top, TOTALS_HEIGHT)
+    _text(canvas, LEFT + 18, top + 21, 'TOTAL AMOUNT', FONT_BOLD, SIZE_TOTAL_LABEL)
+    _text(canvas, RIGHT - 19, top + 21, f"Rs. {data['total_amount']}", FONT_BOLD, SIZE_TOTAL_VALUE, TOTAL, align='right')
+    return top + TOTALS_HEIGHT + SECTION_GAP
+
+
+def _draw_payment(canvas, data, top):
+    status = data['payment_status']
+    status_color, badge_color = BADGE['PAID' if status == 'PAID' else 'PENDING']
+    top = _reserve(canvas, top, 2 * STATUS_HEIGHT + 3)
+
+    _box(canvas, top, STATUS_HEIGHT, fill=PANEL)
+    label_x = LEFT + 7
+    _text(canvas, label_x, top + 14, 'Status:', FONT_BOLD, SIZE_LABEL)
+    badge_x = label_x + canvas.stringWidth('Status: ', FONT_BOLD, SIZE_LABEL)
+    badge_width = canvas.stringWidth(status, FONT_BOLD, SIZE_LABEL) + 6
+    canvas.setFillColor(badge_color)
+    canvas.rect(badge_x, _y(top + 17), badge_width, 11, stroke=0, fill=1)
+    _text(canvas, badge_x + 3, top + 14, status, FONT_BOLD, SIZE_LABEL, status_color)
+
+    top += STATUS_HEIGHT + 3
+    _box(canvas, top, STATUS_HEIGHT, fill=PANEL)
+    _text(canvas, label_x, top + 14, 'Payment Method:', FONT_BOLD, SIZE_LABEL)
+    method_x = label_x + canvas.stringWidth('Payment Method: ', FONT_BOLD, SIZE_LABEL)
+    _text(canvas, method_x, top + 14, 'Cash / Card', size=SIZE_LABEL)
+    return top + STATUS_HEIGHT + 3
+
+
+def _draw_footer(canvas, top):
+    top = _reserve(canvas, top, 2 * FOOTER_HEIGHT + 3)
+    center = (LEFT + RIGHT) / 2
+    for line in ('Authorized Signature', 'Thank you for choosing our service.'):
+        _box(canvas, top, FOOTER_HEIGHT)
+        _text(canvas, center, top + 13, line, size=SIZE_MUTED, align='center')
+        top += FOOTER_HEIGHT + 3
+
+
+# -------------------
+# Entry point
+# -------------------
+def render_invoice(data):
+    """Return the invoice PDF bytes for a dict built by core.pdf.invoice_render_data()."""
+    buffer = BytesIO()
+    canvas = Canvas(buffer, pagesize=A4, pageCompression=1)
+    canvas.setTitle(f"Invoice #{data['invoice_id']}")
+
+    top = _draw_header(canvas, data)
+    top = _draw_info(canvas, data, top)
+    top = _draw_items(canvas, data, top)
+    top = _draw_totals(canvas, data, top)
+    top = _draw_payment(canvas, data, top)
+    _draw_footer(canvas, top)
+
+    canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
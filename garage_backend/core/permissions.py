@@ -41,10 +41,10 @@ class IsAdminOrOwner(BasePermission):
 
         # Handle different models
         if hasattr(obj, "user"):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         elif hasattr(obj, "owner"):
             return obj.owner == request.user
         elif hasattr(obj, "customer"):
-            return obj.customer.user == request.user
+            return obj.customer.user_id == request.user.id
 
         return False
@@ -0,0 +1,144 @@
+from datetime import date
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+# -------------------
+# values()-based read path
+# -------------------
+# Step kinds
+VALUE, CONVERT, DATETIME, NESTED = range(4)
+
+
+def _iso_datetime(value, tz):
+    # DateTimeField.to_representation() for an aware value with the default ISO format
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _convert_date(field):
+    if getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601:
+        return date.isoformat
+    return field.to_representation
+
+
+def _step(field):
+    # (kind, function) reproducing field.to_representation() for raw column values
+    # (None never reaches them: the serializer maps it to None before the field)
+    if isinstance(field, serializers.DateTimeField):
+        iso = getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+        if iso and settings.USE_TZ and getattr(field, 'timezone', None) is None:
+            return DATETIME, _iso_datetime
+        return CONVERT, field.to_representation
+    if isinstance(field, serializers.DateField):
+        return CONVERT, _convert_date(field)
+    if isinstance(field, (serializers.ChoiceField, serializers.PrimaryKeyRelatedField)):
+        return VALUE, None
+    if isinstance(field, serializers.CharField):
+        return CONVERT, str
+    if isinstance(field, serializers.BooleanField):
+        return CONVERT, bool
+    if isinstance(field, serializers.IntegerField):
+        return CONVERT, int
+    return CONVERT, field.to_representation
+
+
+class ValuesReader:
+    """
+    Builds the JSON-ready output of a (nested) ModelSerializer straight from
+    ``QuerySet.values()`` rows, skipping model instances, nested serializer
+    calls and per-field get_attribute(). The field list, values() paths and
+    converters are compiled once from the serializer declaration, so the
+    output matches it key for key; ValuesReaderTests checks it byte for byte
+    after a serializer changes.
+    """
+
+    def __init__(self, serializer_class):
+        self.paths = []
+        self._build = self._builder(self._compile(serializer_class(), ''))
+
+    def _compile(self, serializer, prefix):
+        steps = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            path = prefix + field.source.replace('.', '__')
+
+            if isinstance(field, serializers.BaseSerializer):
+                pk_name = field.Meta.model._meta.pk.name
+                nested = self._compile(field, path + '__')
+                steps.append((name, f'{path}__{pk_name}', NESTED, self._builder(nested)))
+                self.paths.append(f'{path}__{pk_name}')
+            else:
+                steps.append((name, path, *_step(field)))
+                self.paths.append(path)
+        return steps
+
+    @staticmethod
+    def _builder(steps):
+        def build(row, tz):
+            data = {}
+            for name, path, kind, convert in steps:
+                value = row[path]
+                if value is None or kind == VALUE:
+                    data[name] = value
+                elif kind == CONVERT:
+                    data[name] = convert(value)
+                elif kind == DATETIME:
+                    data[name] = convert(value, tz)
+                else:
+                    data[name] = convert(row, tz)
+            return data
+        return build
+
+    def values(self, queryset, *extra):
+        """``queryset.values()`` with every path the output needs, plus ``extra``."""
+        return queryset.values(*dict.fromkeys([*self.paths, *extra]))
+
+    def build(self, row):
+        return self._build(row, timezone.get_current_timezone())
+
+    def build_many(self, rows):
+        # The active timezone is looked up once per list, not once per value
+        build, tz = self._build, timezone.get_current_timezone()
+        return [build(row, tz) for row in rows]
+
+
+_readers = {}
+
+
+def get_reader(serializer_class):
+    if serializer_class not in _readers:
+        _readers[serializer_class] = ValuesReader(serializer_class)
+    return _readers[serializer_class]
+
+
+class ValuesListMixin:
+    """
+    Serves plain list requests through a ValuesReader for the view's
+    serializer class. Shaped (?fields=/?expand=) and side-loaded requests,
+    and everything when FAST_LIST_READS is off, use the regular serializer.
+    The ordering columns are fetched too, so cursor pagination can read its
+    position from the row dicts.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_READS or self.get_serializer().shaped:
+            return super().list(request, *args, **kwargs)
+
+        reader = get_reader(self.get_serializer_class())
+        ordering = [
+            *(getattr(self, 'ordering_fields', None) or ()),
+            *(field.lstrip('-') for field in getattr(self.pagination_class, 'ordering', ())),
+        ]
+        queryset = reader.values(self.filter_queryset(self.get_queryset()), 'id', *ordering)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.build_many(page))
+        return Response(reader.build_many(queryset))
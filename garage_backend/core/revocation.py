@@ -0,0 +1,219 @@
+import hashlib
+import math
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import cache_is_shared
+from .models import RevokedToken
+
+EPOCH_KEY = 'token_revocation_epoch'
+COUNTER_KEY = 'token_revocation_counter'
+PURGE_KEY = 'token_revocation_purge'
+USER_KEY = 'token_revocation_user:{}'
+
+
+def user_marker(user_id):
+    """jti of the row that revokes all of a user's earlier refresh tokens."""
+    return f'user:{user_id}'
+
+
+# -------------------
+# Bloom filter
+# -------------------
+class BloomFilter:
+    """
+    Fixed-size set of strings answering "definitely not present" or "maybe
+    present". ``error_rate`` is the false positive rate at ``capacity`` items.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('UTF-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        # Items already present (re-added by an overlapping sync) are not counted again
+        new = False
+        for position in self._positions(item):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                new = True
+        self.count += new
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# -------------------
+# Revocation store
+# -------------------
+class RevocationStore:
+    """
+    Revoked refresh tokens: the RevokedToken table is the record, and each
+    process keeps a Bloom filter of the revoked jtis in front of it, so a
+    refresh with a token that was never revoked (nearly all of them) costs
+    no query.
+
+    The filter is kept in step through two cache keys: a counter bumped on
+    every revocation, on which processes load the rows revoked since their
+    last sync, and an epoch changed by purging, on which they rebuild the
+    filter from the remaining rows. Each load reaches back
+    REVOKED_TOKEN_SYNC_WINDOW seconds before the previous one, so rows
+    committed late or out of id order are still picked up, and a process
+    that saw no counter change loads anyway once the window has passed.
+
+    Revoking a user also stores the revocation time in the cache next to the
+    filter keys (read in the same round trip), so it applies on the next
+    refresh in every process; the ``user:<id>`` row is in the filter as well,
+    in case that key is evicted.
+
+    Without a shared cache (LocMemCache or DummyCache: no REDIS_URL) a
+    process never hears of the others' revocations, so the filter is not
+    used: every refresh then costs one indexed query on the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._epoch = None
+        self._counter = None
+        self._synced_at = None
+
+    # ---- filter sync ----
+    @staticmethod
+    def shared():
+        """Whether the default cache is seen by every process."""
+        return cache_is_shared()
+
+    def _rebuild(self, epoch, counter):
+        now = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True))
+        capacity = max(settings.REVOKED_TOKEN_FILTER_CAPACITY, 2 * len(jtis))
+        bloom = BloomFilter(capacity, settings.REVOKED_TOKEN_FILTER_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter, self._epoch, self._counter, self._synced_at = bloom, epoch, counter, now
+
+    def _load_new(self, counter):
+        now = timezone.now()
+        since = self._synced_at - timedelta(seconds=settings.REVOKED_TOKEN_SYNC_WINDOW)
+        for jti in RevokedToken.objects.filter(revoked_at__gte=since).values_list('jti', flat=True):
+            self._filter.add(jti)
+        self._counter, self._synced_at = counter, now
+
+    def _sync(self, user_id):
+        # Returns the filter and the user's cached revocation time (epoch seconds or None)
+        user_key = USER_KEY.format(user_id)
+        state = cache.get_many([EPOCH_KEY, COUNTER_KEY, user_key])
+        epoch = state.get(EPOCH_KEY)
+        if epoch is None:
+            epoch = uuid.uuid4().hex
+            if not cache.add(EPOCH_KEY, epoch, None):
+                epoch = cache.get(EPOCH_KEY)
+        counter = state.get(COUNTER_KEY, 0)
+        window = timedelta(seconds=settings.REVOKED_TOKEN_SYNC_WINDOW)
+
+        with self._lock:
+            if self._filter is None or epoch != self._epoch:
+                self._rebuild(epoch, counter)
+            elif counter != self._counter or timezone.now() - self._synced_at > window:
+                self._load_new(counter)
+            if self._filter.count > self._filter.capacity:
+                # Past capacity the false positive rate climbs: resize
+                self._rebuild(epoch, counter)
+            return self._filter, state.get(user_key)
+
+    def _announce(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        try:
+            cache.incr(COUNTER_KEY)
+        except ValueError:
+            cache.add(COUNTER_KEY, 1, None)
+
+    # ---- public API ----
+    def is_revoked(self, jti, user_id, issued_at):
+        """
+        True when the refresh token ``jti`` (issued at ``issued_at``, epoch
+        seconds) is revoked. With a shared cache the table is only read when
+        the filter may hold the jti or the user's marker; without one it is
+        always read (one query).
+        """
+        marker = user_marker(user_id)
+        lookup = [jti, marker]
+        if self.shared():
+            bloom, revoked_at = self._sync(user_id)
+            if revoked_at is not None and (issued_at is None or issued_at < revoked_at):
+                return True
+            lookup = [key for key in lookup if key in bloom]
+            if not lookup:
+                return False
+        rows = dict(RevokedToken.objects.filter(jti__in=lookup).values_list('jti', 'revoked_at'))
+
+        if jti in rows:
+            return True
+        revoked_at = rows.get(marker)
+        return revoked_at is not None and (issued_at is None or issued_at < revoked_at.timestamp())
+
+    def revoke(self, jti, user_id, expires_at):
+        """
+        Revoke one refresh token. Returns False when it was already revoked,
+        which is how a concurrent second use of a rotated token is refused.
+        """
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, user_id=user_id, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        transaction.on_commit(lambda: self._announce(jti))
+        self._maybe_purge()
+        return True
+
+    def revoke_user(self, user_id):
+        """Revoke every refresh token issued to the user so far."""
+        now = timezone.now()
+        marker = user_marker(user_id)
+        # No token issued before now outlives this
+        lifetime = api_settings.REFRESH_TOKEN_LIFETIME + timedelta(minutes=1)
+        RevokedToken.objects.update_or_create(
+            jti=marker,
+            defaults={'user_id': user_id, 'revoked_at': now, 'expires_at': now + lifetime},
+        )
+
+        def announce():
+            cache.set(USER_KEY.format(user_id), now.timestamp(), lifetime.total_seconds())
+            self._announce(marker)
+
+        transaction.on_commit(announce)
+
+    def purge_expired(self):
+        """Delete rows for tokens that have expired anyway and start a new filter epoch."""
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        if deleted:
+            cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+        return deleted
+
+    def _maybe_purge(self):
+        # At most one process purges per interval
+        if cache.add(PURGE_KEY, 1, settings.REVOKED_TOKEN_PURGE_INTERVAL):
+            self.purge_expired()
+
+
+token_revocations = RevocationStore()
@@ -0,0 +1,228 @@
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking
+from .services import BookingService, CapacityService
+
+
+# -------------------
+# Scheduling engine
+# -------------------
+class Scheduler:
+    """
+    Assigns jobs to days of a window without exceeding each day's free
+    minutes, keeping the total squared lateness (days after the preferred
+    day) low. Days are indexes into ``remaining``; a job may not start
+    before its preferred day (or day 0 when that has passed).
+
+    ``run()`` places jobs greedily, in preferred day order (shorter jobs
+    first on a tie), on the first day with room. That leaves long jobs late
+    where a few shorter jobs could have moved aside, so an improvement step
+    then brings late jobs forward, moving the jobs that prefer the latest
+    days out of the way to other days with room when that lowers the cost.
+    Every change lowers it, so the step ends when none is left (or after
+    ``max_passes`` passes). The engine does no database access.
+    """
+
+    def __init__(self, remaining, max_passes=None):
+        self.remaining = list(remaining)
+        self.max_passes = max_passes or settings.SCHEDULER_MAX_PASSES
+        self.jobs = []
+
+    def add(self, key, preferred, minutes):
+        self.jobs.append((key, preferred, minutes))
+
+    def run(self):
+        # jobs[i] = (key, preferred, minutes); day[i] is its day or None.
+        # Shorter jobs first among equals leaves fewer days late in total
+        self.jobs.sort(key=lambda job: (job[1], job[2]))
+        self.day = [None] * len(self.jobs)
+        self._greedy()
+        greedy_cost = self.cost()
+        self._improve()
+        return {
+            'assignments': {
+                key: self.day[i] for i, (key, _, _) in enumerate(self.jobs) if self.day[i] is not None
+            },
+            'unscheduled': [key for i, (key, _, _) in enumerate(self.jobs) if self.day[i] is None],
+            'greedy_cost': greedy_cost,
+            'cost': self.cost(),
+        }
+
+    def cost(self):
+        return sum(
+            (day - job[1]) ** 2 for job, day in zip(self.jobs, self.day) if day is not None
+        )
+
+    def _greedy(self):
+        # Per duration, next[d] leads to the first day >= d with room for it
+        # (union-find with path compression); free minutes only shrink here,
+        # so a day that is too full for a duration stays skipped
+        count = len(self.remaining)
+        durations = {minutes for _, _, minutes in self.jobs}
+        following = {
+            minutes: [d if d == count or self.remaining[d] >= minutes else d + 1 for d in range(count + 1)]
+            for minutes in durations
+        }
+
+        for i, (_, preferred, minutes) in enumerate(self.jobs):
+            day = self._find(following[minutes], max(preferred, 0))
+            if day == count:
+                continue
+            self.day[i] = day
+            self.remaining[day] -= minutes
+            for other, links in following.items():
+                if links[day] == day and self.remaining[day] < other:
+                    links[day] = day + 1
+
+    @staticmethod
+    def _find(links, day):
+        root = day
+        while links[root] != root:
+            root = links[root]
+        while links[day] != root:
+            links[day], day = root, links[day]
+        return root
+
+    def _improve(self):
+        # by_day[day] = sorted [(preferred, minutes, job)] placed on that day
+        self.by_day = [[] for _ in self.remaining]
+        for i, day in enumerate(self.day):
+            if day is not None:
+                self.by_day[day].append((self.jobs[i][1], self.jobs[i][2], i))
+        for placed in self.by_day:
+            placed.sort()
+
+        for _ in range(self.max_passes):
+            late = sorted(
+                (i for i, day in enumerate(self.day) if day is not None and day > max(self.jobs[i][1], 0)),
+                key=lambda i: self.jobs[i][1] - self.day[i],
+            )
+            changed = False
+            for i in late:
+                changed |= self._improve_job(i)
+            if not changed:
+                break
+
+    def _improve_job(self, i):
+        """
+        Try to bring late job ``i`` forward to each earlier day, making room
+        there by moving the jobs preferring the latest days to the earliest
+        day (up to ``i``'s current one) with room for them; apply the change
+        that lowers the cost most, if any does.
+        """
+        _, preferred, minutes = self.jobs[i]
+        day = self.day[i]
+        best_saving, best = 0, None
+        for earlier in range(max(preferred, 0), day):
+            saving = (day - preferred) ** 2 - (earlier - preferred) ** 2
+            if saving <= best_saving:
+                # Later days save less still
+                break
+            free, moves = self.remaining[earlier], []
+            # Free minutes left on the other days by the moves so far
+            taken = {day: -minutes}
+            for other_preferred, other_minutes, other in reversed(self.by_day[earlier]):
+                if free >= minutes or saving <= best_saving:
+                    break
+                target = next((
+                    target for target in range(max(other_preferred, 0), day + 1)
+                    if target != earlier and self.remaining[target] - taken.get(target, 0) >= other_minutes
+                ), None)
+                if target is None:
+                    break
+                taken[target] = taken.get(target, 0) + other_minutes
+                free += other_minutes
+                moves.append((other, target))
+                saving -= (target - other_preferred) ** 2 - (earlier - other_preferred) ** 2
+            if free >= minutes and saving > best_saving:
+                best_saving, best = saving, (earlier, moves)
+        if best is None:
+            return False
+
+        earlier, moves = best
+        self._place(i, earlier)
+        for other, target in moves:
+            self._place(other, target)
+        return True
+
+    def _place(self, i, day):
+        _, preferred, minutes = self.jobs[i]
+        old = self.day[i]
+        placed = self.by_day[old]
+        del placed[bisect_left(placed, (preferred, minutes, i))]
+        self.remaining[old] += minutes
+        self.remaining[day] -= minutes
+        self.day[i] = day
+        insort(self.by_day[day], (preferred, minutes, i))
+
+
+# -------------------
+# Pending booking schedule
+# -------------------
+def plan_pending_bookings(start=None, days=None):
+    """
+    Plan scheduled dates for the pending bookings preferring a day up to the
+    end of the window, against the capacity left on each day. Bookings
+    without a preferred date take the first day of the window. Reads the
+    bookings and the window's availability in three queries.
+    """
+    today = timezone.localdate()
+    start = max(start or today, today)
+    days = days or settings.SCHEDULER_HORIZON_DAYS
+    end = start + timedelta(days=days - 1)
+
+    window = CapacityService.availability(start, end)
+    scheduler = Scheduler(day['available_minutes'] for day in window)
+    preferred_dates = {}
+    rows = (
+        Booking.objects.filter(Q(preferred_date__lte=end) | Q(preferred_date__isnull=True), status='PENDING')
+        .order_by('id')
+        .values_list('id', 'preferred_date', 'service__duration_minutes')
+    )
+    for booking_id, preferred_date, minutes in rows:
+        preferred_dates[booking_id] = preferred_date
+        scheduler.add(booking_id, ((preferred_date or start) - start).days, minutes)
+    result = scheduler.run()
+
+    assignments = [
+        {
+            'id': booking_id,
+            'preferred_date': preferred_dates[booking_id],
+            'scheduled_date': start + timedelta(days=day),
+            'days_late': (start + timedelta(days=day) - (preferred_dates[booking_id] or start)).days,
+        }
+        for booking_id, day in sorted(result['assignments'].items(), key=lambda item: (item[1], item[0]))
+    ]
+    return {
+        'start': start,
+        'end': end,
+        'pending': len(preferred_dates),
+        'scheduled': len(assignments),
+        'unscheduled': sorted(result['unscheduled']),
+        'total_days_late': sum(item['days_late'] for item in assignments),
+        'max_days_late': max((item['days_late'] for item in assignments), default=0),
+        # Sum of squared days late, before and after the improvement step
+        'greedy_cost': result['greedy_cost'],
+        'cost': result['cost'],
+        'assignments': assignments,
+    }
+
+
+def apply_plan(plan, chunk_size=500):
+    """
+    Approve the planned bookings through BookingService.bulk_transition,
+    one transaction per chunk, so each still needs to be pending and fit its
+    day's capacity when it is written. Returns ``{booking_id: error}`` for
+    the bookings that were not approved.
+    """
+    items = [(item['id'], item['scheduled_date']) for item in plan['assignments']]
+    failed = {}
+    for offset in range(0, len(items), chunk_size):
+        outcome = BookingService.bulk_transition('APPROVED', items[offset:offset + chunk_size])
+        failed.update({booking_id: error for booking_id, error in outcome.items() if error})
+    return failed
@@ -0,0 +1,324 @@
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Lower, Replace
+
+from .models import Booking, Customer, Vehicle, normalize_plate
+
+EPOCH_KEY = 'search_index_epoch'
+SEQUENCE_KEY = 'search_index_sequence'
+CHANGE_KEY = 'search_index_change:{}'
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER, CUSTOMER_USER, VEHICLE = 'customer', 'customer_user', 'vehicle'
+CUSTOMER_FIELDS = (
+    'id', 'user_id', 'user__username', 'user__first_name', 'user__last_name',
+    'user__email', 'user__is_active', 'phone',
+)
+VEHICLE_FIELDS = ('id', 'customer_id', 'vehicle_number', 'vehicle_type')
+
+
+def _text(value):
+    return ' '.join((value or '').lower().split())
+
+
+def _compact(value):
+    return normalize_plate(value).lower()
+
+
+# Typed between the digits of a phone number; removed the same way from the
+# indexed phone and, with REPLACE(), from the phone column in database_search
+PHONE_SEPARATORS = ' -+()./'
+
+
+def _compact_phone(value):
+    return ''.join(char for char in (value or '') if char not in PHONE_SEPARATORS).lower()
+
+
+def _compact_phone_column(field):
+    expression = Lower(field)
+    for char in PHONE_SEPARATORS:
+        expression = Replace(expression, Value(char))
+    return expression
+
+
+def customer_document(row):
+    name = f"{row['user__first_name']} {row['user__last_name']}".strip()
+    document = {
+        'type': CUSTOMER,
+        'id': row['id'],
+        'username': row['user__username'],
+        'name': name,
+        'email': row['user__email'],
+        'phone': row['phone'],
+        'is_active': row['user__is_active'],
+    }
+    terms = {
+        _text(row['user__username']),
+        _text(row['user__first_name']),
+        _text(row['user__last_name']),
+        _text(name),
+        _text(row['user__email']),
+        _compact_phone(row['phone']),
+    }
+    return document, terms
+
+
+def vehicle_document(row):
+    document = {
+        'type': VEHICLE,
+        'id': row['id'],
+        'vehicle_number': row['vehicle_number'],
+        'vehicle_type': row['vehicle_type'],
+        'customer_id': row['customer_id'],
+    }
+    return document, {_compact(row['vehicle_number'])}
+
+
+# -------------------
+# Prefix index
+# -------------------
+class PrefixIndex:
+    """
+    Sorted array of ``(term, type, id)`` entries searched with bisect: every
+    term starting with the query sits in one contiguous run after
+    ``bisect_left(entries, (query,))``, and shorter (exact) terms come first.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.documents = {}
+        self._terms = {}
+
+    @classmethod
+    def build(cls, customer_rows, vehicle_rows):
+        index = cls()
+        entries = []
+        for rows, document in ((customer_rows, customer_document), (vehicle_rows, vehicle_document)):
+            for row in rows:
+                doc, terms = document(row)
+                key = (doc['type'], doc['id'])
+                terms.discard('')
+                index.documents[key] = doc
+                index._terms[key] = terms
+                entries.extend((term, *key) for term in terms)
+        entries.sort()
+        index.entries = entries
+        return index
+
+    def put(self, doc, terms):
+        key = (doc['type'], doc['id'])
+        terms.discard('')
+        self.remove(*key)
+        self.documents[key] = doc
+        self._terms[key] = terms
+        for term in terms:
+            insort(self.entries, (term, *key))
+
+    def remove(self, kind, pk):
+        key = (kind, pk)
+        self.documents.pop(key, None)
+        for term in self._terms.pop(key, ()):
+            position = bisect_left(self.entries, (term, *key))
+            if position < len(self.entries) and self.entries[position] == (term, *key):
+                del self.entries[position]
+
+    def search(self, query, limit):
+        found = {}
+        for prefix in dict.fromkeys((_text(query), _compact(query))):
+            if not prefix:
+                continue
+            entries = self.entries
+            position = bisect_left(entries, (prefix,))
+            while position < len(entries) and len(found) < limit:
+                term, kind, pk = entries[position]
+                if not term.startswith(prefix):
+                    break
+                document = self.documents.get((kind, pk))
+                if document is not None:
+                    # (None: removed by a concurrent update)
+                    found.setdefault((kind, pk), document)
+                position += 1
+        return list(found.values())[:limit]
+
+    def __len__(self):
+        return len(self.documents)
+
+
+def database_search(query, limit):
+    """The same results straight from the database, for when the index is not ready."""
+    text, compact = _text(query), _compact(query)
+    customers = Customer.objects.alias(phone_compact=_compact_phone_column('phone')).filter(
+        Q(user__username__istartswith=text)
+        | Q(user__first_name__istartswith=text)
+        | Q(user__last_name__istartswith=text)
+        | Q(user__email__istartswith=text)
+        | (Q(phone_compact__startswith=compact) if compact else Q(pk__in=[]))
+    ).values(*CUSTOMER_FIELDS)[:limit]
+    results = [customer_document(row)[0] for row in customers]
+    if compact:
+        vehicles = Vehicle.objects.filter(
+            plate_normalized__istartswith=compact
+        ).values(*VEHICLE_FIELDS)[:limit]
+        results.extend(vehicle_document(row)[0] for row in vehicles)
+    return results[:limit]
+
+
+# -------------------
+# Shared, self-updating index
+# -------------------
+class SearchIndex:
+    """
+    Per-process PrefixIndex over customers (username, names, email, phone)
+    and vehicles (normalized plate), built in a background thread at worker
+    startup (see garage_backend/wsgi.py) or on the first search. Until it is
+    ready, and while it is rebuilt after an ``invalidate()``, searches are
+    answered from the database.
+
+    Saves and deletes are recorded by the signals in core/signals.py as
+    numbered changes in the cache; each process replays the changes it has
+    not seen before searching, re-reading only those rows. A missing change
+    or a long backlog rebuilds the index. The epoch and the change counter
+    expire after SEARCH_INDEX_MAX_AGE seconds (a new counter starts a new
+    epoch), and a process also rebuilds an index older than that, serving
+    the old one meanwhile.
+
+    With a per-process cache (LocMemCache: no REDIS_URL) a worker only sees
+    the changes made through it, so other workers' saves show up in its
+    results after at most SEARCH_INDEX_MAX_AGE seconds. Multi-process
+    deployments should share the cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._epoch = None
+        self._sequence = 0
+        self._built_at = None
+        self._builder = None
+
+    def record(self, kind, pk):
+        """Note that a customer, user or vehicle changed (called after commit)."""
+        try:
+            sequence = cache.incr(SEQUENCE_KEY)
+        except ValueError:
+            # First change, or the counter expired: numbering restarts, so
+            # indexes that replayed the old numbers must be rebuilt
+            if cache.add(SEQUENCE_KEY, 0, settings.SEARCH_INDEX_MAX_AGE):
+                self.invalidate()
+            sequence = cache.incr(SEQUENCE_KEY)
+        cache.set(CHANGE_KEY.format(sequence), (kind, pk), settings.SEARCH_INDEX_CHANGE_TTL)
+
+    def invalidate(self):
+        cache.set(EPOCH_KEY, uuid.uuid4().hex, settings.SEARCH_INDEX_MAX_AGE)
+
+    def warm(self):
+        """Start building this process's index in the background."""
+        epoch, sequence = self._state()
+        with self._lock:
+            self._build_in_background(epoch, sequence)
+
+    def search(self, query, limit=None):
+        limit = limit or settings.SEARCH_RESULT_LIMIT
+        index = self._current() if settings.SEARCH_INDEX else None
+        results = index.search(query, limit) if index is not None else database_search(query, limit)
+
+        digits = query.strip().lstrip('#')
+        if digits.isdigit() and len(results) < limit:
+            booking = Booking.objects.filter(pk=int(digits)).values(
+                'id', 'status', 'preferred_date', 'scheduled_date', 'customer_id', 'vehicle_id',
+            ).first()
+            if booking is not None:
+                results.insert(0, {'type': 'booking', **booking})
+        return results
+
+    def _state(self):
+        state = cache.get_many([EPOCH_KEY, SEQUENCE_KEY])
+        epoch = state.get(EPOCH_KEY)
+        if epoch is None:
+            epoch = uuid.uuid4().hex
+            if not cache.add(EPOCH_KEY, epoch, settings.SEARCH_INDEX_MAX_AGE):
+                epoch = cache.get(EPOCH_KEY)
+        return epoch, state.get(SEQUENCE_KEY, 0)
+
+    def _current(self):
+        """The index for the current epoch with the recorded changes applied, or None while it is built."""
+        epoch, sequence = self._state()
+        # Replaying a few changes is quick, so searches wait for it
+        with self._lock:
+            current = self._index is not None and epoch == self._epoch
+            if not current or time.monotonic() - self._built_at > settings.SEARCH_INDEX_MAX_AGE:
+                self._build_in_background(epoch, sequence)
+            if not current:
+                return None
+            if sequence > self._sequence and not self._catch_up(sequence):
+                self._epoch = None
+                self._build_in_background(epoch, sequence)
+                return None
+            return self._index
+
+    def _build_in_background(self, epoch, sequence):
+        # Called with the lock held; one build at a time per process
+        if self._builder is not None and self._builder.is_alive():
+            return
+        self._builder = threading.Thread(
+            target=self._build, args=(epoch, sequence), name='search-index', daemon=True,
+        )
+        self._builder.start()
+
+    def _build(self, epoch, sequence):
+        try:
+            index = PrefixIndex.build(
+                Customer.objects.values(*CUSTOMER_FIELDS).iterator(chunk_size=5000),
+                Vehicle.objects.values(*VEHICLE_FIELDS).iterator(chunk_size=5000),
+            )
+        except Exception:
+            # Searches keep using the database; the next one retries
+            logger.exception('Building the search index failed')
+            return
+        finally:
+            connection.close()
+        # Changes recorded after ``sequence`` are replayed by the next search
+        with self._lock:
+            self._index, self._epoch, self._sequence = index, epoch, sequence
+            self._built_at = time.monotonic()
+
+    def _catch_up(self, sequence):
+        """Apply changes up to ``sequence``; False when the index has to be rebuilt instead."""
+        if sequence - self._sequence > settings.SEARCH_INDEX_MAX_REPLAY:
+            return False
+        keys = [CHANGE_KEY.format(n) for n in range(self._sequence + 1, sequence + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+
+        changed = {CUSTOMER: set(), CUSTOMER_USER: set(), VEHICLE: set()}
+        for kind, pk in changes.values():
+            changed[kind].add(pk)
+        if changed[CUSTOMER] or changed[CUSTOMER_USER]:
+            rows = list(Customer.objects.filter(
+                Q(pk__in=changed[CUSTOMER]) | Q(user_id__in=changed[CUSTOMER_USER])
+            ).values(*CUSTOMER_FIELDS))
+            for pk in changed[CUSTOMER] - {row['id'] for row in rows}:
+                self._index.remove(CUSTOMER, pk)
+            for row in rows:
+                self._index.put(*customer_document(row))
+        if changed[VEHICLE]:
+            rows = list(Vehicle.objects.filter(pk__in=changed[VEHICLE]).values(*VEHICLE_FIELDS))
+            for pk in changed[VEHICLE] - {row['id'] for row in rows}:
+                self._index.remove(VEHICLE, pk)
+            for row in rows:
+                self._index.put(*vehicle_document(row))
+        self._sequence = sequence
+        return True
+
+
+search_index = SearchIndex()
@@ -1,11 +1,112 @@
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import User, Customer, Vehicle, Service, Booking, Invoice
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from .authentication import get_user_state
+from .models import User, Customer, Vehicle, Service, Booking, Invoice, normalize_plate
+from .revocation import token_revocations
+
+# -------------------
+# Sparse fieldsets / expansion
+# -------------------
+def parse_field_tree(value):
+    """Turn ``"id,customer.phone,customer.user.username"`` into nested dicts."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Lets GET requests shape the response with ``?fields=`` and ``?expand=``.
+
+    Without either parameter nothing changes: every nested object is
+    embedded as before. Once one is sent the response is compact: nested
+    objects become their id unless named in ``expand`` (dotted paths reach
+    deeper, e.g. ``expand=vehicle.customer``), and ``fields`` keeps only the
+    listed fields at each level (``fields=id,customer.phone`` also expands
+    customer). queryset_plan() reports the joins and columns the resulting
+    shape reads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get('request')
+        self.shaped = False
+        if request is not None and request.method == 'GET':
+            params = request.query_params
+            if 'fields' in params or 'expand' in params:
+                self.apply_shape(parse_field_tree(params.get('fields')), parse_field_tree(params.get('expand')))
+
+    def apply_shape(self, fields, expand):
+        self.shaped = True
+        if fields:
+            # Write-only fields never render, and subclasses may still configure them
+            for name, field in list(self.fields.items()):
+                if name not in fields and not field.write_only:
+                    self.fields.pop(name)
+
+        for name, field in list(self.fields.items()):
+            if not isinstance(field, serializers.BaseSerializer):
+                continue
+            if name in expand or fields.get(name):
+                field.apply_shape(fields.get(name, {}), expand.get(name, {}))
+            else:
+                # The FK column already holds the id, so this never touches the related row
+                kwargs = {} if field.source == name else {'source': field.source}
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+
+    def queryset_plan(self, prefix=''):
+        """Return ``(select_related paths, only() fields)`` for the current fields."""
+        related, only = [], []
+        for field in self.fields.values():
+            if field.write_only or field.source == '*':
+                continue
+            attrs = field.source.split('.')
+            path = prefix + '__'.join(attrs)
+
+            if isinstance(field, DynamicFieldsMixin):
+                nested_related, nested_only = field.queryset_plan(path + '__')
+                related += [path, *nested_related]
+                only += [path, *nested_only]
+                continue
+
+            # Walk dotted sources such as user.username through their relations
+            model = self.Meta.model
+            for depth, attr in enumerate(attrs[:-1], start=1):
+                relation = prefix + '__'.join(attrs[:depth])
+                related.append(relation)
+                only.append(relation)
+                model = model._meta.get_field(attr).related_model
+
+            try:
+                model_field = model._meta.get_field(attrs[-1])
+            except FieldDoesNotExist:
+                continue
+            if model_field.is_relation and not model_field.concrete:
+                # Reverse one-to-one (booking.invoice): join it instead of a query per row
+                related.append(path)
+                only.append(f'{path}__{model_field.related_model._meta.pk.name}')
+            else:
+                only.append(path)
+
+        return list(dict.fromkeys(related)), list(dict.fromkeys(only))
 
 # -------------------
 # User Serializer
 # -------------------
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -28,7 +129,7 @@ class UserSerializer(serializers.ModelSerializer):
 # -------------------
 # Customer Serializer
 # -------------------
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     username = serializers.CharField(source='user.username', required=False)
@@ -91,7 +192,7 @@ class CustomerSerializer(serializers.ModelSerializer):
 # -------------------
 # Vehicle Serializer
 # -------------------
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(),
@@ -117,14 +218,45 @@ class VehicleSerializer(serializers.ModelSerializer):
 
     def validate_customer(self, customer):
         request = self.context['request']
-        if request.user.role != 'ADMIN' and customer.user != request.user:
+        if request.user.role != 'ADMIN' and customer.user_id != request.user.id:
             raise serializers.ValidationError("You do not own this customer.")
         return customer
 
+    def validate_vehicle_number(self, value):
+        plate = normalize_plate(value)
+        if not plate:
+            raise serializers.ValidationError("Enter a vehicle number.")
+        others = Vehicle.objects.filter(plate_normalized=plate)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError(self.duplicate_plate_message())
+        return value
+
+    def duplicate_plate_message(self):
+        # Customers get a message that does not confirm another customer's plate
+        if self.context['request'].user.role == 'ADMIN':
+            return "A vehicle with this number already exists."
+        return "This vehicle number can not be registered. Contact the workshop if the vehicle is yours."
+
+# -------------------
+# Vehicle Import Row Serializer
+# -------------------
+class VehicleImportRowSerializer(serializers.Serializer):
+    """One row of a bulk vehicle import (core.imports); plates are deduplicated per chunk."""
+    vehicle_number = serializers.CharField(max_length=50)
+    vehicle_type = serializers.CharField(max_length=50)
+    customer_id = serializers.IntegerField(required=False)
+
+    def validate_vehicle_number(self, value):
+        if not normalize_plate(value):
+            raise serializers.ValidationError("Enter a vehicle number.")
+        return value
+
 # -------------------
 # Service Serializer
 # -------------------
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Service
         fields = [
@@ -132,6 +264,7 @@ class ServiceSerializer(serializers.ModelSerializer):
             'service_name',
             'description',
             'price',
+            'duration_minutes',
         ]
         read_only_fields = [
             'id',
@@ -147,7 +280,7 @@ class ServiceSerializer(serializers.ModelSerializer):
 # -------------------
 # Booking Serializer
 # -------------------
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     service = ServiceSerializer(read_only=True)
     vehicle = VehicleSerializer(read_only=True)
@@ -205,7 +338,7 @@ class BookingSerializer(serializers.ModelSerializer):
             if customer_id and vehicle.customer_id != int(customer_id):
                 raise serializers.ValidationError("Vehicle does not belong to the selected customer.")
         else:
-            if vehicle.customer.user != request.user:
+            if vehicle.customer.user_id != request.user.id:
                 raise serializers.ValidationError("You do not own this vehicle.")
         return vehicle
 
@@ -244,13 +377,13 @@ class BookingSerializer(serializers.ModelSerializer):
             if 'customer' not in validated_data:
                 raise serializers.ValidationError({"customer_id": "Customer is required for admin bookings."})
         else:
-            validated_data['customer'] = Customer.objects.get(user=request.user)
+            validated_data['customer'] = Customer.objects.get(user_id=request.user.id)
         return super().create(validated_data)
 
 # -------------------
 # Invoice Serializer
 # -------------------
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     booking = BookingSerializer(read_only=True)
     booking_id = serializers.PrimaryKeyRelatedField(
         queryset=Booking.objects.none(),
@@ -283,12 +416,17 @@ class InvoiceSerializer(serializers.ModelSerializer):
 
         if request and request.user.is_authenticated:
             self.fields['booking_id'].queryset = Booking.objects.filter(
-                customer__user=request.user
+                customer__user_id=request.user.id
             )
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         from decimal import Decimal
-        
+        from .services import InvoiceService, ReportService
+
+        old_payment_status = instance.payment_status
+        old_total_amount = instance.total_amount
+
         # Update additional charges fields if provided
         if 'additional_charges' in validated_data:
             instance.additional_charges = validated_data.get('additional_charges', instance.additional_charges)
@@ -306,6 +444,9 @@ class InvoiceSerializer(serializers.ModelSerializer):
             instance.payment_status = validated_data.get('payment_status', instance.payment_status)
         
         instance.save()
+        ReportService.invoice_changed(instance, old_payment_status, old_total_amount)
+        if instance.payment_status == 'PAID' and old_payment_status != 'PAID':
+            InvoiceService.pregenerate_invoice_pdf(instance)
         return instance
 
 # -------------------
@@ -313,20 +454,25 @@ class InvoiceSerializer(serializers.ModelSerializer):
 # -------------------
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
-        # Check if user exists and is inactive before standard validation
-        from .models import User
-        username = attrs.get('username')
-        try:
-            user = User.objects.get(username=username)
-            if not user.is_active:
-                raise serializers.ValidationError({
-                    'detail': 'Your account has been suspended. Please contact support.',
-                    'code': 'user_suspended'
-                })
-        except User.DoesNotExist:
-            pass  # Let the standard validation handle this
-        
-        return super().validate(attrs)
+        # core.backends.LoginBackend loads the user (and customer) once and
+        # returns suspended accounts, so suspension is reported from that row
+        self.user = authenticate(
+            self.context.get('request'),
+            **{self.username_field: attrs[self.username_field], 'password': attrs['password']},
+        )
+        if self.user is not None and not self.user.is_active:
+            raise serializers.ValidationError({
+                'detail': 'Your account has been suspended. Please contact support.',
+                'code': 'user_suspended'
+            })
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        refresh = self.get_token(self.user)
+        data = {'refresh': str(refresh), 'access': str(refresh.access_token)}
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
 
     @classmethod
     def get_token(cls, user):
@@ -334,9 +480,53 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         # Add custom claims
         token['role'] = user.role  # your custom User model has role
+        # Lets ClaimsJWTAuthentication resolve request.user.customer without a user query
+        token['customer_id'] = user.customer.id if hasattr(user, 'customer') else None
 
         return token
 
+# -------------------
+# Token Refresh Serializer
+# -------------------
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh with rotation backed by core.revocation instead of the
+    token_blacklist app: the account state comes from the ClaimsJWTAuthentication
+    cache and revoked tokens are screened by the in-memory filter, so with a
+    shared cache a normal refresh runs a single INSERT (revoking the
+    rotated-out token); without one it also runs one revocation SELECT.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        try:
+            user_id = User._meta.pk.to_python(refresh[api_settings.USER_ID_CLAIM])
+        except (KeyError, DjangoValidationError):
+            raise TokenError('Token contained no recognizable user identification')
+        state = get_user_state(user_id)
+        if state is None or not state[0]:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        jti = refresh[api_settings.JTI_CLAIM]
+        if token_revocations.is_revoked(jti, user_id, refresh.get('iat')):
+            raise TokenError('Token is blacklisted')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                # Fails when another request already rotated this token
+                if not token_revocations.revoke(jti, user_id, datetime_from_epoch(refresh['exp'])):
+                    raise TokenError('Token is blacklisted')
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
+
 # -------------------
 # Customer Registration Serializer
 # -------------------
@@ -394,3 +584,119 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
         except Exception as e:
             # Fallback for unexpected errors during creation
             raise serializers.ValidationError({"error": str(e)})
+
+# -------------------
+# Customer Import Row Serializer
+# -------------------
+class CustomerImportRowSerializer(serializers.Serializer):
+    """
+    One row of a bulk customer import (core.imports). Same fields and rules as
+    CustomerRegistrationSerializer; duplicate usernames and emails are checked
+    per chunk by the importer instead of one query per row.
+    """
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(max_length=128)
+    first_name = serializers.CharField(max_length=150, required=False, default='')
+    last_name = serializers.CharField(max_length=150, required=False, default='')
+    email = serializers.EmailField()
+    phone = serializers.CharField(max_length=20, required=False)
+
+    validate_phone = CustomerRegistrationSerializer.validate_phone
+
+    def validate(self, attrs):
+        attrs['username'] = User.normalize_username(attrs['username'])
+        attrs['email'] = User.objects.normalize_email(attrs['email'])
+        return attrs
+
+# -------------------
+# Report Query Serializer
+# -------------------
+class ReportQuerySerializer(serializers.Serializer):
+    PERIOD_CHOICES = ('day', 'month', 'year')
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=PERIOD_CHOICES, default='day')
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'date_to cannot be before date_from.'})
+        return attrs
+
+
+# -------------------
+# Booking Availability Serializers
+# -------------------
+class AvailabilityQuerySerializer(serializers.Serializer):
+    # ``from`` is a Python keyword, so the fields are declared here
+    def get_fields(self):
+        return {
+            'from': serializers.DateField(),
+            'to': serializers.DateField(),
+            'service': serializers.PrimaryKeyRelatedField(queryset=Service.objects.all(), required=False),
+        }
+
+    def validate(self, attrs):
+        if attrs['to'] < attrs['from']:
+            raise serializers.ValidationError({'to': 'to cannot be before from.'})
+        if (attrs['to'] - attrs['from']).days >= settings.AVAILABILITY_MAX_DAYS:
+            raise serializers.ValidationError(
+                {'to': f'At most {settings.AVAILABILITY_MAX_DAYS} days per request.'}
+            )
+        return attrs
+
+
+class CapacityOverrideSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    # null goes back to the default capacity for the date
+    capacity_minutes = serializers.IntegerField(min_value=0, allow_null=True)
+
+
+class AutoScheduleSerializer(serializers.Serializer):
+    # Defaults: today and SCHEDULER_HORIZON_DAYS
+    start_date = serializers.DateField(required=False)
+    days = serializers.IntegerField(min_value=1, max_value=settings.AVAILABILITY_MAX_DAYS, required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+
+# -------------------
+# Booking Bulk Transition Serializer
+# -------------------
+class BulkTransitionItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    scheduled_date = serializers.DateField(required=False, allow_null=True)
+
+
+class BookingBulkTransitionSerializer(serializers.Serializer):
+    MAX_ITEMS = 500
+
+    status = serializers.ChoiceField(choices=Booking.STATUS_CHOICES)
+    # Either plain ids sharing one scheduled_date, or items with their own date
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    items = BulkTransitionItemSerializer(many=True, required=False)
+    scheduled_date = serializers.DateField(required=False)
+
+    def validate_status(self, value):
+        from .services import BookingService
+
+        if value not in BookingService.TRANSITIONS:
+            raise serializers.ValidationError(f'Bookings can not be moved to {value}.')
+        return value
+
+    def validate(self, attrs):
+        default_date = attrs.get('scheduled_date')
+        items = [(booking_id, default_date) for booking_id in attrs.get('ids', [])]
+        items += [
+            (item['id'], item.get('scheduled_date') or default_date)
+            for item in attrs.get('items', [])
+        ]
+
+        if not items:
+            raise serializers.ValidationError('Provide ids or items.')
+        if len(items) > self.MAX_ITEMS:
+            raise serializers.ValidationError(f'At most {self.MAX_ITEMS} bookings per request.')
+        if len({booking_id for booking_id, _ in items}) != len(items):
+            raise serializers.ValidationError('Each booking may appear only once.')
+
+        attrs['items'] = items
+        return attrs
@@ -0,0 +1,81 @@
+from rest_framework.response import Response
+
+from .serializers import (
+    UserSerializer, CustomerSerializer, VehicleSerializer,
+    ServiceSerializer, BookingSerializer,
+)
+
+SIDELOAD_PARAM = 'sideload'
+
+# included key -> serializer used (in its compact, ids-only form) for those objects
+SIDELOAD_SERIALIZERS = {
+    'bookings': BookingSerializer,
+    'customers': CustomerSerializer,
+    'vehicles': VehicleSerializer,
+    'services': ServiceSerializer,
+    'users': UserSerializer,
+}
+
+
+def sideload_requested(request):
+    return request.query_params.get(SIDELOAD_PARAM, '').lower() == 'true'
+
+
+def _follow(obj, path):
+    for attr in path.split('__'):
+        obj = getattr(obj, attr, None)
+        if obj is None:
+            return None
+    return obj
+
+
+# -------------------
+# Side-loaded list responses
+# -------------------
+class SideloadListMixin:
+    """
+    ``?sideload=true`` on a list returns rows with foreign keys as ids plus
+    one ``included`` map holding each related object once, e.g.
+    ``{"results": [...], "included": {"customers": {"3": {...}}, ...}}``.
+
+    The view declares ``sideload_paths``: included key -> relation paths
+    (as used by select_related) leading to those objects from a row. The
+    related rows come from the list query's joins, so no extra queries
+    are made; only the serialization is deduplicated.
+    """
+    sideload_paths = {}
+
+    def list(self, request, *args, **kwargs):
+        if not sideload_requested(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(page if page is not None else queryset)
+
+        serializer = self.get_serializer(rows, many=True)
+        if not serializer.child.shaped:
+            serializer.child.apply_shape({}, {})
+
+        data = {'results': serializer.data, 'included': self.get_included(rows)}
+        if page is not None:
+            response = self.get_paginated_response(data['results'])
+            response.data['included'] = data['included']
+            return response
+        return Response(data)
+
+    def get_included(self, rows):
+        included = {}
+        context = self.get_serializer_context()
+        for key, paths in self.sideload_paths.items():
+            objects = {}
+            for row in rows:
+                for path in paths:
+                    obj = _follow(row, path)
+                    if obj is not None:
+                        objects.setdefault(obj.pk, obj)
+
+            serializer = SIDELOAD_SERIALIZERS[key](list(objects.values()), many=True, context=context)
+            serializer.child.apply_shape({}, {})
+            included[key] = {item['id']: item for item in serializer.data}
+        return included
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user_state
+from .catalog import service_catalog
+from .models import Customer, Service, User, Vehicle
+from .search import CUSTOMER, CUSTOMER_USER, VEHICLE, search_index
+
+
+# -------------------
+# Service catalog invalidation
+# -------------------
+@receiver([post_save, post_delete], sender=Service)
+def invalidate_service_catalog(sender, **kwargs):
+    # After commit, so no process can recompute the stamp from the old rows
+    transaction.on_commit(service_catalog.invalidate)
+
+
+# -------------------
+# Cached account state for ClaimsJWTAuthentication
+# -------------------
+@receiver([post_save, post_delete], sender=User)
+def forget_changed_user_state(sender, instance, **kwargs):
+    # Any save (suspension, role change, admin site, shell) is re-read on the
+    # account's next request; dropped rather than rewritten from ``instance``,
+    # which may hold stale values for the fields it did not save
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user_state(user_id))
+
+
+# -------------------
+# Quick search index
+# -------------------
+SEARCH_KINDS = {Customer: CUSTOMER, User: CUSTOMER_USER, Vehicle: VEHICLE}
+
+
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=Vehicle)
+def record_search_change(sender, instance, update_fields=None, **kwargs):
+    # Logging in only stamps last_login, which the index does not hold
+    if update_fields == {'last_login'}:
+        return
+    kind, pk = SEARCH_KINDS[sender], instance.pk
+    transaction.on_commit(lambda: search_index.record(kind, pk))
@@ -1,3 +1,1129 @@
-from django.test import TestCase
+import csv
+import json
+import random
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import BytesIO
+from zipfile import ZipFile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import User, Customer, Vehicle, Service, Booking, Invoice, DailyOccupancy, RevokedToken
+from .services import BookingService, TransitionConflict
+
+
+def create_bookings(count, start=0):
+    """``count`` customers with a vehicle and a booking each; every other booking is invoiced."""
+    service = Service.objects.create(service_name=f'Service {start}', price='100.00')
+    for i in range(start, start + count):
+        user = User.objects.create_user(
+            username=f'customer{i}', password='password', email=f'customer{i}@example.com',
+            first_name='First', last_name='Last',
+        )
+        customer = Customer.objects.create(user=user, phone='0771234567')
+        vehicle = Vehicle.objects.create(customer=customer, vehicle_number=f'AB-{i:04d}', vehicle_type='car')
+        booking = Booking.objects.create(
+            customer=customer, service=service, vehicle=vehicle,
+            preferred_date=timezone.localdate() + timedelta(days=1),
+        )
+        if i % 2:
+            Invoice.objects.create(booking=booking, total_amount='100.00', payment_status='PENDING')
+
+
+@contextmanager
+def shared_cache():
+    # Behave as with REDIS_URL: the tests' LocMemCache stands in for a shared cache
+    with mock.patch('core.authentication.cache_is_shared', return_value=True), \
+            mock.patch('core.revocation.cache_is_shared', return_value=True):
+        yield
+
+
+class AdminAPITestCase(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='password', role='ADMIN')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+
+# -------------------
+# List query counts
+# -------------------
+class ListQueryCountTests(AdminAPITestCase):
+    """Every list endpoint runs the same number of queries however many rows it returns."""
+
+    LISTS = (
+        ('/api/customers/', 1),
+        ('/api/vehicles/', 1),
+        ('/api/bookings/', 1),
+        ('/api/invoices/', 1),
+    )
+
+    def test_query_count_is_constant(self):
+        for size, start in ((3, 0), (12, 3)):
+            create_bookings(size, start)
+            for url, queries in self.LISTS:
+                with self.subTest(url=url, rows=size):
+                    with self.assertNumQueries(queries):
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+# -------------------
+# Keyset pagination
+# -------------------
+class CursorPaginationTests(AdminAPITestCase):
+    """Walking the pages returns every row once, even with equal timestamps and new rows."""
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_pages_are_stable(self):
+        create_bookings(5)
+        # Same created_at everywhere: only the id tie-breaker orders the rows
+        Booking.objects.update(created_at=timezone.now())
+        expected = list(Booking.objects.order_by('-id').values_list('id', flat=True))
+
+        first_page = self.client.get('/api/bookings/?page_size=2').data
+        # Newer than the cursor, so it is not returned further down
+        first = Booking.objects.get(pk=expected[0])
+        added = Booking.objects.create(
+            customer=first.customer, service=first.service, vehicle=first.vehicle,
+            preferred_date=first.preferred_date,
+        )
+        pages = [[item['id'] for item in first_page['results']], *self.walk(first_page['next'])]
+        self.assertEqual(sum(pages, []), expected)
+
+        # Walking back from the second page reaches the new row last
+        second_page = self.client.get(first_page['next']).data
+        self.assertEqual(self.walk(second_page['previous'], 'previous'), [expected[:2], [added.pk]])
+
+    def test_ordering_on_a_nullable_field(self):
+        create_bookings(5)
+        bookings = list(Booking.objects.order_by('id'))
+        for days, booking in zip((3, 1), bookings[1:3]):
+            Booking.objects.filter(pk=booking.pk).update(scheduled_date=SCHEDULED_DATE + timedelta(days=days))
+
+        pages = self.walk('/api/bookings/?page_size=2&ordering=scheduled_date')
+        # NULLs first, then by date, with id breaking the ties
+        self.assertEqual(
+            sum(pages, []), [bookings[0].pk, bookings[3].pk, bookings[4].pk, bookings[2].pk, bookings[1].pk],
+        )
+
+    def test_plain_list_without_pagination_params(self):
+        create_bookings(3)
+        response = self.client.get('/api/bookings/')
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+
+# -------------------
+# List filtering, search and ordering
+# -------------------
+class ListFilterTests(AdminAPITestCase):
+    """Query parameters narrow and order the lists in SQL; bad values are a 400."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(4)
+        self.bookings = list(Booking.objects.order_by('id'))
+        Booking.objects.filter(pk=self.bookings[1].pk).update(status='APPROVED', scheduled_date=SCHEDULED_DATE)
+        Booking.objects.filter(pk=self.bookings[2].pk).update(status='REJECTED')
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_filters(self):
+        first, second, third, _ = self.bookings
+        self.assertCountEqual(
+            self.ids('/api/bookings/?status=APPROVED,REJECTED'), [second.pk, third.pk],
+        )
+        self.assertEqual(self.ids(f'/api/bookings/?customer={first.customer_id}'), [first.pk])
+        self.assertEqual(self.ids(f'/api/bookings/?scheduled_date_from={SCHEDULED_DATE}'), [second.pk])
+        self.assertEqual(len(self.ids('/api/invoices/?payment_status=PENDING&booking_status=APPROVED')), 1)
+
+    def test_invalid_value_is_a_400(self):
+        response = self.client.get('/api/bookings/?preferred_date_from=soon')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('preferred_date_from', response.data)
+
+    def test_search_and_ordering(self):
+        self.assertEqual(
+            [item['vehicle_number'] for item in self.client.get('/api/vehicles/?search=AB-0002').data],
+            ['AB-0002'],
+        )
+        self.assertEqual(
+            [item['vehicle_number'] for item in self.client.get('/api/vehicles/?ordering=-vehicle_number').data],
+            ['AB-0003', 'AB-0002', 'AB-0001', 'AB-0000'],
+        )
+
+
+# -------------------
+# Sparse fieldsets and expansion
+# -------------------
+class ShapedResponseTests(AdminAPITestCase):
+    """?fields= trims each level and ?expand= picks which relations are nested rather than ids."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(3)
+
+    def test_fields_keep_only_the_listed_paths(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/bookings/?fields=id,status,customer.phone')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [dict(item) for item in response.data],
+            [{'id': booking.id, 'status': 'PENDING', 'customer': {'phone': '0771234567'}}
+             for booking in Booking.objects.order_by('id')],
+        )
+
+    def test_unexpanded_relations_are_ids(self):
+        booking = Booking.objects.order_by('id').first()
+        response = self.client.get(f'/api/bookings/{booking.id}/?expand=vehicle')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['service'], response.data['customer']), (booking.service_id, booking.customer_id))
+        self.assertEqual(response.data['vehicle']['vehicle_number'], 'AB-0000')
+        self.assertEqual(response.data['vehicle']['customer'], booking.customer_id)
+
+        response = self.client.get(f'/api/bookings/{booking.id}/?expand=vehicle.customer')
+        self.assertEqual(response.data['vehicle']['customer']['username'], 'customer0')
+
+
+# -------------------
+# Side-loaded lists
+# -------------------
+class SideloadTests(AdminAPITestCase):
+    """?sideload=true lists rows with ids and every related object once, from the list query."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(3)
+
+    def test_related_objects_are_included_once(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/bookings/?sideload=true')
+        self.assertEqual(response.status_code, 200)
+        results, included = response.data['results'], response.data['included']
+
+        service = Service.objects.get()
+        self.assertEqual({row['service'] for row in results}, {service.id})
+        self.assertEqual(list(included['services']), [service.id])
+        self.assertEqual(included['services'][service.id]['service_name'], service.service_name)
+        self.assertEqual(set(included['customers']), {row['customer'] for row in results})
+        self.assertEqual(set(included['vehicles']), {row['vehicle'] for row in results})
+        # Nested objects are ids too, resolved from the other maps
+        for vehicle in included['vehicles'].values():
+            self.assertIn(vehicle['customer'], included['customers'])
+
+    def test_paginated_invoices(self):
+        create_bookings(4, start=3)
+        response = self.client.get('/api/invoices/?sideload=true&page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(
+            set(response.data['included']['bookings']), {row['booking'] for row in response.data['results']},
+        )
+
+
+# -------------------
+# Service catalog
+# -------------------
+class ServiceCatalogTests(AdminAPITestCase):
+    """Catalog reads are answered from the versioned copy, with a 304 until a service changes."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.service = Service.objects.create(service_name='Oil change', price='40.00')
+
+    def test_unchanged_catalog_is_a_304_without_queries(self):
+        response = self.client.get('/api/services/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/services/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # The first read of an id builds the by-id copy, so an unknown id is still a 404
+        url = f'/api/services/{self.service.id}/'
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/services/9999/').status_code, 404)
+
+    def test_saving_a_service_changes_the_version(self):
+        etag = self.client.get('/api/services/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/services/{self.service.id}/', {'price': '45.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/services/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([service['price'] for service in response.data], ['45.00'])
+
+        # Saves outside the API (admin site, shell) invalidate as well
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(service_name='Tyre rotation', price='20.00')
+        response = self.client.get('/api/services/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.data)), (200, 2))
+
+
+# -------------------
+# Dashboard statistics
+# -------------------
+class StatsTests(AdminAPITestCase):
+    """The stats endpoints aggregate in one query and honour the list filters."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(4)
+        bookings = list(Booking.objects.order_by('id'))
+        Booking.objects.filter(pk=bookings[0].pk).update(status='APPROVED', scheduled_date=timezone.localdate())
+        Booking.objects.filter(pk=bookings[1].pk).update(status='REJECTED')
+        Invoice.objects.filter(booking=bookings[3]).update(payment_status='PAID', total_amount='250.00')
+
+    def test_booking_stats(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/bookings/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(
+            response.data['by_status'],
+            {'PENDING': 2, 'APPROVED': 1, 'REJECTED': 1, 'CANCELLED': 0, 'IN_PROGRESS': 0, 'COMPLETED': 0},
+        )
+        self.assertEqual(response.data['today']['scheduled'], 1)
+
+        response = self.client.get('/api/bookings/stats/?status=PENDING')
+        self.assertEqual((response.data['total'], response.data['today']['scheduled']), (2, 0))
+
+    def test_booking_stats_are_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='customer0'))
+        self.assertEqual(client.get('/api/bookings/stats/').status_code, 403)
+
+    def test_invoice_stats(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/invoices/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [response.data[key] for key in ('count', 'total_amount', 'paid_amount', 'pending_amount')],
+            [2, '350.00', '250.00', '100.00'],
+        )
+
+        # A customer's figures only cover their own invoices
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='customer1'))
+        response = client.get('/api/invoices/stats/')
+        self.assertEqual((response.data['count'], response.data['total_amount']), (1, '100.00'))
+
+
+# -------------------
+# Streaming CSV / JSON Lines exports
+# -------------------
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(AdminAPITestCase):
+    """Exports stream every matching row, in id order, across several keyset chunks."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(5)
+        self.ids = list(Booking.objects.order_by('id').values_list('id', flat=True))
+        Booking.objects.filter(pk__in=self.ids[:2]).update(status='APPROVED', scheduled_date=SCHEDULED_DATE)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('UTF-8')
+
+    def test_csv_has_a_row_per_booking(self):
+        rows = list(csv.DictReader(self.export('/api/bookings/export/').splitlines()))
+        self.assertEqual([int(row['booking_id']) for row in rows], self.ids)
+        self.assertEqual(rows[0]['vehicle_number'], 'AB-0000')
+        self.assertEqual((rows[0]['scheduled_date'], rows[4]['scheduled_date']), (SCHEDULED_DATE.isoformat(), ''))
+
+    def test_list_filters_apply(self):
+        rows = list(csv.DictReader(self.export('/api/bookings/export/?status=APPROVED').splitlines()))
+        self.assertEqual([int(row['booking_id']) for row in rows], self.ids[:2])
+
+        lines = self.export('/api/invoices/export/?export_format=jsonl&booking_status=PENDING').splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['booking_id'] for record in records], [self.ids[3]])
+        self.assertEqual(records[0]['total_amount'], '100.00')
+
+    def test_unknown_format_is_a_400(self):
+        self.assertEqual(self.client.get('/api/bookings/export/?export_format=xlsx').status_code, 400)
+
+
+# -------------------
+# Bulk customer import
+# -------------------
+@override_settings(IMPORT_CHUNK_SIZE=2, CUSTOMER_IMPORT_HASH_WORKERS=0)
+class CustomerImportTests(AdminAPITestCase):
+    """Valid rows are created in chunks; every rejected row is reported with its line."""
+
+    CSV = (
+        'username,password,first_name,last_name,email,phone\n'
+        'alice,secret-1,Alice,Silva,alice@example.com,0711111111\n'
+        'bob,secret-2,Bob,Perera,bob@example.com,0722222222\n'
+        'alice,secret-3,Alice,Again,alice2@example.com,0733333333\n'
+        'customer0,secret-4,Taken,Name,taken@example.com,0744444444\n'
+        'carol,secret-5,Carol,Fernando,not-an-email,0755555555\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(1)
+
+    def upload(self, **data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('customers.csv', self.CSV.encode('UTF-8'), content_type='text/csv')
+        return self.client.post('/api/customers/import/', {'file': upload, **data}, format='multipart')
+
+    def test_import_reports_rejected_rows(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [response.data[key] for key in ('rows', 'created', 'failed')], [5, 2, 3],
+        )
+        self.assertEqual(
+            [(error['line'], sorted(error['errors'])) for error in response.data['errors']],
+            [(4, ['username']), (5, ['username']), (6, ['email'])],
+        )
+
+        alice = Customer.objects.select_related('user').get(user__username='alice')
+        self.assertEqual((alice.user.role, alice.phone, alice.user.last_name), ('CUSTOMER', '0711111111', 'Silva'))
+        self.assertTrue(alice.user.check_password('secret-1'))
+        self.assertTrue(Customer.objects.filter(user__username='bob').exists())
+
+    def test_dry_run_creates_nothing(self):
+        response = self.upload(dry_run='true')
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        self.assertFalse(User.objects.filter(username__in=['alice', 'bob']).exists())
+
+
+# -------------------
+# Invoice PDF engines
+# -------------------
+def pdf_words(pdf):
+    # Layout-independent view of a PDF: the multiset of words on its pages
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(pdf))
+    text = ' '.join(page.extract_text() or '' for page in reader.pages)
+    return Counter(text.split()), len(reader.pages)
+
+
+class InvoicePdfEngineTests(TestCase):
+    """The native ReportLab layout shows the same text as the xhtml2pdf template."""
+
+    def test_engines_render_the_same_text(self):
+        from .pdf import render_payload, render_pdf
+        from .views import INVOICE_RELATED
+
+        create_bookings(4)
+        Invoice.objects.filter(pk=Invoice.objects.order_by('id').first().pk).update(
+            additional_charges='250.00', additional_charges_description='Replaced the front brake pads',
+        )
+        for invoice in Invoice.objects.select_related(*INVOICE_RELATED):
+            with self.subTest(invoice=invoice.id):
+                reference = render_pdf('xhtml2pdf', render_payload(invoice, 'xhtml2pdf'))
+                native = render_pdf('reportlab', render_payload(invoice, 'reportlab'))
+                self.assertEqual(pdf_words(native), pdf_words(reference))
+
+    def test_native_render_leaves_reportlab_settings_alone(self):
+        from reportlab import rl_config
+
+        from .pdf import render_payload, render_pdf
+
+        create_bookings(2)
+        before = rl_config.useA85
+        render_pdf('reportlab', render_payload(Invoice.objects.get(), 'reportlab'))
+        self.assertEqual(rl_config.useA85, before)
+
+    def test_long_items_continue_on_the_next_page(self):
+        from .pdf import render_payload, render_pdf
+
+        create_bookings(2)
+        description = ' '.join(f'step{i}' for i in range(600))
+        charges = ' '.join(f'part{i}' for i in range(300))
+        Service.objects.update(description=description)
+        Invoice.objects.update(additional_charges='250.00', additional_charges_description=charges)
+
+        words, pages = pdf_words(render_pdf('reportlab', render_payload(Invoice.objects.get(), 'reportlab')))
+        self.assertGreater(pages, 1)
+        for word in description.split() + charges.split():
+            self.assertEqual(words[word], 1, word)
+        for word in ('Authorized', 'Signature', 'Cash', 'Card'):
+            self.assertIn(word, words)
+
+
+class InvoicePdfPregenerateTests(TestCase):
+    """Marking an invoice as paid queues its PDF, and never fails because of it."""
+
+    def setUp(self):
+        from .services import InvoiceService
+
+        create_bookings(2)
+        self.invoice = Invoice.objects.get()
+        self.mark_as_paid = InvoiceService.mark_as_paid
+
+    @override_settings(INVOICE_PDF_PREGENERATE=True, INVOICE_PDF_WORKERS=2)
+    def test_a_failing_submit_leaves_the_invoice_paid(self):
+        from .pdf import pdf_render_pool
+
+        with mock.patch.object(pdf_render_pool, 'submit', side_effect=OSError('store unavailable')) as submit:
+            with self.assertLogs('core.services', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                self.mark_as_paid(self.invoice)
+        submit.assert_called_once()
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.payment_status, 'PAID')
+
+    @override_settings(INVOICE_PDF_PREGENERATE=True, INVOICE_PDF_WORKERS=0)
+    def test_no_inline_render_without_workers(self):
+        from .pdf import pdf_render_pool
+
+        with mock.patch.object(pdf_render_pool, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.mark_as_paid(self.invoice)
+        self.assertEqual(callbacks, [])
+        submit.assert_not_called()
+
+
+class InvoiceZipExportTests(AdminAPITestCase):
+    """The ZIP export reads the invoices in keyset chunks and includes every one of them."""
+
+    def test_every_invoice_is_in_the_archive(self):
+        from .exports import iter_keyset
+
+        create_bookings(6)
+        store = tempfile.TemporaryDirectory()
+        self.addCleanup(store.cleanup)
+        settings = override_settings(
+            INVOICE_PDF_STORE_DIR=store.name, INVOICE_PDF_WORKERS=0, INVOICE_PDF_ENGINE='reportlab',
+        )
+        with settings, mock.patch('core.views.iter_keyset', wraps=iter_keyset) as chunks:
+            response = self.client.get('/api/invoices/export_pdfs/')
+            archive = ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(chunks.call_args.kwargs['chunk_size'], 200)
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f'invoice_{pk}.pdf' for pk in Invoice.objects.values_list('id', flat=True)),
+        )
+
+    def test_keyset_chunks(self):
+        from .exports import iter_keyset
+
+        create_bookings(10)
+        # 5 invoices in chunks of 2: three queries, no row twice
+        with self.assertNumQueries(3):
+            ids = [invoice.id for invoice in iter_keyset(Invoice.objects.all(), chunk_size=2)]
+        self.assertEqual(ids, sorted(Invoice.objects.values_list('id', flat=True)))
+
+# -------------------
+# Booking transitions
+# -------------------
+SCHEDULED_DATE = date(2030, 1, 1)
+
+
+class BookingTransitionTests(TestCase):
+    """A transition applies once; a request holding a stale copy gets a TransitionConflict."""
+
+    def setUp(self):
+        create_bookings(1)
+        self.booking_id = Booking.objects.get().id
+
+    def stale_copies(self, n=2):
+        return [Booking.objects.select_related('service').get(pk=self.booking_id) for _ in range(n)]
+
+    def test_stale_copies_apply_each_transition_once(self):
+        phases = (
+            lambda booking: BookingService.approve_booking(booking, SCHEDULED_DATE),
+            BookingService.start_service,
+            BookingService.complete_service,
+        )
+        for transition in phases:
+            first, second = self.stale_copies()
+            transition(first)
+            with self.assertRaises(TransitionConflict):
+                transition(second)
+
+        self.assertEqual(Booking.objects.get(pk=self.booking_id).status, 'COMPLETED')
+        occupancy = DailyOccupancy.objects.get(date=SCHEDULED_DATE)
+        self.assertEqual((occupancy.booking_count, occupancy.booked_minutes), (1, 60))
+
+    def test_cancel_loses_to_a_concurrent_approval(self):
+        approver, canceller = self.stale_copies()
+        BookingService.approve_booking(approver, SCHEDULED_DATE)
+        with self.assertRaises(TransitionConflict):
+            BookingService.cancel_booking(canceller)
+        self.assertEqual(Booking.objects.get(pk=self.booking_id).status, 'APPROVED')
+
+
+class BulkTransitionAPITests(AdminAPITestCase):
+    """Bulk transitions apply what they can and report every other booking by id."""
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(3)
+        self.ids = list(Booking.objects.order_by('id').values_list('id', flat=True))
+        Booking.objects.filter(pk=self.ids[2]).update(status='REJECTED')
+
+    def test_partial_success(self):
+        response = self.client.post('/api/bookings/bulk_transition/', {
+            'status': 'APPROVED', 'ids': [*self.ids, 9999], 'scheduled_date': SCHEDULED_DATE,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['failed']), (2, 2))
+        self.assertEqual(
+            {result['id'] for result in response.data['results'] if not result['updated']}, {self.ids[2], 9999},
+        )
+
+        self.assertEqual(
+            list(Booking.objects.order_by('id').values_list('status', flat=True)), ['APPROVED', 'APPROVED', 'REJECTED'],
+        )
+        occupancy = DailyOccupancy.objects.get(date=SCHEDULED_DATE)
+        self.assertEqual((occupancy.booking_count, occupancy.booked_minutes), (2, 120))
+
+    def test_repeated_ids_are_rejected(self):
+        response = self.client.post('/api/bookings/bulk_transition/', {
+            'status': 'APPROVED', 'ids': [self.ids[0]], 'items': [{'id': self.ids[0]}],
+            'scheduled_date': SCHEDULED_DATE,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.filter(status='APPROVED').exists())
+
+
+class IdempotencyTests(AdminAPITestCase):
+    """A retried POST with the same Idempotency-Key gets the first response back instead of running again."""
+
+    SERVICE = {'service_name': 'Wheel alignment', 'price': '80.00'}
+
+    def setUp(self):
+        super().setUp()
+        caches['idempotency'].clear()
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_response(self):
+        first = self.post('/api/services/', self.SERVICE, 'create-1')
+        retry = self.post('/api/services/', self.SERVICE, 'create-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Service.objects.count(), 1)
+
+    def test_retried_transition_is_not_applied_twice(self):
+        create_bookings(1)
+        url = f'/api/bookings/{Booking.objects.get().pk}/approve/'
+        first = self.post(url, {'scheduled_date': SCHEDULED_DATE}, 'approve-1')
+        retry = self.post(url, {'scheduled_date': SCHEDULED_DATE}, 'approve-1')
+        self.assertEqual((first.status_code, retry.status_code), (200, 200))
+        self.assertEqual(DailyOccupancy.objects.get(date=SCHEDULED_DATE).booking_count, 1)
+
+    def test_key_reused_for_another_request_is_a_422(self):
+        self.post('/api/services/', self.SERVICE, 'create-1')
+        response = self.post('/api/services/', {**self.SERVICE, 'price': '90.00'}, 'create-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Service.objects.count(), 1)
+
+    def test_failed_request_releases_the_key(self):
+        response = self.post('/api/services/', {'service_name': 'Wheel alignment'}, 'create-1')
+        self.assertEqual(response.status_code, 400)
+        response = self.post('/api/services/', self.SERVICE, 'create-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+@override_settings(WORKSHOP_DAILY_CAPACITY_MINUTES=480, WORKSHOP_CLOSED_WEEKDAYS=[])
+class CapacityAPITests(AdminAPITestCase):
+    """Approvals reserve their day's minutes, a full day is refused, and rescheduling moves the reservation."""
+
+    NEXT_DATE = SCHEDULED_DATE + timedelta(days=1)
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(2)
+        self.first, self.second = Booking.objects.order_by('id')
+        # Room for one 60 minute booking on SCHEDULED_DATE
+        response = self.client.post(
+            '/api/bookings/capacity/', {'date': SCHEDULED_DATE, 'capacity_minutes': 60}, format='json',
+        )
+        self.assertEqual(response.data['available_minutes'], 60)
+
+    def approve(self, booking, day=SCHEDULED_DATE):
+        return self.client.post(f'/api/bookings/{booking.id}/approve/', {'scheduled_date': day}, format='json')
+
+    def availability(self):
+        response = self.client.get(
+            f'/api/bookings/availability/?from={SCHEDULED_DATE}&to={self.NEXT_DATE}&service={self.first.service_id}',
+        )
+        return [(day['booked_minutes'], day['fits']) for day in response.data]
+
+    def test_full_day_is_a_409(self):
+        self.assertEqual(self.approve(self.first).status_code, 200)
+        self.assertEqual(self.availability(), [(60, False), (0, True)])
+
+        response = self.approve(self.second)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('error', response.data)
+        self.assertEqual(Booking.objects.get(pk=self.second.pk).status, 'PENDING')
+        self.assertEqual(self.availability(), [(60, False), (0, True)])
+
+    def test_reschedule_moves_the_reservation(self):
+        self.approve(self.first)
+        self.approve(self.second, self.NEXT_DATE)
+
+        response = self.client.patch(
+            f'/api/bookings/{self.second.id}/', {'scheduled_date': SCHEDULED_DATE}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('scheduled_date', response.data)
+
+        response = self.client.patch(
+            f'/api/bookings/{self.first.id}/', {'scheduled_date': self.NEXT_DATE}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.availability(), [(0, True), (120, True)])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTransitionTests(TransactionTestCase):
+    """Threads racing through the same transitions apply each one exactly once (needs row locking)."""
+
+    THREADS = 4
+
+    def test_every_transition_applies_exactly_once(self):
+        create_bookings(5)
+        ids = list(Booking.objects.values_list('id', flat=True))
+        phases = (
+            lambda booking: BookingService.approve_booking(booking, SCHEDULED_DATE),
+            BookingService.start_service,
+            BookingService.complete_service,
+        )
+        for transition in phases:
+            wins = Counter(self.race(ids, transition))
+            self.assertEqual(wins, Counter(ids))
+        self.assertEqual(set(Booking.objects.values_list('status', flat=True)), {'COMPLETED'})
+
+    def race(self, ids, transition):
+        # Each thread loads its own copy of every booking, then all fire at once
+        barrier = threading.Barrier(self.THREADS)
+        wins, lock = [], threading.Lock()
+
+        def worker():
+            try:
+                bookings = list(Booking.objects.select_related('service').filter(pk__in=ids))
+                barrier.wait()
+                for booking in bookings:
+                    try:
+                        transition(booking)
+                    except TransitionConflict:
+                        continue
+                    with lock:
+                        wins.append(booking.id)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return wins
+
+
+# -------------------
+# values() list readers
+# -------------------
+class ValuesReaderTests(TestCase):
+    """The values() readers render byte-identical JSON to the serializers they stand in for."""
+
+    def setUp(self):
+        create_bookings(6)
+        bookings = list(Booking.objects.select_related('service').order_by('id'))
+        BookingService.approve_booking(bookings[0], SCHEDULED_DATE)
+        BookingService.reject_booking(bookings[1])
+        Booking.objects.filter(pk=bookings[2].pk).update(preferred_date=None)
+        Invoice.objects.filter(booking=bookings[1]).update(
+            additional_charges='12.50', additional_charges_description='Wiper blades', payment_status='PAID',
+        )
+        User.objects.filter(pk=bookings[3].customer.user_id).update(first_name='Zoë', email='')
+
+    def test_output_matches_the_serializers(self):
+        from .readers import get_reader
+        from .serializers import BookingSerializer, InvoiceSerializer
+        from .views import BOOKING_RELATED, INVOICE_RELATED
+
+        renderer = JSONRenderer()
+        for model, serializer_class, related in (
+            (Booking, BookingSerializer, BOOKING_RELATED),
+            (Invoice, InvoiceSerializer, INVOICE_RELATED),
+        ):
+            with self.subTest(serializer=serializer_class.__name__):
+                queryset = model.objects.order_by('-created_at', '-id')
+                reader = get_reader(serializer_class)
+                expected = renderer.render(serializer_class(queryset.select_related(*related), many=True).data)
+                self.assertEqual(renderer.render(reader.build_many(reader.values(queryset))), expected)
+
+
+# -------------------
+# Token login
+# -------------------
+class LoginTests(TestCase):
+    """A token login reads the user once and keeps the stored hash's work factor current."""
+
+    def setUp(self):
+        create_bookings(1)
+        self.user = User.objects.get(username='customer0')
+
+    def login(self):
+        from .serializers import MyTokenObtainPairSerializer
+
+        serializer = MyTokenObtainPairSerializer(data={'username': self.user.username, 'password': 'password'})
+        return serializer.is_valid()
+
+    def test_login_is_one_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.login())
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+
+    @override_settings(PASSWORD_HASHERS=['core.hashers.TunablePBKDF2PasswordHasher'])
+    def test_login_rewrites_an_outdated_hash(self):
+        from .hashers import TunablePBKDF2PasswordHasher
+
+        with mock.patch.object(TunablePBKDF2PasswordHasher, 'iterations', 1000):
+            hasher = get_hasher()
+            self.user.password = hasher.encode('password', hasher.salt(), 500)
+            self.user.save(update_fields=['password'])
+
+            self.assertTrue(self.login())
+        self.user.refresh_from_db(fields=['password'])
+        self.assertEqual(identify_hasher(self.user.password).decode(self.user.password)['iterations'], 1000)
+
+
+# -------------------
+# Automatic scheduling
+# -------------------
+class SchedulerTests(TestCase):
+    """Plans never overbook a day or start a job before its preferred day."""
+
+    def test_plan_respects_capacity_and_preferred_days(self):
+        from .scheduling import Scheduler
+
+        rng = random.Random(1)
+        days = 30
+        for load in (0.8, 1.1):
+            with self.subTest(load=load):
+                jobs = [(i, rng.randrange(-3, days), rng.choice((30, 60, 90, 120, 240))) for i in range(600)]
+                total = sum(minutes for _, _, minutes in jobs)
+                capacity = [0 if day % 7 == 6 else int(total / load / days * 7 / 6) for day in range(days)]
+                scheduler = Scheduler(capacity)
+                for job in jobs:
+                    scheduler.add(*job)
+                result = scheduler.run()
+
+                used = [0] * days
+                for key, preferred, minutes in jobs:
+                    day = result['assignments'].get(key)
+                    if day is not None:
+                        self.assertGreaterEqual(day, max(preferred, 0))
+                        used[day] += minutes
+                self.assertTrue(all(minutes <= cap for minutes, cap in zip(used, capacity)))
+                self.assertEqual(len(result['assignments']) + len(result['unscheduled']), len(jobs))
+                self.assertLessEqual(result['cost'], result['greedy_cost'])
+
+    def test_improvement_moves_short_jobs_aside(self):
+        from .scheduling import Scheduler
+
+        # Greedy fills day 0 with the short jobs and leaves the long one for
+        # day 5; the short jobs fit on days 1 and 2 instead
+        scheduler = Scheduler([60, 30, 30, 0, 0, 60])
+        scheduler.add('short-1', 0, 30)
+        scheduler.add('short-2', 0, 30)
+        scheduler.add('long', 0, 60)
+        result = scheduler.run()
+        self.assertEqual(result['assignments']['long'], 0)
+        self.assertEqual((result['greedy_cost'], result['cost']), (25, 5))
+
+
+@override_settings(WORKSHOP_DAILY_CAPACITY_MINUTES=960, WORKSHOP_CLOSED_WEEKDAYS=[])
+class AutoScheduleAPITests(AdminAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_bookings(5)
+        Service.objects.update(duration_minutes=300)
+
+    def test_dry_run_changes_nothing(self):
+        undated = Booking.objects.order_by('id').first()
+        Booking.objects.filter(pk=undated.pk).update(preferred_date=None)
+
+        response = self.client.post('/api/bookings/auto_schedule/', {'dry_run': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['pending'], response.data['scheduled']), (5, 5))
+        planned = next(item for item in response.data['assignments'] if item['id'] == undated.pk)
+        self.assertEqual(
+            (planned['preferred_date'], planned['scheduled_date'], planned['days_late']),
+            (None, response.data['start'], 0),
+        )
+        self.assertFalse(Booking.objects.exclude(status='PENDING').exists())
+        self.assertFalse(DailyOccupancy.objects.exists())
+
+    def test_apply_approves_within_capacity(self):
+        response = self.client.post('/api/bookings/auto_schedule/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['approved'], response.data['failed']), (5, []))
+
+        for booking in Booking.objects.all():
+            self.assertEqual(booking.status, 'APPROVED')
+            self.assertGreaterEqual(booking.scheduled_date, booking.preferred_date)
+        self.assertEqual(
+            sorted(DailyOccupancy.objects.values_list('booked_minutes', flat=True)), [600, 900],
+        )
+
+
+# -------------------
+# Access token authentication
+# -------------------
+class ClaimsAuthenticationTests(TestCase):
+    """Requests with a real access token see account changes on their next request."""
+
+    def setUp(self):
+        create_bookings(3)
+        cache.clear()
+        self.user = User.objects.get(username='customer0')
+
+    def client_for(self, user):
+        from .serializers import MyTokenObtainPairSerializer
+
+        client = APIClient()
+        token = MyTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_suspended_user_is_refused(self):
+        client = self.client_for(self.user)
+        # The cached state is dropped when the user is saved
+        with shared_cache():
+            self.assertEqual(client.get('/api/vehicles/').status_code, 200)
+            self.user.is_active = False
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save(update_fields=['is_active'])
+            self.assertEqual(client.get('/api/vehicles/').status_code, 401)
+
+    def test_role_change_applies_to_existing_tokens(self):
+        admin = User.objects.create_user(username='admin', password='password', role='ADMIN')
+        client = self.client_for(admin)
+        service = {'service_name': 'Oil change', 'price': '50.00'}
+        self.assertEqual(client.post('/api/services/', service, format='json').status_code, 201)
+        admin.role = 'CUSTOMER'
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.save(update_fields=['role'])
+        self.assertEqual(client.post('/api/services/', service, format='json').status_code, 403)
+
+    def test_list_query_count(self):
+        client = self.client_for(self.user)
+        # Per-process cache: the account state is read on every request
+        with self.assertNumQueries(2):
+            self.assertEqual(client.get('/api/vehicles/').status_code, 200)
+        with shared_cache():
+            client.get('/api/vehicles/')
+            with self.assertNumQueries(1):
+                self.assertEqual(client.get('/api/vehicles/').status_code, 200)
+
+# -------------------
+# Refresh token revocation
+# -------------------
+class RevocationTests(TestCase):
+    """Revocations written by other processes are seen, whatever the state of this process's filter."""
+
+    def setUp(self):
+        from .revocation import RevocationStore
+
+        cache.clear()
+        self.store = RevocationStore()
+        self.user = User.objects.create_user(username='customer', password='password')
+        self.issued_at = timezone.now().timestamp() - 60
+
+    def revoke_elsewhere(self, jti, **fields):
+        # A row written by another process, without announcing it to this one
+        fields.setdefault('expires_at', timezone.now() + timedelta(days=1))
+        RevokedToken.objects.create(jti=jti, user=self.user, **fields)
+
+    def test_revoking_a_user_applies_in_every_process(self):
+        from .revocation import COUNTER_KEY, USER_KEY, RevocationStore
+
+        with shared_cache():
+            self.assertFalse(self.store.is_revoked('a', self.user.id, self.issued_at))
+            with self.captureOnCommitCallbacks(execute=True):
+                RevocationStore().revoke_user(self.user.id)
+            self.assertTrue(self.store.is_revoked('a', self.user.id, self.issued_at))
+            self.assertFalse(self.store.is_revoked('b', self.user.id, timezone.now().timestamp() + 1))
+
+            # With the cached time evicted, the marker row is found through the filter
+            cache.delete(USER_KEY.format(self.user.id))
+            cache.incr(COUNTER_KEY)
+            self.assertTrue(self.store.is_revoked('a', self.user.id, self.issued_at))
+
+    def test_refresh_reads_no_revocation_rows(self):
+        from .serializers import MyTokenObtainPairSerializer
+
+        client = APIClient()
+        refresh = str(MyTokenObtainPairSerializer.get_token(self.user))
+        with shared_cache():
+            # The first refresh loads the filter and the account state
+            refresh = client.post('/api/token/refresh/', {'refresh': refresh}).data['refresh']
+            with CaptureQueriesContext(connection) as queries:
+                response = client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual([sql for sql in statements if sql in ('SELECT', 'INSERT')], ['INSERT'])
+
+    def test_sync_picks_up_rows_committed_late(self):
+        from .revocation import COUNTER_KEY
+
+        with shared_cache():
+            self.revoke_elsewhere('committed', id=10)
+            self.assertFalse(self.store.is_revoked('late', self.user.id, self.issued_at))
+            # Revoked (and given a lower id) before the last sync, committed after it
+            self.revoke_elsewhere('late', id=5, revoked_at=timezone.now() - timedelta(seconds=30))
+            cache.set(COUNTER_KEY, 1)
+            with self.assertNumQueries(2):
+                self.assertTrue(self.store.is_revoked('late', self.user.id, self.issued_at))
+
+    def test_fails_closed_without_a_shared_cache(self):
+        self.assertFalse(self.store.shared())
+        self.assertFalse(self.store.is_revoked('a', self.user.id, self.issued_at))
+        self.revoke_elsewhere('a')
+        with self.assertNumQueries(1):
+            self.assertTrue(self.store.is_revoked('a', self.user.id, self.issued_at))
+
+
+# -------------------
+# Vehicle plates
+# -------------------
+class VehiclePlateTests(TestCase):
+    """Plates are unique however they are written, without revealing other customers' plates."""
+
+    def setUp(self):
+        create_bookings(2)
+        self.owner = Customer.objects.get(user__username='customer0')
+        self.other = Customer.objects.get(user__username='customer1')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_customer_gets_a_generic_message(self):
+        response = self.client_for(self.other.user).post(
+            '/api/vehicles/', {'vehicle_number': 'ab 0000', 'vehicle_type': 'car'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('already exists', response.data['vehicle_number'][0])
+
+    def test_admin_is_told_the_plate_exists(self):
+        admin = User.objects.create_user(username='admin', password='password', role='ADMIN')
+        response = self.client_for(admin).post(
+            '/api/vehicles/',
+            {'vehicle_number': 'AB0000', 'vehicle_type': 'car', 'customer_id': self.other.id},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already exists', response.data['vehicle_number'][0])
+
+    def test_concurrent_duplicate_is_a_field_error(self):
+        from .serializers import VehicleSerializer
+
+        # The other request's INSERT lands after this one validated the plate
+        with mock.patch.object(VehicleSerializer, 'validate_vehicle_number', side_effect=lambda value: value):
+            response = self.client_for(self.other.user).post(
+                '/api/vehicles/', {'vehicle_number': 'AB-0000', 'vehicle_type': 'car'}, format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vehicle_number', response.data)
+        self.assertEqual(Vehicle.objects.filter(plate_normalized='AB0000').count(), 1)
+
+    def test_legacy_duplicate_stays_editable(self):
+        # Shared a plate before the unique column existed, so it was left NULL
+        legacy = Vehicle.objects.get(customer=self.other)
+        Vehicle.objects.filter(pk=legacy.pk).update(vehicle_number='AB 0000', plate_normalized=None)
+        client = self.client_for(self.other.user)
+
+        response = client.patch(f'/api/vehicles/{legacy.pk}/', {'vehicle_type': 'van'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.vehicle_type, legacy.plate_normalized), ('van', None))
+
+        response = client.patch(f'/api/vehicles/{legacy.pk}/', {'vehicle_number': 'cd-1234'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.plate_normalized, 'CD1234')
+
+
+# -------------------
+# Quick search
+# -------------------
+class SearchTests(TestCase):
+    """The index and the database fallback find the same customers, and logins do not churn the index."""
+
+    def setUp(self):
+        create_bookings(2)
+        Customer.objects.filter(user__username='customer0').update(phone='+94 (77) 123-4567')
+
+    def test_phone_matches_alike_in_index_and_database(self):
+        from .search import CUSTOMER_FIELDS, VEHICLE_FIELDS, PrefixIndex, database_search
+
+        index = PrefixIndex.build(
+            Customer.objects.values(*CUSTOMER_FIELDS), Vehicle.objects.values(*VEHICLE_FIELDS),
+        )
+        for query, usernames in (('9477 12', ['customer0']), ('+94-771', ['customer0']), ('0771', ['customer1'])):
+            with self.subTest(query=query):
+                self.assertEqual([doc['username'] for doc in index.search(query, 10)], usernames)
+                self.assertEqual([doc['username'] for doc in database_search(query, 10)], usernames)
+
+    def test_login_is_not_a_search_change(self):
+        from django.contrib.auth.models import update_last_login
+
+        from .search import search_index
+
+        user = User.objects.get(username='customer0')
+        with mock.patch.object(search_index, 'record') as record:
+            # What the admin site, session logins and UPDATE_LAST_LOGIN run
+            with self.captureOnCommitCallbacks(execute=True):
+                update_last_login(None, user)
+            record.assert_not_called()
+
+            user.first_name = 'Renamed'
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+            record.assert_called_once_with('customer_user', user.pk)
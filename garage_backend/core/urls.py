@@ -7,6 +7,8 @@ from .views import (
     ServiceViewSet,
     BookingViewSet,
     InvoiceViewSet,
+    ReportViewSet,
+    SearchViewSet,
     CustomerRegisterView,
 )
 
@@ -17,6 +19,8 @@ router.register(r'vehicles', VehicleViewSet, basename='vehicle')
 router.register(r'services', ServiceViewSet, basename='service')
 router.register(r'bookings', BookingViewSet, basename='booking')
 router.register(r'invoices', InvoiceViewSet, basename='invoice')
+router.register(r'reports', ReportViewSet, basename='report')
+router.register(r'search', SearchViewSet, basename='search')
 
 urlpatterns = [
     path('', include(router.urls)),  # keep all router URLs
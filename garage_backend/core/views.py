@@ -1,19 +1,104 @@
+import io
+from decimal import Decimal
 from rest_framework.decorators import action
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import MyTokenObtainPairSerializer
 from .serializers import CustomerRegistrationSerializer
-from .models import User, Customer, Vehicle, Service, Booking, Invoice
+from .models import (
+    User, Customer, Vehicle, Service, Booking, Invoice,
+    DailyBookingStat, DailyRevenueStat, CapacityOverride, normalize_plate,
+)
 from .serializers import (
     UserSerializer, CustomerSerializer, VehicleSerializer,
-    ServiceSerializer, BookingSerializer, InvoiceSerializer
+    ServiceSerializer, BookingSerializer, InvoiceSerializer,
+    ReportQuerySerializer, BookingBulkTransitionSerializer,
+    AvailabilityQuerySerializer, CapacityOverrideSerializer, AutoScheduleSerializer,
 )
 from .permissions import IsAdmin, IsCustomer, IsAdminOrOwner, IsAdminOrReadOnly
-from .services import InvoiceService, BookingService
+from .services import (
+    InvoiceService, BookingService, ReportService, CapacityService,
+    CapacityExceeded, TransitionConflict,
+)
+from .pagination import DateJoinedCursorPagination
+from .idempotency import IdempotentCreateMixin, idempotent
+from .sideload import SideloadListMixin, sideload_requested
+from .readers import ValuesListMixin
+from .catalog import service_catalog
+from .revocation import token_revocations
+from .imports import CustomerImporter, VehicleImporter, import_format, read_rows
+from .search import search_index
+from .scheduling import apply_plan, plan_pending_bookings
+from .exports import BOOKING_EXPORT_COLUMNS, EXPORT_FORMATS, INVOICE_EXPORT_COLUMNS, export_response, iter_keyset
+from .pdf import RenderQueueFull, pdf_render_pool, pdf_store, pdf_file_response, stream_invoice_zip
+from django.http import StreamingHttpResponse
+from concurrent.futures import TimeoutError as RenderTimeout
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+
+# Relations walked by BookingSerializer (customer -> user, service, vehicle -> customer -> user, invoice)
+BOOKING_RELATED = (
+    'customer__user',
+    'service',
+    'vehicle__customer__user',
+    'invoice',
+)
+
+# Relations walked by InvoiceSerializer through its nested booking
+INVOICE_RELATED = (
+    'booking__customer__user',
+    'booking__service',
+    'booking__vehicle__customer__user',
+)
+
+
+def shape_queryset(view, queryset, default_related):
+    # ?fields= / ?expand= responses load only what the shaped serializer reads;
+    # side-loaded lists need the full joins for their included objects
+    serializer = view.get_serializer()
+    if not getattr(serializer, 'shaped', False) or sideload_requested(view.request):
+        return queryset.select_related(*default_related)
+    related, only = serializer.queryset_plan()
+    return queryset.select_related(*related).only(*only)
+
+
+def run_upload_import(request, importer_class, **kwargs):
+    # Shared by the bulk import actions: multipart ``file`` (.csv / .jsonl or
+    # ``file_format``), optional ``dry_run``; responds with the import report
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'Upload the rows as "file"'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        file_format = import_format(upload.name, request.data.get('file_format'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    report = importer_class(dry_run=dry_run, **kwargs).run(read_rows(stream, file_format))
+    return Response(report)
+
+
+def run_export(view, queryset, columns, name):
+    # Shared by the export actions: the view's list filters, then a streamed
+    # ``export_format`` (csv or jsonl; DRF reserves ``format``) attachment
+    file_format = view.request.query_params.get('export_format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f'export_format must be one of: {", ".join(EXPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return export_response(view.filter_queryset(queryset), columns, file_format, name)
+
 
 # -------------------
 # User (Admin only)
@@ -22,21 +107,58 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
+    pagination_class = DateJoinedCursorPagination
 
 
 # -------------------
 # Customer Management
 # -------------------
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated]
+    filter_lookups = {
+        'is_active': 'user__is_active',
+    }
+    search_fields = [
+        'user__username',
+        'user__first_name',
+        'user__last_name',
+        'user__email',
+        'phone',
+    ]
+    ordering_fields = ['created_at', 'user__username', 'user__first_name', 'user__last_name']
     
     def get_queryset(self):
         user = self.request.user
         if user.role == 'ADMIN':
-            return Customer.objects.all()
-        return Customer.objects.filter(user=user)
+            queryset = Customer.objects.all()
+        else:
+            queryset = Customer.objects.filter(user_id=user.id)
+
+        if self.action == 'destroy':
+            return queryset
+        # CustomerSerializer reads the nested user on every row
+        return shape_queryset(self, queryset, ('user',))
     
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        CapacityService.release_bookings(instance.bookings.all())
+        ReportService.remove_bookings(instance.bookings.all())
+        instance.delete()
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=[IsAuthenticated, IsAdmin], parser_classes=[MultiPartParser],
+    )
+    def import_customers(self, request):
+        """
+        Create customers from an uploaded CSV (header row) or JSON Lines
+        ``file`` with the registration fields. ``dry_run=true`` only
+        validates. Returns a report with the line and errors of each
+        rejected row; the other rows are created.
+        """
+        return run_upload_import(request, CustomerImporter)
+
     @action(detail=False, methods=['get'])
     def me(self, request):
         serializer = self.get_serializer(request.user.customer)
@@ -48,12 +170,13 @@ class CustomerViewSet(viewsets.ModelViewSet):
         return CustomerSerializer
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def toggle_status(self, request, pk=None):
         customer = self.get_object()
         user = customer.user
         
         # Prevent admin from suspending themselves if they were a customer (edge case)
-        if user == request.user:
+        if user.id == request.user.id:
              return Response(
                 {'error': 'You cannot suspend your own account'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -61,6 +184,10 @@ class CustomerViewSet(viewsets.ModelViewSet):
 
         user.is_active = not user.is_active
         user.save()
+        if not user.is_active:
+            # Access tokens stop working through the cached account state;
+            # refresh tokens issued before the suspension are revoked for good
+            token_revocations.revoke_user(user.id)
         
         status_text = "activated" if user.is_active else "suspended"
         return Response({
@@ -72,67 +199,330 @@ class CustomerViewSet(viewsets.ModelViewSet):
 # -------------------
 # Vehicle
 # -------------------
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = VehicleSerializer
     permission_classes = [IsAuthenticated, IsAdminOrOwner]
+    filter_lookups = {
+        'customer': 'customer_id',
+        'vehicle_type': 'vehicle_type__iexact',
+    }
+    search_fields = [
+        'vehicle_number',
+        'vehicle_type',
+        'customer__user__username',
+        'customer__user__first_name',
+        'customer__user__last_name',
+    ]
+    ordering_fields = ['created_at', 'vehicle_number', 'vehicle_type']
     
     def get_queryset(self):
         user = self.request.user
         if user.role == 'ADMIN':
-            return Vehicle.objects.all()
-        return Vehicle.objects.filter(customer__user=user)
+            queryset = Vehicle.objects.all()
+        else:
+            queryset = Vehicle.objects.filter(customer__user_id=user.id)
+
+        if self.action == 'destroy':
+            return queryset
+        # VehicleSerializer nests customer -> user
+        return shape_queryset(self, queryset, ('customer__user',))
 
     def perform_create(self, serializer):
         if self.request.user.role == 'ADMIN':
-            serializer.save()
+            self._save(serializer)
         else:
-            serializer.save(customer=self.request.user.customer)
+            self._save(serializer, customer=self.request.user.customer)
 
     def perform_update(self, serializer):
-        vehicle = self.get_object()
-        serializer.save(customer=vehicle.customer)
+        # serializer.instance is the object already fetched by get_object()
+        self._save(serializer, customer=serializer.instance.customer)
+
+    def _save(self, serializer, **kwargs):
+        # validate_vehicle_number checks the plate first, but a concurrent
+        # request can take it before the INSERT / UPDATE; the unique
+        # plate_normalized column then rejects it, reported the same way
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            plate = normalize_plate(serializer.validated_data.get('vehicle_number'))
+            others = Vehicle.objects.filter(plate_normalized=plate)
+            if serializer.instance is not None and serializer.instance.pk is not None:
+                others = others.exclude(pk=serializer.instance.pk)
+            if not plate or not others.exists():
+                raise
+            raise serializers.ValidationError({'vehicle_number': [serializer.duplicate_plate_message()]})
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=[IsAuthenticated, IsAdmin], parser_classes=[MultiPartParser],
+    )
+    def import_vehicles(self, request):
+        """
+        Create vehicles from an uploaded CSV / JSON Lines ``file`` with
+        vehicle_number, vehicle_type and customer_id columns; a
+        ``customer_id`` form field applies to rows without one (a fleet
+        customer's vehicles). Same report and ``dry_run`` as the customer import.
+        """
+        customer_id = request.data.get('customer_id')
+        if customer_id not in (None, '') and not str(customer_id).isdigit():
+            return Response({'error': 'customer_id must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return run_upload_import(request, VehicleImporter, customer_id=int(customer_id) if customer_id else None)
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """
+        Front desk plate search: ``?plate=ab-12`` returns the vehicles whose
+        normalized plate starts with AB12, an exact match first.
+        """
+        plate = normalize_plate(request.query_params.get('plate'))
+        if not plate:
+            return Response({'error': 'plate is required'}, status=status.HTTP_400_BAD_REQUEST)
+        # istartswith is a plain LIKE 'AB12%' on MySQL, a range scan of the unique
+        # plate index (startswith would be LIKE BINARY); plates are stored uppercase
+        vehicles = (
+            self.get_queryset()
+            .filter(plate_normalized__istartswith=plate)
+            .order_by('plate_normalized')[:settings.VEHICLE_LOOKUP_LIMIT]
+        )
+        return Response(self.get_serializer(vehicles, many=True).data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        CapacityService.release_bookings(instance.bookings.all())
+        ReportService.remove_bookings(instance.bookings.all())
+        instance.delete()
         
 # -------------------
 # Service Management (Admin)
 # -------------------
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
 
+    # The catalog changes a few times a year: plain list/retrieve responses are
+    # served from the versioned in-process copy and answer conditional GETs with 304
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        stamp = service_catalog.version()
+        return service_catalog.respond(request, stamp, lambda: Response(
+            service_catalog.get(stamp, 'list', lambda: self.get_serializer(self.get_queryset(), many=True).data)
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().retrieve(request, *args, **kwargs)
+
+        stamp = service_catalog.version()
+        by_id = service_catalog.get(stamp, 'by_id', lambda: {
+            str(service['id']): service
+            for service in self.get_serializer(self.get_queryset(), many=True).data
+        })
+        if kwargs['pk'] not in by_id:
+            return super().retrieve(request, *args, **kwargs)
+        return service_catalog.respond(request, stamp, lambda: Response(by_id[kwargs['pk']]))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        CapacityService.release_bookings(instance.bookings.all())
+        ReportService.remove_bookings(instance.bookings.all())
+        instance.delete()
+
 
 # -------------------
 # Booking
 # -------------------
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(SideloadListMixin, ValuesListMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = BookingSerializer
+    sideload_paths = {
+        'customers': ('customer', 'vehicle__customer'),
+        'vehicles': ('vehicle',),
+        'services': ('service',),
+        'users': ('customer__user', 'vehicle__customer__user'),
+    }
+    max_page_size = 50
+    filter_lookups = {
+        'status': 'status__in',
+        'customer': 'customer_id',
+        'vehicle': 'vehicle_id',
+        'service': 'service_id',
+        'preferred_date_from': 'preferred_date__gte',
+        'preferred_date_to': 'preferred_date__lte',
+        'scheduled_date_from': 'scheduled_date__gte',
+        'scheduled_date_to': 'scheduled_date__lte',
+        'booking_date_from': 'booking_date__date__gte',
+        'booking_date_to': 'booking_date__date__lte',
+    }
+    search_fields = [
+        'customer__user__username',
+        'customer__user__first_name',
+        'customer__user__last_name',
+        'vehicle__vehicle_number',
+        'service__service_name',
+    ]
+    ordering_fields = ['created_at', 'preferred_date', 'scheduled_date', 'status']
 
     def get_queryset(self):
         user = self.request.user
 
         if user.role == 'ADMIN':
-            return Booking.objects.all()
+            queryset = Booking.objects.all()
+        else:
+            queryset = Booking.objects.filter(customer__user_id=user.id)
 
-        return Booking.objects.filter(customer__user=user)
+        if self.action == 'destroy':
+            return queryset
+        # list, retrieve, update and every transition serialize the full booking
+        return shape_queryset(self, queryset, BOOKING_RELATED)
 
     def get_permissions(self):
-        if self.action in ['create', 'list', 'retrieve']:
+        if self.action in ['create', 'list', 'retrieve', 'availability']:
             return [IsAuthenticated()]
         return [IsAuthenticated(), IsAdmin()]
 
+    @transaction.atomic
     def perform_create(self, serializer):
         if self.request.user.role == 'ADMIN':
-            serializer.save()
+            booking = serializer.save()
         else:
-            serializer.save(customer=self.request.user.customer)
+            booking = serializer.save(customer=self.request.user.customer)
+        ReportService.booking_created(booking)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # An approved booking moved to another day takes its reservation along
+        if 'scheduled_date' in serializer.validated_data:
+            old_date = Booking.objects.select_for_update().values_list(
+                'scheduled_date', flat=True
+            ).get(pk=serializer.instance.pk)
+            new_date = serializer.validated_data['scheduled_date']
+            if new_date != old_date:
+                try:
+                    CapacityService.booking_rescheduled(serializer.instance, old_date, new_date)
+                except CapacityExceeded as e:
+                    raise serializers.ValidationError({'scheduled_date': str(e)})
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        CapacityService.release_bookings(Booking.objects.filter(pk=instance.pk))
+        ReportService.remove_bookings(Booking.objects.filter(pk=instance.pk))
+        instance.delete()
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def stats(self, request):
+        # One GROUP BY status query; today's scheduled work is a filtered count in the same pass
+        today = timezone.localdate()
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .values('status')
+            .annotate(
+                count=Count('id'),
+                scheduled_today=Count('id', filter=Q(scheduled_date=today)),
+            )
+        )
+
+        by_status = {value: 0 for value, _ in Booking.STATUS_CHOICES}
+        today_by_status = {value: 0 for value, _ in Booking.STATUS_CHOICES}
+        for row in rows:
+            by_status[row['status']] = row['count']
+            today_by_status[row['status']] = row['scheduled_today']
+
+        return Response({
+            'total': sum(by_status.values()),
+            'by_status': by_status,
+            'today': {
+                'date': today,
+                'scheduled': sum(today_by_status.values()),
+                'by_status': today_by_status,
+            },
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def export(self, request):
+        # Accepts the list filters (status, booking_date_from/_to, customer, ...)
+        return run_export(self, Booking.objects.all(), BOOKING_EXPORT_COLUMNS, 'bookings')
+
+    # -------------------
+    # Capacity
+    # -------------------
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        # Two queries (overrides, occupancy) for the whole range, whatever the bookings
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        days = CapacityService.availability(params['from'], params['to'])
+        service = params.get('service')
+        if service is not None:
+            for day in days:
+                day['fits'] = day['available_minutes'] >= service.duration_minutes
+        return Response(days)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def capacity(self, request):
+        # Set one day's capacity, or clear the override with capacity_minutes null
+        serializer = CapacityOverrideSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        day = serializer.validated_data['date']
+        minutes = serializer.validated_data['capacity_minutes']
+
+        if minutes is None:
+            CapacityOverride.objects.filter(date=day).delete()
+        else:
+            CapacityOverride.objects.update_or_create(date=day, defaults={'capacity_minutes': minutes})
+        # Bookings already approved keep their day even if it is now over capacity
+        return Response(CapacityService.availability(day, day)[0])
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
+    def auto_schedule(self, request):
+        """
+        Plan a scheduled date for every pending booking preferring a day in
+        the window (``start_date``, ``days``) and approve them.
+        ``dry_run=true`` only returns the plan. Bookings that no longer fit
+        or are no longer pending when the plan is applied are listed in
+        ``failed``; those without room in the window in ``unscheduled``.
+        """
+        params = AutoScheduleSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        plan = plan_pending_bookings(params.get('start_date'), params.get('days'))
+        plan['dry_run'] = params['dry_run']
+        if not params['dry_run']:
+            failed = apply_plan(plan)
+            plan['approved'] = plan['scheduled'] - len(failed)
+            plan['failed'] = [{'id': booking_id, 'error': error} for booking_id, error in failed.items()]
+        return Response(plan)
 
     # -------------------
     # Booking transitions
     # -------------------
 
+    def _transition(self, transition, *args):
+        # Invalid transitions are a 400; losing a race with another request is a 409
+        booking = self.get_object()
+        try:
+            transition(booking, *args)
+        except (TransitionConflict, CapacityExceeded) as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except DjangoValidationError as e:
+            # e.g. a malformed scheduled_date reaching the UPDATE
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(booking).data)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def approve(self, request, pk=None):
-        booking = self.get_object()
         scheduled_date = request.data.get('scheduled_date')
 
         if not scheduled_date:
@@ -141,50 +531,97 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        BookingService.approve_booking(booking, scheduled_date)
-        return Response(self.get_serializer(booking).data)
+        return self._transition(BookingService.approve_booking, scheduled_date)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def reject(self, request, pk=None):
-        booking = self.get_object()
-        BookingService.reject_booking(booking)
-        return Response(self.get_serializer(booking).data)
+        return self._transition(BookingService.reject_booking)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def cancel(self, request, pk=None):
-        booking = self.get_object()
-        try:
-            BookingService.cancel_booking(booking)
-            return Response(self.get_serializer(booking).data)
-        except ValueError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transition(BookingService.cancel_booking)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def start(self, request, pk=None):
-        booking = self.get_object()
-        BookingService.start_service(booking)
-        return Response(self.get_serializer(booking).data)
+        return self._transition(BookingService.start_service)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
     def complete(self, request, pk=None):
-        booking = self.get_object()
-        BookingService.complete_service(booking)
-        return Response(self.get_serializer(booking).data)
+        return self._transition(BookingService.complete_service)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    @idempotent
+    def bulk_transition(self, request):
+        # Items that can not be moved are reported per id; the rest are still applied
+        serializer = BookingBulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data['status']
+
+        outcome = BookingService.bulk_transition(target, serializer.validated_data['items'])
+
+        results = []
+        for booking_id, error in outcome.items():
+            if error is None:
+                results.append({'id': booking_id, 'updated': True})
+            else:
+                results.append({'id': booking_id, 'updated': False, 'error': error})
+
+        updated = sum(1 for result in results if result['updated'])
+        return Response({
+            'status': target,
+            'updated': updated,
+            'failed': len(results) - updated,
+            'results': results,
+        })
 
 
 # -------------------
 # Invoice
 # -------------------
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(SideloadListMixin, ValuesListMixin, viewsets.ModelViewSet):
     serializer_class = InvoiceSerializer
+    sideload_paths = {
+        'bookings': ('booking',),
+        'customers': ('booking__customer', 'booking__vehicle__customer'),
+        'vehicles': ('booking__vehicle',),
+        'services': ('booking__service',),
+        'users': ('booking__customer__user', 'booking__vehicle__customer__user'),
+    }
     permission_classes = [IsAuthenticated]
+    max_page_size = 50
+    filter_lookups = {
+        'payment_status': 'payment_status__in',
+        'booking_status': 'booking__status__in',
+        'customer': 'booking__customer_id',
+        'invoice_date_from': 'invoice_date__gte',
+        'invoice_date_to': 'invoice_date__lte',
+    }
+    search_fields = [
+        'booking__customer__user__username',
+        'booking__customer__user__first_name',
+        'booking__customer__user__last_name',
+        'booking__vehicle__vehicle_number',
+        'booking__service__service_name',
+    ]
+    ordering_fields = ['created_at', 'invoice_date', 'total_amount', 'payment_status']
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'ADMIN':
-            return Invoice.objects.all()
-        return Invoice.objects.filter(booking__customer__user=user)
+            queryset = Invoice.objects.all()
+        else:
+            queryset = Invoice.objects.filter(booking__customer__user_id=user.id)
+
+        if self.action == 'destroy':
+            return queryset
+        # InvoiceSerializer embeds the whole booking tree
+        return shape_queryset(self, queryset, INVOICE_RELATED)
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         booking_id = request.data.get('booking_id')
 
@@ -201,7 +638,10 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         additional_charge_description = request.data.get('additional_charge_description', '')
 
         try:
-            booking = Booking.objects.get(id=booking_id)
+            # Everything InvoiceSerializer walks through the booking
+            booking = Booking.objects.select_related(
+                'customer__user', 'service', 'vehicle__customer__user',
+            ).get(id=booking_id)
         except Booking.DoesNotExist:
             return Response(
                 {'error': 'Booking not found'},
@@ -217,33 +657,267 @@ class InvoiceViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        #Prevent duplicate invoice
-        if hasattr(booking, 'invoice'):
+        #Generate invoice; the unique booking_id column rejects duplicates, even concurrent ones
+        try:
+            invoice = InvoiceService.generate_invoice(
+                booking,
+                additional_charge,
+                additional_charge_description
+            )
+        except IntegrityError:
             return Response(
                 {'error': 'Invoice already exists for this booking'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        #Generate invoice
-        invoice = InvoiceService.generate_invoice(
-            booking,
-            additional_charge,
-            additional_charge_description
-        )
-
         serializer = self.get_serializer(invoice)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ReportService.remove_invoices(Invoice.objects.filter(pk=instance.pk))
+        invoice_id = instance.id
+        instance.delete()
+        transaction.on_commit(lambda: pdf_store.prune(invoice_id))
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        # One GROUP BY payment_status query for counts and revenue
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by()
+            .values('payment_status')
+            .annotate(count=Count('id'), total_amount=Sum('total_amount'))
+        )
+
+        by_payment_status = {
+            value: {'count': 0, 'total_amount': Decimal('0.00')}
+            for value, _ in Invoice.PAYMENT_STATUS_CHOICES
+        }
+        for row in rows:
+            by_payment_status[row['payment_status']] = {
+                'count': row['count'],
+                'total_amount': row['total_amount'] or Decimal('0.00'),
+            }
+
+        total_amount = sum(item['total_amount'] for item in by_payment_status.values())
+        return Response({
+            'count': sum(item['count'] for item in by_payment_status.values()),
+            'total_amount': f'{total_amount:.2f}',
+            'paid_amount': f"{by_payment_status['PAID']['total_amount']:.2f}",
+            'pending_amount': f"{by_payment_status['PENDING']['total_amount']:.2f}",
+            'by_payment_status': {
+                key: {'count': item['count'], 'total_amount': f"{item['total_amount']:.2f}"}
+                for key, item in by_payment_status.items()
+            },
+        })
+
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def download_pdf(self, request, pk=None):
-        from django.http import HttpResponse
         invoice = self.get_object()
-        pdf_content = InvoiceService.generate_invoice_pdf(invoice)
-        
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.id}.pdf"'
+        try:
+            stored = InvoiceService.generate_invoice_pdf(invoice)
+        except (RenderQueueFull, RenderTimeout):
+            return self._renderer_busy()
+
+        if stored is None:
+            return Response({'error': 'PDF rendering failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        path, digest = stored
+        return pdf_file_response(request, path, digest, f'invoice_{invoice.id}.pdf')
+
+    # -------------------
+    # Asynchronous PDF jobs: submit -> poll/wait -> download
+    # -------------------
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def pdf_job(self, request, pk=None):
+        invoice = self.get_object()
+        try:
+            job = pdf_render_pool.submit(invoice)
+        except RenderQueueFull:
+            return self._renderer_busy()
+
+        return Response(self._job_data(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'pdf_jobs/(?P<job_id>[0-9a-f]+)')
+    def pdf_job_status(self, request, job_id=None):
+        job = self._get_job(job_id)
+        if job is None:
+            return Response({'error': 'PDF job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # ?wait=N blocks up to N seconds (capped at the download timeout) for the job to finish
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), settings.INVOICE_PDF_WAIT_TIMEOUT)
+        except ValueError:
+            return Response({'error': 'Invalid wait'}, status=status.HTTP_400_BAD_REQUEST)
+        if wait > 0 and job['status'] == 'pending':
+            job = pdf_render_pool.wait(job_id, wait) or job
+
+        return Response(self._job_data(job))
+
+    @action(detail=False, methods=['get'], url_path=r'pdf_jobs/(?P<job_id>[0-9a-f]+)/download')
+    def pdf_job_download(self, request, job_id=None):
+        job = self._get_job(job_id)
+        if job is None:
+            return Response({'error': 'PDF job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job['status'] == 'pending':
+            return Response(self._job_data(job), status=status.HTTP_202_ACCEPTED)
+        if job['status'] == 'failed':
+            return Response({'error': 'PDF rendering failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        path = pdf_store.path(job['invoice_id'], job['digest'])
+        if not path.exists():
+            # The invoice changed after the job ran and the old version was pruned
+            return Response({'error': 'PDF is out of date, submit a new job'}, status=status.HTTP_410_GONE)
+
+        return pdf_file_response(request, path, job['digest'], f"invoice_{job['invoice_id']}.pdf")
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def export(self, request):
+        # Accepts the list filters (invoice_date_from/_to, payment_status, customer, ...)
+        return run_export(self, Invoice.objects.all(), INVOICE_EXPORT_COLUMNS, 'invoices')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def export_pdfs(self, request):
+        # Accepts the list filters (invoice_date_from/_to, payment_status, customer, ...);
+        # read in keyset chunks, in id order, so memory stays at one chunk
+        invoices = iter_keyset(self.filter_queryset(self.get_queryset()), chunk_size=200)
+
+        response = StreamingHttpResponse(stream_invoice_zip(invoices), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="invoices_{timezone.localdate():%Y%m%d}.zip"'
         return response
 
+    def _get_job(self, job_id):
+        # Jobs are only visible to users who can see the invoice they belong to
+        job = pdf_render_pool.get(job_id)
+        if job is None or not self.get_queryset().filter(id=job['invoice_id']).exists():
+            return None
+        return job
+
+    def _job_data(self, job):
+        return {'job_id': job['job_id'], 'invoice_id': job['invoice_id'], 'status': job['status']}
+
+    def _renderer_busy(self):
+        return Response(
+            {'error': 'PDF renderer is busy, please retry shortly'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '5'},
+        )
+
+
+# -------------------
+# Reports (Admin) - read only from the daily rollup tables
+# -------------------
+class ReportViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    PERIOD_FUNCTIONS = {
+        'month': TruncMonth,
+        'year': TruncYear,
+    }
+
+    def _rollup_rows(self, request, queryset, group_field, **aggregates):
+        params = ReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if params.get('date_from'):
+            queryset = queryset.filter(date__gte=params['date_from'])
+        if params.get('date_to'):
+            queryset = queryset.filter(date__lte=params['date_to'])
+
+        period_function = self.PERIOD_FUNCTIONS.get(params['period'])
+        if period_function:
+            queryset = queryset.annotate(period=period_function('date'))
+        else:
+            queryset = queryset.annotate(period=F('date'))
+
+        return (
+            queryset.order_by()
+            .values('period', group_field)
+            .annotate(**aggregates)
+            .order_by('period')
+        )
+
+    @action(detail=False, methods=['get'])
+    def bookings(self, request):
+        rows = self._rollup_rows(request, DailyBookingStat.objects.all(), 'status', count=Sum('count'))
+
+        periods = {}
+        for row in rows:
+            period = periods.setdefault(row['period'], {
+                'period': row['period'],
+                'total': 0,
+                'by_status': {value: 0 for value, _ in Booking.STATUS_CHOICES},
+            })
+            period['by_status'][row['status']] = row['count']
+            period['total'] += row['count']
+
+        return Response(list(periods.values()))
+
+    @action(detail=False, methods=['get'])
+    def revenue(self, request):
+        rows = self._rollup_rows(
+            request,
+            DailyRevenueStat.objects.all(),
+            'payment_status',
+            count=Sum('invoice_count'),
+            amount=Sum('total_amount'),
+        )
+
+        periods = {}
+        for row in rows:
+            period = periods.setdefault(row['period'], {
+                'period': row['period'],
+                'count': 0,
+                'total_amount': Decimal('0.00'),
+                'by_payment_status': {
+                    value: {'count': 0, 'total_amount': Decimal('0.00')}
+                    for value, _ in Invoice.PAYMENT_STATUS_CHOICES
+                },
+            })
+            period['by_payment_status'][row['payment_status']] = {
+                'count': row['count'],
+                'total_amount': row['amount'],
+            }
+            period['count'] += row['count']
+            period['total_amount'] += row['amount']
+
+        for period in periods.values():
+            period['total_amount'] = f"{period['total_amount']:.2f}"
+            for item in period['by_payment_status'].values():
+                item['total_amount'] = f"{item['total_amount']:.2f}"
+
+        return Response(list(periods.values()))
+
+# -------------------
+# Quick Search (Admin)
+# -------------------
+class SearchViewSet(viewsets.ViewSet):
+    """
+    Front desk search: ``?q=`` matches the start of a customer's username,
+    first/last/full name, email or phone, or a vehicle plate ("ab-12" finds
+    AB1234), from the in-process prefix index in core/search.py. A number
+    also finds the booking with that id. ``?limit=`` caps the results.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    MIN_QUERY_LENGTH = 2
+    MAX_LIMIT = 50
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < self.MIN_QUERY_LENGTH:
+            return Response(
+                {'error': f'q must be at least {self.MIN_QUERY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', settings.SEARCH_RESULT_LIMIT)), self.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(search_index.search(query, max(limit, 1)))
+
 # -------------------
 # Token Authentication
 # -------------------
@@ -53,11 +53,19 @@ from datetime import timedelta
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Opt-in keyset pagination: only used when the client sends ?cursor= or ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CreatedAtCursorPagination',
+    'PAGE_SIZE': 25,
+    'DEFAULT_FILTER_BACKENDS': (
+        'core.filters.QueryParamFilterBackend',
+        'rest_framework.filters.SearchFilter',
+        'core.filters.RequestedOrderingFilter',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -65,10 +73,85 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Rotated tokens are revoked through core.revocation, not the token_blacklist app
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.MyTokenRefreshSerializer',
 }
 
+# Seconds ClaimsJWTAuthentication caches a user's is_active/role between
+# account changes (saving the user drops the entry). Only with a shared cache
+# (REDIS_URL); a per-process cache reads the state on every request instead
+JWT_USER_STATE_TTL = int(os.getenv('JWT_USER_STATE_TTL', 5 * 60))
+
+# Seconds the service catalog version stamp (core/catalog.py) is cached;
+# bounds how long a worker can serve a stale catalog if an invalidation is lost
+SERVICE_CATALOG_VERSION_TTL = int(os.getenv('SERVICE_CATALOG_VERSION_TTL', 5 * 60))
+
+# In-memory Bloom filter in front of the RevokedToken table (about 120 KB per
+# process at these values; it grows when more tokens are revoked)
+REVOKED_TOKEN_FILTER_CAPACITY = int(os.getenv('REVOKED_TOKEN_FILTER_CAPACITY', 100_000))
+REVOKED_TOKEN_FILTER_ERROR_RATE = 0.01
+# Each filter sync also reloads rows revoked this many seconds before the
+# previous one (late commits, clock skew), and a process syncs at least this often
+REVOKED_TOKEN_SYNC_WINDOW = 60
+# Expired rows are purged at most this often (seconds), or by the purge_revoked_tokens command
+REVOKED_TOKEN_PURGE_INTERVAL = 60 * 60
+
 AUTH_USER_MODEL = 'core.User'
 
+# Token login loads the user once and reports suspended accounts itself
+AUTHENTICATION_BACKENDS = ['core.backends.LoginBackend']
+
+# The first hasher hashes new passwords; the others still verify old hashes,
+# which are rewritten with the first one on the user's next login.
+# PASSWORD_PBKDF2_ITERATIONS tunes the PBKDF2 work factor (Django's default
+# when unset); benchmark_login measures the login rate it allows
+PASSWORD_HASHERS = list(dict.fromkeys([
+    os.getenv('PASSWORD_HASHER', 'core.hashers.TunablePBKDF2PasswordHasher'),
+    # Same algorithm name as Django's PBKDF2PasswordHasher, so it verifies those hashes
+    'core.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 0)) or None
+
+# Bulk imports (core/imports.py): rows validated and inserted per chunk
+IMPORT_CHUNK_SIZE = 500
+# Processes hashing imported passwords; 0 hashes inline in the request
+CUSTOMER_IMPORT_HASH_WORKERS = int(os.getenv('CUSTOMER_IMPORT_HASH_WORKERS', '2'))
+
+# Vehicles returned by a plate prefix lookup
+VEHICLE_LOOKUP_LIMIT = 20
+
+# /api/search/ answers from an in-process prefix index (core/search.py);
+# False queries the database instead
+SEARCH_INDEX = os.getenv('SEARCH_INDEX', 'True') == 'True'
+SEARCH_RESULT_LIMIT = 20
+# Changes replayed one by one before a process rebuilds its index instead
+SEARCH_INDEX_MAX_REPLAY = 1000
+# Seconds a recorded change is kept for processes to replay
+SEARCH_INDEX_CHANGE_TTL = 60 * 60
+# Seconds before a process rebuilds its index anyway (and the lifetime of the
+# shared epoch and change counter); bounds how stale results can get when a
+# change is lost or, without REDIS_URL, made through another worker
+SEARCH_INDEX_MAX_AGE = int(os.getenv('SEARCH_INDEX_MAX_AGE', 15 * 60))
+
+# Workshop minutes bookings can reserve per day (CapacityOverride rows
+# change single dates); weekdays listed as 0 = Monday .. 6 = Sunday are closed
+WORKSHOP_DAILY_CAPACITY_MINUTES = int(os.getenv('WORKSHOP_DAILY_CAPACITY_MINUTES', 8 * 60 * 2))
+WORKSHOP_CLOSED_WEEKDAYS = [int(day) for day in os.getenv('WORKSHOP_CLOSED_WEEKDAYS', '').split(',') if day.strip()]
+# Longest range /api/bookings/availability/ answers in one request
+AVAILABILITY_MAX_DAYS = 92
+
+# Automatic scheduling of pending bookings (core/scheduling.py): days ahead
+# planned by default, and improvement passes after the greedy placement
+SCHEDULER_HORIZON_DAYS = 30
+SCHEDULER_MAX_PASSES = 5
+
+# Rows read per query (and written per chunk) by the CSV / JSON Lines exports
+EXPORT_CHUNK_SIZE = 2000
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -154,7 +237,68 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Build plain booking/invoice list responses from values() rows instead of the serializers
+FAST_LIST_READS = os.getenv('FAST_LIST_READS', 'True') == 'True'
+
+# Invoice PDF rendering
+# INVOICE_PDF_WORKERS=0 renders inline in the request (small deployments)
+INVOICE_PDF_WORKERS = int(os.getenv('INVOICE_PDF_WORKERS', '2'))
+# Jobs queued per web process before new requests get a 503
+INVOICE_PDF_MAX_PENDING = int(os.getenv('INVOICE_PDF_MAX_PENDING', '16'))
+# Seconds a synchronous download waits for its job
+INVOICE_PDF_WAIT_TIMEOUT = int(os.getenv('INVOICE_PDF_WAIT_TIMEOUT', '30'))
+# Seconds job statuses are kept in the cache
+INVOICE_PDF_JOB_TTL = 600
+# Content-addressed store of rendered invoices (shared by all web processes)
+INVOICE_PDF_STORE_DIR = os.getenv('INVOICE_PDF_STORE_DIR', str(BASE_DIR / 'var' / 'invoice_pdfs'))
+# 'xhtml2pdf' renders templates/invoice.html, 'reportlab' draws the same
+# layout natively (core/pdf_native.py) and is several times faster
+INVOICE_PDF_ENGINE = os.getenv('INVOICE_PDF_ENGINE', 'xhtml2pdf')
+# Render the PDF in the background as soon as an invoice is marked as paid
+# (only with INVOICE_PDF_WORKERS; otherwise on the first download)
+INVOICE_PDF_PREGENERATE = os.getenv('INVOICE_PDF_PREGENERATE', 'True') == 'True'
+
+# Jobs are shared between web processes through the cache, so multi-process
+# deployments should point REDIS_URL at a shared Redis instance
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+        'idempotency': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'idempotency',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        # Bounded: the oldest quarter is culled once MAX_ENTRIES is reached
+        'idempotency': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'idempotency',
+            'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 4},
+        },
+    }
+
+# Idempotency-Key responses for POST create/transition endpoints
+IDEMPOTENCY_CACHE_ALIAS = 'idempotency'
+# Seconds a stored response can be replayed
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Seconds a key stays locked while its first request runs (covers crashed workers)
+IDEMPOTENCY_IN_FLIGHT_TTL = 60
+
 # Allow localhost:3000 to access Django API
+from corsheaders.defaults import default_headers
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+)
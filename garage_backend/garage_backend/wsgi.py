@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'garage_backend.settings')
 
 application = get_wsgi_application()
+
+# Build the quick search index in the background before the first search
+from django.conf import settings  # noqa: E402
+
+if settings.SEARCH_INDEX:
+    from core.search import search_index  # noqa: E402
+
+    search_index.warm()
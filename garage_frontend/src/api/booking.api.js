@@ -1,7 +1,13 @@
 import api from "./axios";
 
-export const getBookings = async () => {
-    const response = await api.get("/bookings/");
+// params: server-side filters, e.g. { status: "PENDING,APPROVED", scheduled_date_from: "2026-01-01" }
+export const getBookings = async (params = {}) => {
+    const response = await api.get("/bookings/", { params });
+    return response.data;
+};
+
+export const getBookingStats = async () => {
+    const response = await api.get("/bookings/stats/");
     return response.data;
 };
 
@@ -10,6 +16,17 @@ export const createBooking = async (data) => {
     return response.data;
 };
 
+// Free minutes per day, from/to as "YYYY-MM-DD"; with a service id each day also says whether it fits
+export const getAvailability = async (from, to, service) => {
+    const response = await api.get("/bookings/availability/", { params: { from, to, service } });
+    return response.data;
+};
+
+export const setDayCapacity = async (date, capacity_minutes) => {
+    const response = await api.post("/bookings/capacity/", { date, capacity_minutes });
+    return response.data;
+};
+
 // Custom actions
 export const approveBooking = async (id, scheduled_date) => {
     const response = await api.post(`/bookings/${id}/approve/`, { scheduled_date });
@@ -36,6 +53,18 @@ export const completeBooking = async (id) => {
     return response.data;
 };
 
+// Plan dates for all pending bookings; { dry_run: true } only previews the plan
+export const autoScheduleBookings = async (options = {}) => {
+    const response = await api.post("/bookings/auto_schedule/", options);
+    return response.data;
+};
+
+// items: [{ id, scheduled_date }] (scheduled_date only for APPROVED); returns a per-id report
+export const bulkTransitionBookings = async (status, items) => {
+    const response = await api.post("/bookings/bulk_transition/", { status, items });
+    return response.data;
+};
+
 export const updateBooking = async (id, data) => {
     const response = await api.patch(`/bookings/${id}/`, data);
     return response.data;
@@ -45,3 +74,20 @@ export const deleteBooking = async (id) => {
     const response = await api.delete(`/bookings/${id}/`);
     return response.data;
 };
+
+// Full booking history as a CSV (or "jsonl") file, with the same filters as getBookings
+export const exportBookings = async (params = {}, export_format = "csv") => {
+    const response = await api.get("/bookings/export/", {
+        params: { ...params, export_format },
+        responseType: 'blob'
+    });
+
+    const url = window.URL.createObjectURL(response.data);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = `bookings.${export_format}`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    window.URL.revokeObjectURL(url);
+};
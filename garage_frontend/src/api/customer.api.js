@@ -1,7 +1,8 @@
 import api from "./axios";
 
-export const getCustomers = async () => {
-  const response = await api.get("/customers/");
+// params: server-side filters, e.g. { is_active: true, search: "john" }
+export const getCustomers = async (params = {}) => {
+  const response = await api.get("/customers/", { params });
   return response.data.filter((customer) =>
     customer != null &&
     customer.user != null &&
@@ -35,3 +36,15 @@ export const toggleCustomerStatus = async (id) => {
   const response = await api.post(`/customers/${id}/toggle_status/`);
   return response.data;
 };
+
+// file: a .csv (header row) or .jsonl File; returns { rows, created, failed, errors: [{ line, errors }] }
+export const importCustomers = async (file, dryRun = false) => {
+  const form = new FormData();
+  form.append("file", file);
+  form.append("dry_run", dryRun);
+  // The instance defaults to JSON, which would turn the FormData into a JSON body
+  const response = await api.post("/customers/import/", form, {
+    headers: { "Content-Type": "multipart/form-data" },
+  });
+  return response.data;
+};
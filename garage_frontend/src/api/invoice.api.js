@@ -1,7 +1,13 @@
 import api from "./axios";
 
-export const getInvoices = async () => {
-    const response = await api.get("/invoices/");
+// params: server-side filters, e.g. { payment_status: "PAID", invoice_date_from: "2026-01-01" }
+export const getInvoices = async (params = {}) => {
+    const response = await api.get("/invoices/", { params });
+    return response.data;
+};
+
+export const getInvoiceStats = async () => {
+    const response = await api.get("/invoices/stats/");
     return response.data;
 };
 
@@ -43,3 +49,20 @@ export const downloadInvoicePDF = async (id) => {
     document.body.removeChild(link);
     window.URL.revokeObjectURL(url);
 };
+
+// Full invoice history as a CSV (or "jsonl") file, with the same filters as getInvoices
+export const exportInvoices = async (params = {}, export_format = "csv") => {
+    const response = await api.get("/invoices/export/", {
+        params: { ...params, export_format },
+        responseType: 'blob'
+    });
+
+    const url = window.URL.createObjectURL(response.data);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = `invoices.${export_format}`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    window.URL.revokeObjectURL(url);
+};
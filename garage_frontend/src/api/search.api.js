@@ -0,0 +1,8 @@
+import api from "./axios";
+
+// Admin quick search over customers (username, name, email, phone), vehicle
+// plates and booking ids ("#42"); returns [{ type, id, ... }]
+export const quickSearch = async (q, limit) => {
+    const response = await api.get("/search/", { params: { q, limit } });
+    return response.data;
+};
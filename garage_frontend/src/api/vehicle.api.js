@@ -1,7 +1,8 @@
 import api from "./axios";
 
-export const getVehicles = async () => {
-    const response = await api.get("/vehicles/");
+// params: server-side filters, e.g. { customer: 3, search: "ABC" }
+export const getVehicles = async (params = {}) => {
+    const response = await api.get("/vehicles/", { params });
     return response.data;
 };
 
@@ -19,3 +20,23 @@ export const deleteVehicle = async (id) => {
     const response = await api.delete(`/vehicles/${id}/`);
     return response.data;
 };
+
+// Plate prefix search ("ab-12" matches AB12...), exact match first
+export const lookupVehicles = async (plate) => {
+    const response = await api.get("/vehicles/lookup/", { params: { plate } });
+    return response.data;
+};
+
+// file: a .csv / .jsonl File with vehicle_number, vehicle_type and customer_id columns;
+// customerId applies to rows without one. Returns { rows, created, failed, errors: [{ line, errors }] }
+export const importVehicles = async (file, customerId = null, dryRun = false) => {
+    const form = new FormData();
+    form.append("file", file);
+    if (customerId != null) form.append("customer_id", customerId);
+    form.append("dry_run", dryRun);
+    // The instance defaults to JSON, which would turn the FormData into a JSON body
+    const response = await api.post("/vehicles/import/", form, {
+        headers: { "Content-Type": "multipart/form-data" },
+    });
+    return response.data;
+};
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { getBookings } from "../../api/booking.api";
+import { getBookingStats } from "../../api/booking.api";
 import { getServices } from "../../api/service.api";
 import { getCustomers } from "../../api/customer.api";
 import Card from "../../components/ui/Card";
@@ -33,26 +33,23 @@ const Dashboard = () => {
 
             try {
                 const results = await Promise.allSettled([
-                    getBookings(),
+                    getBookingStats(),
                     getServices(),
                     getCustomers(),
                 ]);
 
-                const bookings = results[0].status === 'fulfilled' ? results[0].value : [];
+                const bookingStats = results[0].status === 'fulfilled' ? results[0].value : { total: 0, by_status: {} };
                 const services = results[1].status === 'fulfilled' ? results[1].value : [];
                 const customers = results[2].status === 'fulfilled' ? results[2].value : [];
 
-                const pending = bookings.filter((b) => b.status === "PENDING").length;
-                const approved = bookings.filter((b) => b.status === "APPROVED").length;
-                const inProgress = bookings.filter((b) => b.status === "IN_PROGRESS").length;
-                const completed = bookings.filter((b) => b.status === "COMPLETED").length;
+                const byStatus = bookingStats.by_status;
 
                 setStats({
-                    pending,
-                    approved,
-                    inProgress,
-                    completed,
-                    totalBookings: bookings.length,
+                    pending: byStatus.PENDING || 0,
+                    approved: byStatus.APPROVED || 0,
+                    inProgress: byStatus.IN_PROGRESS || 0,
+                    completed: byStatus.COMPLETED || 0,
+                    totalBookings: bookingStats.total,
                     totalServices: services.length,
                     totalCustomers: customers.length,
                 });
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useLocation } from 'react-router-dom';
 import toast from 'react-hot-toast';
-import { getInvoices, updateInvoiceStatus, updateInvoiceCharges, downloadInvoicePDF } from '../../api/invoice.api';
+import { getInvoices, getInvoiceStats, updateInvoiceStatus, updateInvoiceCharges, downloadInvoicePDF } from '../../api/invoice.api';
 import Card from '../../components/ui/Card';
 import Modal from '../../components/ui/Modal';
 import Button from '../../components/ui/Button';
@@ -21,6 +21,7 @@ import styles from './Invoices.module.css';
 const Invoices = () => {
     const location = useLocation();
     const [invoices, setInvoices] = useState([]);
+    const [totalRevenue, setTotalRevenue] = useState(0);
     const [selectedInvoice, setSelectedInvoice] = useState(null);
     const [showModal, setShowModal] = useState(false);
     const [editingId, setEditingId] = useState(null);
@@ -69,8 +70,9 @@ const Invoices = () => {
     const fetchInvoices = async () => {
         try {
             setLoading(true);
-            const data = await getInvoices();
+            const [data, stats] = await Promise.all([getInvoices(), getInvoiceStats()]);
             setInvoices(data);
+            setTotalRevenue(parseFloat(stats.total_amount));
         } catch (error) {
             toast.error("Failed to load invoices");
         } finally {
@@ -155,7 +157,7 @@ const Invoices = () => {
                 <div className={styles.stats}>
                     <div className={styles.statItem}>
                         <span className={styles.statLabel}>Total Revenue</span>
-                        <span className={styles.statValue}>Rs. {invoices.reduce((acc, inv) => acc + parseFloat(inv.total_amount || 0), 0).toLocaleString()}</span>
+                        <span className={styles.statValue}>Rs. {totalRevenue.toLocaleString()}</span>
                     </div>
                 </div>
             </header>